@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # "agroapp.apps.AgroappConfig",
     "crispy_forms",
     "crispy_bootstrap5",
@@ -108,6 +109,18 @@ DATABASES = {
 }
 
 
+# Cache
+# Must be shared by every web and Celery process: view counting, the email
+# and inventory queues, idempotency keys, search cache versions and the
+# suggestion index all hand state between processes through it. Django's
+# default LocMemCache is per-process and silently breaks all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -138,7 +151,7 @@ REST_FRAMEWORK = {
     #     'rest_framework.authentication.SessionAuthentication',
     #     'rest_framework.authentication.TokenAuthentication',
     # ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'marketplace.pagination.EstimatedCountPagination',
     'PAGE_SIZE': 10,
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -156,6 +169,191 @@ REST_FRAMEWORK = {
 
 }
 
+# Paginated list endpoints report a planner estimate instead of COUNT(*)
+# once a result set is at least this large; totals are cached per filter
+# signature for MARKETPLACE_COUNT_CACHE_TTL seconds.
+MARKETPLACE_COUNT_ESTIMATE_THRESHOLD = int(os.getenv('MARKETPLACE_COUNT_ESTIMATE_THRESHOLD', '10000'))
+MARKETPLACE_COUNT_CACHE_TTL = int(os.getenv('MARKETPLACE_COUNT_CACHE_TTL', '30'))
+
+# /marketplace/search/?facets=category,price: price bucket width and how long
+# facet counts are cached per normalized query (seconds).
+MARKETPLACE_PRICE_FACET_WIDTH = int(os.getenv('MARKETPLACE_PRICE_FACET_WIDTH', '100'))
+MARKETPLACE_FACET_CACHE_TTL = int(os.getenv('MARKETPLACE_FACET_CACHE_TTL', '60'))
+
+# Search result pages are cached (IDs + totals) for this many seconds; any
+# Product/Category write moves the cache to a new version namespace.
+MARKETPLACE_SEARCH_CACHE_TTL = int(os.getenv('MARKETPLACE_SEARCH_CACHE_TTL', '120'))
+
+# Product.search backend. Use 'marketplace.search_backends.bm25.BM25SearchBackend'
+# on SQLite/edge deployments for an in-process, memory-mapped BM25 index.
+MARKETPLACE_SEARCH_BACKEND = os.getenv(
+    'MARKETPLACE_SEARCH_BACKEND', 'marketplace.search_backends.postgres.PostgresSearchBackend'
+)
+MARKETPLACE_BM25_INDEX_PATH = os.getenv('MARKETPLACE_BM25_INDEX_PATH', os.path.join(BASE_DIR, 'search_index.bm25'))
+# BM25 returns every match; only the best MAX_RESULTS are ordered by relevance,
+# the rest follow by popularity and recency.
+MARKETPLACE_BM25_MAX_RESULTS = 500
+MARKETPLACE_BM25_FLUSH_EVERY = 200
+
+# Popularity ranking: how much popularity_score (0..1) is added to search
+# relevance, the relative weight of each signal, and the order look-back.
+MARKETPLACE_POPULARITY_WEIGHT = float(os.getenv('MARKETPLACE_POPULARITY_WEIGHT', '0.1'))
+MARKETPLACE_POPULARITY_SIGNALS = {'views': 1.0, 'orders': 2.0, 'reviews': 1.0}
+MARKETPLACE_POPULARITY_ORDER_WINDOW_DAYS = 30
+
+# Autocomplete (/marketplace/search/suggest/): max suggestions per request and
+# how often each process checks the shared cache for a newer index (seconds).
+MARKETPLACE_SUGGEST_MAX_RESULTS = 20
+MARKETPLACE_SUGGEST_SYNC_INTERVAL = int(os.getenv('MARKETPLACE_SUGGEST_SYNC_INTERVAL', '5'))
+
+# Product detail views are buffered in the cache and written in batches.
+# The interval (seconds) bounds how stale Product.views can be; lag is visible
+# at /marketplace/product-views/stats/.
+MARKETPLACE_VIEW_FLUSH_INTERVAL = int(os.getenv('MARKETPLACE_VIEW_FLUSH_INTERVAL', '30'))
+MARKETPLACE_VIEW_FLUSH_BATCH = 5000
+
+# Raw ProductView rows are rolled up into ProductViewDaily and deleted after
+# the retention window; analytics should query the rollup.
+MARKETPLACE_VIEW_RETENTION_DAYS = int(os.getenv('MARKETPLACE_VIEW_RETENTION_DAYS', '90'))
+MARKETPLACE_VIEW_ROLLUP_BATCH = 50000
+MARKETPLACE_VIEW_PRUNE_BATCH = 10000
+
+# Trending products (/marketplace/products/trending/): views and orders decay
+# with this half-life; orders count as several views. Top K kept per category.
+MARKETPLACE_TRENDING_TOP_K = 20
+MARKETPLACE_TRENDING_HALF_LIFE_HOURS = float(os.getenv('MARKETPLACE_TRENDING_HALF_LIFE_HOURS', '24'))
+MARKETPLACE_TRENDING_WINDOW_DAYS = 7
+MARKETPLACE_TRENDING_ORDER_WEIGHT = 5.0
+
+# Maximum lines in one /marketplace/orders/checkout/ request
+MARKETPLACE_CHECKOUT_MAX_ITEMS = 50
+
+# Maximum orders in one /marketplace/orders/bulk-status/ request
+MARKETPLACE_BULK_STATUS_MAX_ORDERS = 200
+
+# Pending orders hold their stock for this long before the reaper cancels
+# them; the reaper expires at most this many orders per transaction.
+MARKETPLACE_RESERVATION_MINUTES = int(os.getenv('MARKETPLACE_RESERVATION_MINUTES', str(48 * 60)))
+MARKETPLACE_RESERVATION_REAPER_BATCH = 1000
+
+# Order side effects (notifications, emails) are written to an outbox in the
+# order's transaction and dispatched in batches every few seconds.
+MARKETPLACE_OUTBOX_DISPATCH_INTERVAL = float(os.getenv('MARKETPLACE_OUTBOX_DISPATCH_INTERVAL', '5'))
+MARKETPLACE_OUTBOX_BATCH = 500
+MARKETPLACE_OUTBOX_RETENTION_DAYS = 7
+
+# Sharded products (manage.py shard_stock) have their shards folded back
+# together and re-split this often (seconds).
+MARKETPLACE_STOCK_COMPACT_INTERVAL = float(os.getenv('MARKETPLACE_STOCK_COMPACT_INTERVAL', '30'))
+
+# Stock adjustments queued outside the order path (update_inventory_after_purchase)
+# are coalesced per product and applied this often (seconds), at most this
+# many per transaction.
+MARKETPLACE_INVENTORY_FLUSH_INTERVAL = float(os.getenv('MARKETPLACE_INVENTORY_FLUSH_INTERVAL', '5'))
+MARKETPLACE_INVENTORY_BATCH = 1000
+
+# Cached per-user unread notification counts are adjusted in place on every
+# write; the TTL (seconds) bounds drift from any missed adjustment.
+MARKETPLACE_UNREAD_COUNT_TTL = 60 * 60
+
+# Server-sent events at /marketplace/events/ (serve agrodemo.asgi with an ASGI
+# server such as uvicorn). Heartbeat and max age are in seconds; a client more
+# than MARKETPLACE_SSE_QUEUE_SIZE events behind is told to resync instead.
+# Events go through Redis pub/sub so streams get them from any process (use
+# marketplace.events.LocalBroker for a single-process setup without Redis).
+MARKETPLACE_EVENT_BROKER = os.getenv('MARKETPLACE_EVENT_BROKER', 'marketplace.events.RedisBroker')
+MARKETPLACE_EVENT_REDIS_URL = os.getenv('MARKETPLACE_EVENT_REDIS_URL', CACHES['default']['LOCATION'])
+MARKETPLACE_SSE_HEARTBEAT = 15
+MARKETPLACE_SSE_MAX_AGE = 10 * 60
+MARKETPLACE_SSE_QUEUE_SIZE = 100
+MARKETPLACE_SSE_MAX_CONNECTIONS = int(os.getenv('MARKETPLACE_SSE_MAX_CONNECTIONS', '10000'))
+MARKETPLACE_SSE_MAX_PER_USER = 5
+
+# Order emails are sent from their outbox rows every
+# MARKETPLACE_EMAIL_DISPATCH_INTERVAL seconds over one SMTP connection, in
+# chunks of MARKETPLACE_EMAIL_BATCH that are each committed once sent. A
+# message is given up after MARKETPLACE_EMAIL_MAX_ATTEMPTS failures. With
+# MARKETPLACE_EMAIL_DIGEST on, confirmations/cancellations/status changes are
+# also emailed, rolled into one digest per user every
+# MARKETPLACE_EMAIL_DIGEST_INTERVAL seconds.
+MARKETPLACE_EMAIL_DISPATCH_INTERVAL = float(os.getenv('MARKETPLACE_EMAIL_DISPATCH_INTERVAL', '10'))
+MARKETPLACE_EMAIL_BATCH = 100
+MARKETPLACE_EMAIL_MAX_PER_RUN = 1000
+MARKETPLACE_EMAIL_MAX_ATTEMPTS = 5
+MARKETPLACE_EMAIL_DIGEST = os.getenv('MARKETPLACE_EMAIL_DIGEST', 'false').lower() in ('1', 'true')
+MARKETPLACE_EMAIL_DIGEST_INTERVAL = float(os.getenv('MARKETPLACE_EMAIL_DIGEST_INTERVAL', str(60 * 60)))
+
+# How long order create/checkout/confirm/cancel responses are kept for
+# replay to clients retrying with the same Idempotency-Key (seconds).
+MARKETPLACE_IDEMPOTENCY_TTL = int(os.getenv('MARKETPLACE_IDEMPOTENCY_TTL', str(24 * 60 * 60)))
+# Rejected (4xx) responses are replayed only briefly, so a retry with the
+# same key can succeed once the cause (e.g. missing stock) is resolved.
+MARKETPLACE_IDEMPOTENCY_ERROR_TTL = int(os.getenv('MARKETPLACE_IDEMPOTENCY_ERROR_TTL', '60'))
+
+# Celery
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TIMEZONE = "UTC"
+
+# Periodic tasks (celery beat); schedules are in seconds.
+CELERY_BEAT_SCHEDULE = {
+    'refresh-suggestion-index': {
+        'task': 'marketplace.tasks.refresh_suggestion_index',
+        'schedule': 60.0,
+    },
+    'rebuild-suggestion-index': {
+        'task': 'marketplace.tasks.rebuild_suggestion_index',
+        'schedule': 60.0 * 60,
+    },
+    'refresh-popularity-scores': {
+        'task': 'marketplace.tasks.refresh_popularity_scores',
+        'schedule': 15.0 * 60,
+    },
+    'flush-product-views': {
+        'task': 'marketplace.tasks.flush_product_views',
+        'schedule': float(MARKETPLACE_VIEW_FLUSH_INTERVAL),
+    },
+    'rollup-product-views': {
+        'task': 'marketplace.tasks.rollup_product_views',
+        'schedule': 5.0 * 60,
+    },
+    'prune-product-views': {
+        'task': 'marketplace.tasks.prune_product_views',
+        'schedule': 60.0 * 60,
+    },
+    'refresh-trending-products': {
+        'task': 'marketplace.tasks.refresh_trending_products',
+        'schedule': 10.0 * 60,
+    },
+    'release-expired-reservations': {
+        'task': 'marketplace.tasks.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    'dispatch-outbox': {
+        'task': 'marketplace.tasks.dispatch_outbox',
+        'schedule': MARKETPLACE_OUTBOX_DISPATCH_INTERVAL,
+    },
+    'prune-outbox': {
+        'task': 'marketplace.tasks.prune_outbox',
+        'schedule': 60.0 * 60,
+    },
+    'apply-inventory-adjustments': {
+        'task': 'marketplace.tasks.apply_inventory_adjustments',
+        'schedule': MARKETPLACE_INVENTORY_FLUSH_INTERVAL,
+    },
+    'send-order-emails': {
+        'task': 'marketplace.tasks.send_order_emails',
+        'schedule': MARKETPLACE_EMAIL_DISPATCH_INTERVAL,
+    },
+    'send-order-email-digests': {
+        'task': 'marketplace.tasks.send_order_email_digests',
+        'schedule': MARKETPLACE_EMAIL_DIGEST_INTERVAL,
+    },
+    'compact-stock-shards': {
+        'task': 'marketplace.tasks.compact_stock_shards',
+        'schedule': MARKETPLACE_STOCK_COMPACT_INTERVAL,
+    },
+}
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173"
@@ -187,6 +385,7 @@ CORS_ALLOW_HEADERS = [
     "user-agent",
     "x-csrftoken",
     "x-requested-with",
+    "idempotency-key",
 ]
 
 # Internationalization
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category,Product,ProductImage, Order, ProductView, Notification,Review
+from .models import Category,Product,ProductImage, Order, ProductView, Notification,Review, ProductViewDaily, StockMovement
 # Register your models here.
 
 admin.site.register(Category)
@@ -7,5 +7,7 @@ admin.site.register(Product)
 admin.site.register(ProductImage)
 admin.site.register(Order)
 admin.site.register(ProductView)
+admin.site.register(ProductViewDaily)
 admin.site.register(Review)
-admin.site.register(Notification)
\ No newline at end of file
+admin.site.register(Notification)
+admin.site.register(StockMovement)
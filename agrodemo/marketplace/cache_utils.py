@@ -0,0 +1,97 @@
+import time
+
+from django.core.cache import cache
+
+
+def incr(key, delta=1):
+    """Atomic cache.incr() that creates the key when it is missing or evicted."""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # add() keeps a value written by a concurrent caller.
+        if not cache.add(key, delta, None):
+            return cache.incr(key, delta)
+        return delta
+
+
+class CacheQueue:
+    """
+    FIFO queue in the shared cache for single-consumer batch jobs.
+
+    Producers claim a sequence number with an atomic increment and store the
+    item under its own key, so pushes never contend on one value. The
+    consumer (a periodic task) drains everything between its head and the
+    current tail with one get_many/delete_many.
+    """
+
+    # A missing slot may be a push that has claimed its sequence number but
+    # not written the item yet. Once its number is at least this many
+    # seconds old the producer has crashed (or the item was evicted), and the
+    # slot is skipped.
+    IN_FLIGHT_TIMEOUT = 30
+
+    def __init__(self, name, item_timeout=24 * 60 * 60):
+        self.name = name
+        self.item_timeout = item_timeout
+        self.head_key = f"{name}_head"
+        self.tail_key = f"{name}_tail"
+        self.settled_key = f"{name}_settled"
+
+    def _item_key(self, seq):
+        return f"{self.name}_{seq}"
+
+    def push(self, item):
+        seq = incr(self.tail_key)
+        cache.set(self._item_key(seq), item, self.item_timeout)
+        return seq
+
+    def __len__(self):
+        return max(0, (cache.get(self.tail_key) or 0) - (cache.get(self.head_key) or 0))
+
+    def drain(self, limit=None):
+        head = cache.get(self.head_key) or 0
+        tail = cache.get(self.tail_key) or 0
+        if limit is not None:
+            tail = min(tail, head + limit)
+        if tail <= head:
+            return []
+
+        seqs = range(head + 1, tail + 1)
+        keys = [self._item_key(seq) for seq in seqs]
+        found = cache.get_many(keys)
+
+        settled = self._settled_tail()
+        items = []
+        new_head = head
+        for seq, key in zip(seqs, keys):
+            if key not in found:
+                if seq > settled:
+                    # Producer may have incremented the tail but not written
+                    # yet; stop here and pick it up on the next drain.
+                    break
+                # Lost or evicted; skip it rather than stall the queue.
+            else:
+                items.append(found[key])
+            new_head = seq
+
+        cache.delete_many(keys[:new_head - head])
+        cache.set(self.head_key, new_head, None)
+        return items
+
+    def _settled_tail(self):
+        """
+        Highest sequence number claimed at least IN_FLIGHT_TIMEOUT seconds ago.
+
+        Every IN_FLIGHT_TIMEOUT seconds the consumer checkpoints the current
+        tail; the previous checkpoint is then old enough to be settled.
+        """
+        now = time.time()
+        checkpoint = cache.get(self.settled_key)
+        if checkpoint is None or now - checkpoint["at"] >= self.IN_FLIGHT_TIMEOUT:
+            checkpoint = {
+                "tail": cache.get(self.tail_key) or 0,
+                "at": now,
+                "settled": checkpoint["tail"] if checkpoint else 0,
+            }
+            cache.set(self.settled_key, checkpoint, None)
+        return checkpoint["settled"]
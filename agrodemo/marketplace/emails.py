@@ -0,0 +1,223 @@
+"""
+Batched order emails.
+
+Emails are sent from the outbox rows that carry them (OutboxEvent.email_status),
+so they are as durable as the order change itself. send_pending() runs every
+few seconds and works through the events with an unsent confirmation email
+in chunks of MARKETPLACE_EMAIL_BATCH, all over a single SMTP connection.
+Each chunk is claimed, sent message by message and has its outcome recorded
+in one transaction, so emails already delivered are not sent again when a
+later chunk fails (at-least-once only if the commit itself fails).
+
+A message that is refused stays pending and is retried on later runs; after
+MARKETPLACE_EMAIL_MAX_ATTEMPTS failures its events are marked failed and
+leave the queue, so one bad address can't hold up the others.
+
+Low-priority order updates can optionally be rolled into one digest per user
+(MARKETPLACE_EMAIL_DIGEST), sent by send_digests() on a slower schedule.
+
+Sending goes through get_connection(), so tests and local runs can use the
+locmem backend or an SMTP sink (EMAIL_BACKEND / EMAIL_HOST / EMAIL_PORT).
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+
+from . import outbox
+from .models import Order, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def order_confirmation(order):
+    return EmailMessage(
+        subject=f"Your Order #{order.id} Confirmation",
+        body=f"Thank you for your order! Here are the details:\n\n{order}",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[order.buyer.email],
+    )
+
+
+def send_messages(messages, connection=None):
+    """
+    Send messages over one connection, in chunks of MARKETPLACE_EMAIL_BATCH.
+
+    Returns the number sent. The connection stays open across chunks and is
+    closed once at the end. Raises if any chunk fails.
+    """
+    if not messages:
+        return 0
+    chunk = getattr(settings, "MARKETPLACE_EMAIL_BATCH", 100)
+    sent = 0
+    connection = connection or get_connection(fail_silently=False)
+    with connection:
+        for start in range(0, len(messages), chunk):
+            sent += connection.send_messages(messages[start:start + chunk]) or 0
+    return sent
+
+
+def send_orders(order_ids):
+    """Send confirmation emails for order_ids over a single connection."""
+    orders = Order.objects.select_related("buyer").filter(pk__in=order_ids).order_by("pk")
+    messages = [order_confirmation(order) for order in orders if order.buyer.email]
+    return send_messages(messages)
+
+
+def _claim(status, limit, after_id):
+    # SKIP LOCKED so overlapping runs split the work instead of double-sending
+    return list(
+        OutboxEvent.objects.select_for_update(skip_locked=True)
+        .filter(email_status=status, id__gt=after_id)
+        .order_by("id")[:limit]
+    )
+
+
+def _deliver(connection, batches):
+    """
+    Send each (events, message) pair on its own and record every outcome on
+    its events: sent, retried later, or failed after too many attempts. A
+    None message means there is nothing to send and counts as sent.
+
+    Returns (messages sent, error). error is set when the connection could
+    not be reopened after a failure; the outcomes so far are still recorded
+    and the rest of the batch is left for the next run.
+    """
+    max_attempts = getattr(settings, "MARKETPLACE_EMAIL_MAX_ATTEMPTS", 5)
+    sent_ids, retry_ids, failed_ids = [], [], []
+    sent = 0
+    error = None
+    for events, message in batches:
+        if message is None:
+            sent_ids.extend(event.pk for event in events)
+            continue
+        try:
+            connection.send_messages([message])
+        except Exception as e:
+            logger.warning(f"Email to {', '.join(message.to)} failed: {e}")
+            for event in events:
+                if event.email_attempts + 1 >= max_attempts:
+                    failed_ids.append(event.pk)
+                else:
+                    retry_ids.append(event.pk)
+            try:
+                # The failure may have dropped the connection
+                connection.close()
+                connection.open()
+            except Exception as e:
+                error = e
+                break
+            continue
+        sent += 1
+        sent_ids.extend(event.pk for event in events)
+
+    OutboxEvent.objects.filter(id__in=sent_ids).update(email_status=OutboxEvent.EMAIL_SENT)
+    OutboxEvent.objects.filter(id__in=retry_ids).update(email_attempts=F("email_attempts") + 1)
+    OutboxEvent.objects.filter(id__in=failed_ids).update(
+        email_status=OutboxEvent.EMAIL_FAILED, email_attempts=F("email_attempts") + 1
+    )
+    if failed_ids:
+        logger.error(f"Gave up emailing for outbox events {failed_ids}")
+    return sent, error
+
+
+def _run(status, limit, build):
+    """
+    Claim events with status in chunks, build (events, message) pairs with
+    build(events) and deliver them, one transaction per chunk. Returns
+    (messages sent, events claimed).
+    """
+    chunk = min(getattr(settings, "MARKETPLACE_EMAIL_BATCH", 100), limit)
+    sent = claimed = last_id = 0
+    connection = get_connection(fail_silently=False)
+    with connection:
+        while claimed < limit:
+            with transaction.atomic():
+                events = _claim(status, min(chunk, limit - claimed), last_id)
+                if not events:
+                    break
+                chunk_sent, error = _deliver(connection, build(events))
+            sent += chunk_sent
+            claimed += len(events)
+            last_id = events[-1].pk
+            if error is not None:
+                raise error
+            if len(events) < chunk:
+                break
+    return sent, claimed
+
+
+def _confirmations(events):
+    orders = Order.objects.select_related("buyer").in_bulk(
+        [event.payload["order_id"] for event in events]
+    )
+    batches = []
+    for event in events:
+        order = orders.get(event.payload["order_id"])
+        message = order_confirmation(order) if order and order.buyer.email else None
+        batches.append(([event], message))
+    return batches
+
+
+def _digests(events):
+    updates = {}
+    for event in events:
+        user_id, message = outbox.format_message(event)
+        updates.setdefault(user_id, []).append((event, message))
+    emails = dict(
+        User.objects.filter(id__in=list(updates)).values_list("id", "email")
+    )
+    batches = []
+    for user_id, entries in sorted(updates.items()):
+        message = None
+        if emails.get(user_id):
+            message = EmailMessage(
+                subject=f"Your order updates ({len(entries)})",
+                body="Here is what changed since your last update:\n\n"
+                     + "\n".join(f"- {line}" for _, line in entries),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[emails[user_id]],
+            )
+        batches.append(([event for event, _ in entries], message))
+    return batches
+
+
+def send_pending(limit=None):
+    """
+    Send pending confirmation emails, at most limit per run.
+
+    Returns the number of emails sent.
+    """
+    limit = limit or getattr(settings, "MARKETPLACE_EMAIL_MAX_PER_RUN", 1000)
+    started = time.monotonic()
+    sent, claimed = _run(OutboxEvent.EMAIL_PENDING, limit, _confirmations)
+    if claimed:
+        logger.info(
+            f"Sent {sent} order emails for {claimed} events in "
+            f"{time.monotonic() - started:.2f}s"
+        )
+    return sent
+
+
+def send_digests(limit=None):
+    """
+    Send each user with pending low-priority updates one digest email.
+
+    Updates are claimed in chunks, so a user with updates in several chunks
+    gets one digest per chunk. Returns the number of digests sent.
+    """
+    limit = limit or getattr(settings, "MARKETPLACE_EMAIL_MAX_PER_RUN", 1000) * 10
+    started = time.monotonic()
+    sent, claimed = _run(OutboxEvent.EMAIL_DIGEST, limit, _digests)
+    if claimed:
+        logger.info(
+            f"Sent {sent} digests covering {claimed} order updates in "
+            f"{time.monotonic() - started:.2f}s"
+        )
+    return sent
@@ -0,0 +1,194 @@
+"""
+Pub/sub feeding the server-sent events stream (stream.py).
+
+Each open stream subscribes a bounded asyncio queue for its user, and
+deliver() hands messages to each subscriber's event loop from any thread.
+RedisBroker (the default) publishes through Redis pub/sub, so events
+published by Celery workers (notifications, the reservation reaper) reach
+streams in every ASGI process. LocalBroker delivers in-process only, for
+single-process development.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = "marketplace.events.RedisBroker"
+
+# Sent instead of the queued messages when a client falls too far behind;
+# it should refetch its notifications and orders over the REST API.
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+def format_event(event, data):
+    """Encode one SSE message."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+class Subscription:
+    """One stream's queue. Only touched from its own event loop."""
+
+    def __init__(self, user_id, loop, queue):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = queue
+        self.dropped = 0
+
+    def offer(self, message):
+        # Backpressure: a client that can't keep up gets one resync marker
+        # rather than an unbounded backlog held in this process.
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """Delivers events to subscribers in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, user_id, loop, queue):
+        subscription = Subscription(user_id, loop, queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+            self._count -= 1
+
+    def subscriber_count(self, user_id):
+        with self._lock:
+            return len(self._subscribers.get(user_id, ()))
+
+    def publish(self, user_ids, event, data):
+        """Send one event to every open stream of each user in user_ids."""
+        self.deliver(user_ids, event, data)
+
+    def deliver(self, user_ids, event, data):
+        """Hand one event to this process's streams for user_ids."""
+        with self._lock:
+            targets = [
+                subscription
+                for user_id in set(user_ids)
+                for subscription in self._subscribers.get(user_id, ())
+            ]
+        if not targets:
+            return
+        message = format_event(event, data)
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # Loop already closed; its stream is going away.
+                self.unsubscribe(subscription)
+
+    def resync_all(self):
+        """Tell every local stream it may have missed events."""
+        with self._lock:
+            targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, RESYNC)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Publishes to a Redis channel; every process with open streams runs one
+    listener thread that delivers the channel's events to its own streams.
+    """
+
+    CHANNEL = "marketplace_events"
+
+    def __init__(self):
+        super().__init__()
+        import redis
+        url = getattr(settings, "MARKETPLACE_EVENT_REDIS_URL", "redis://localhost:6379/1")
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, user_id, loop, queue):
+        self._ensure_listener()
+        return super().subscribe(user_id, loop, queue)
+
+    def publish(self, user_ids, event, data):
+        message = {"u": sorted(set(user_ids)), "e": event, "d": data}
+        self._redis.publish(self.CHANNEL, json.dumps(message, separators=(",", ":"), default=str))
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="marketplace-events", daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        connected_before = False
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.CHANNEL)
+                if connected_before:
+                    # Events published while disconnected are gone
+                    self.resync_all()
+                connected_before = True
+                for message in pubsub.listen():
+                    payload = json.loads(message["data"])
+                    self.deliver(payload["u"], payload["e"], payload["d"])
+            except Exception as e:
+                logger.error(f"Event listener lost its Redis connection: {e}")
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the broker configured by MARKETPLACE_EVENT_BROKER (one per process)."""
+    global _broker
+    if _broker is None:
+        path = getattr(settings, "MARKETPLACE_EVENT_BROKER", DEFAULT_BROKER)
+        _broker = import_string(path)()
+    return _broker
+
+
+def publish_on_commit(user_ids, event, data):
+    """Publish once the current transaction commits, so streams never see rolled-back rows."""
+    def publish():
+        try:
+            get_broker().publish(user_ids, event, data)
+        except Exception as e:
+            logger.error(f"Error publishing {event} event: {e}")
+    transaction.on_commit(publish)
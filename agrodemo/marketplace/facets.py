@@ -0,0 +1,90 @@
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Value
+from django.db.models.functions import Floor
+
+from .models import Product
+from .search_cache import get_version, normalize_query
+
+SUPPORTED_FACETS = ("category", "price")
+
+
+def parse_facets(raw):
+    """Turn ``"category,price"`` into a tuple of facet names; raises ValueError."""
+    facets = tuple(sorted({name.strip() for name in raw.split(",") if name.strip()}))
+    unknown = [name for name in facets if name not in SUPPORTED_FACETS]
+    if unknown:
+        raise ValueError(f"Unsupported facet(s): {', '.join(unknown)}")
+    return facets
+
+
+def facet_cache_key(query, filters, facets):
+    signature = "|".join([
+        normalize_query(query),
+        str(filters.get("category", "")),
+        str(filters.get("min_price", "")),
+        str(filters.get("max_price", "")),
+        ",".join(facets),
+    ])
+    digest = hashlib.sha1(signature.encode()).hexdigest()
+    return f"search_facets_{get_version()}_{digest}"
+
+
+def compute_facets(queryset, facets):
+    """
+    Category counts and fixed-width price buckets for a search queryset.
+
+    Both facets come from a single GROUP BY (category, price bucket) query
+    over the matched products; each facet is then a sum over the other
+    dimension, so the number of queries doesn't grow with the number of
+    categories or buckets.
+    """
+    width = Decimal(str(getattr(settings, "MARKETPLACE_PRICE_FACET_WIDTH", 100)))
+    bucket = Floor(F("price") / Value(width, output_field=DecimalField()))
+
+    rows = (
+        Product.objects.filter(pk__in=queryset.order_by().values("pk"))
+        .annotate(bucket=bucket)
+        .values("category_id", "category__slug", "category__name", "bucket")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+    categories = {}
+    prices = {}
+    for row in rows:
+        entry = categories.setdefault(row["category_id"], {
+            "id": row["category_id"],
+            "slug": row["category__slug"],
+            "name": row["category__name"],
+            "count": 0,
+        })
+        entry["count"] += row["count"]
+        index = int(row["bucket"])
+        prices[index] = prices.get(index, 0) + row["count"]
+
+    result = {}
+    if "category" in facets:
+        result["category"] = sorted(
+            categories.values(), key=lambda c: (-c["count"], c["name"])
+        )
+    if "price" in facets:
+        result["price"] = [
+            {"min": index * width, "max": (index + 1) * width, "count": prices[index]}
+            for index in sorted(prices)
+        ]
+    return result
+
+
+def get_facets(query, filters, facets):
+    """Cached compute_facets() for the same filtered set Product.search uses."""
+    cache_key = facet_cache_key(query, filters, facets)
+    result = cache.get(cache_key)
+    if result is None:
+        result = compute_facets(Product.search(query, filters), facets)
+        ttl = getattr(settings, "MARKETPLACE_FACET_CACHE_TTL", 60)
+        cache.set(cache_key, result, ttl)
+    return result
@@ -0,0 +1,107 @@
+import functools
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# How long a claimed key blocks a concurrent retry before the request is
+# assumed dead and the key can be claimed again.
+IN_PROGRESS_TIMEOUT = 60
+
+
+def _cache_key(request, view_method, kwargs, key):
+    # Scoped per user and per action/object, so keys never collide across
+    # users or between e.g. confirm and cancel of the same order.
+    scope = f"{request.user.pk}:{view_method.__name__}:{kwargs.get('pk', '')}:{key}"
+    return "idempotency_" + hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(view_method):
+    """
+    Make a viewset action safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs normally. A successful response is
+    stored for MARKETPLACE_IDEMPOTENCY_TTL seconds, a 4xx only for
+    MARKETPLACE_IDEMPOTENCY_ERROR_TTL seconds, since it may succeed once
+    e.g. stock is back, and a 5xx not at all. A retry
+    with the same key gets the stored response back from the cache without
+    running the action. Reusing a key with a different body is rejected, as
+    is a retry that arrives while the first request is still running.
+    Requests without the header are unaffected.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cache_key = _cache_key(request, view_method, kwargs, key)
+        fingerprint = _fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is None and cache.add(
+            cache_key, {"fingerprint": fingerprint, "in_progress": True}, IN_PROGRESS_TIMEOUT
+        ):
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+
+            if response.status_code >= 500:
+                # Let the client retry a server error for real
+                cache.delete(cache_key)
+                return response
+
+            if response.status_code >= 400:
+                ttl = getattr(settings, "MARKETPLACE_IDEMPOTENCY_ERROR_TTL", 60)
+            else:
+                ttl = getattr(settings, "MARKETPLACE_IDEMPOTENCY_TTL", 24 * 60 * 60)
+            cache.set(cache_key, {
+                "fingerprint": fingerprint,
+                "status": response.status_code,
+                "data": response.data,
+            }, ttl)
+            return response
+
+        if stored is None:
+            # Lost the add() race to a concurrent request with the same key
+            stored = cache.get(cache_key) or {"fingerprint": fingerprint, "in_progress": True}
+
+        if stored["fingerprint"] != fingerprint:
+            return Response(
+                {"error": f"{HEADER} was already used with a different request body"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if stored.get("in_progress"):
+            return Response(
+                {"error": "A request with this Idempotency-Key is still being processed"},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        logger.info(f"Replaying stored response for {view_method.__name__} ({HEADER} {key})")
+        response = Response(stored["data"], status=stored["status"])
+        response[REPLAY_HEADER] = "true"
+        return response
+
+    return wrapper
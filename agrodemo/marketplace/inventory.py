@@ -0,0 +1,344 @@
+"""
+Sharded stock for hot listings.
+
+A sharded product's stock is split across StockShard rows; Product.stock
+keeps whatever isn't allocated to a shard. Orders take stock from a random
+shard that isn't locked by another transaction, so concurrent buyers write
+different rows. Available stock is always exactly Product.stock plus the
+shards. compact() periodically folds the shards back into Product.stock,
+re-splits it evenly and refreshes is_available.
+
+Every change is also appended to StockMovement.
+
+Stock adjustments that don't belong to an order (queue_adjustment) are
+buffered in the cache and applied in coalesced batches by
+apply_adjustments().
+
+Lock order is always the Product row before its shards, with shards in
+shard order, so none of these paths can deadlock against each other.
+"""
+import logging
+import time
+from decimal import Decimal, ROUND_DOWN
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .cache_utils import CacheQueue
+from .models import Product, StockMovement, StockShard
+
+logger = logging.getLogger(__name__)
+
+# Takes stock from one random shard with enough of it, skipping shards other
+# transactions hold, in a single statement.
+RESERVE_SHARD_SQL = """
+    UPDATE marketplace_stockshard
+    SET stock = stock - %s
+    WHERE stock >= %s
+      AND id = (
+          SELECT id FROM marketplace_stockshard
+          WHERE product_id = %s AND stock >= %s
+          ORDER BY random()
+          LIMIT 1
+          {lock}
+      )
+    RETURNING shard, stock
+"""
+
+RELEASE_SHARD_SQL = """
+    UPDATE marketplace_stockshard
+    SET stock = stock + %s
+    WHERE id = (
+        SELECT id FROM marketplace_stockshard
+        WHERE product_id = %s
+        ORDER BY random()
+        LIMIT 1
+        {lock}
+    )
+    RETURNING shard
+"""
+
+# Run after commit, in their own short transactions, so the shard paths never
+# lock the Product row while holding a shard.
+MARK_SOLD_OUT_SQL = """
+    UPDATE marketplace_product
+    SET is_available = FALSE
+    WHERE id = %s AND is_available AND stock <= 0
+      AND NOT EXISTS (
+          SELECT 1 FROM marketplace_stockshard WHERE product_id = %s AND stock > 0
+      )
+"""
+
+MARK_AVAILABLE_SQL = """
+    UPDATE marketplace_product SET is_available = TRUE
+    WHERE id = %s AND NOT is_available
+"""
+
+# Applies one coalesced batch of adjustments (one signed delta per product).
+# A sharded product's delta lands on Product.stock, which still keeps the
+# available total (Product.stock plus shards) exact.
+ADJUST_STOCK_BULK_SQL = """
+    WITH v(id, d) AS (VALUES {values})
+    UPDATE marketplace_product
+    SET stock = marketplace_product.stock + v.d,
+        is_available = (marketplace_product.stock + v.d) > 0 OR marketplace_product.stock_shards > 0
+    FROM v
+    WHERE marketplace_product.id = v.id
+    RETURNING marketplace_product.id
+"""
+
+# (product_id, signed delta) per adjustment, waiting to be applied.
+adjustments = CacheQueue("inventory_adjustments")
+
+ADJUST_LOCK_KEY = "inventory_adjustments_lock"
+
+CENT = Decimal("0.01")
+
+
+def _skip_locked():
+    return "FOR UPDATE SKIP LOCKED" if connection.vendor == "postgresql" else ""
+
+
+def _lock_shards(product_id):
+    """Lock a product's shards in shard order and return them."""
+    return list(
+        StockShard.objects.select_for_update().filter(product_id=product_id).order_by("shard")
+    )
+
+
+def reserve_from_shards(product_id, quantity, order_id=None):
+    """
+    Take quantity units from a product's shards.
+
+    Tries a single free shard first. If none can cover the order alone, locks
+    every shard and takes it from several. Returns the stock left in the
+    shards used, or None when the shards can't cover the order (or the
+    product isn't sharded).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RESERVE_SHARD_SQL.format(lock=_skip_locked()),
+                       [quantity, quantity, product_id, quantity])
+        row = cursor.fetchone()
+
+    if row is not None:
+        shard, remaining = row
+        StockMovement.objects.create(product_id=product_id, shard=shard, kind="reserve",
+                                     quantity=-Decimal(quantity), order_id=order_id)
+        if remaining <= 0:
+            transaction.on_commit(lambda: _mark_sold_out(product_id))
+        return remaining
+
+    # Slow path: every shard is busy or too small on its own
+    shards = _lock_shards(product_id)
+    if not shards or sum(shard.stock for shard in shards) < quantity:
+        return None
+
+    needed = Decimal(quantity)
+    used = []
+    for shard in sorted(shards, key=lambda s: s.stock, reverse=True):
+        if needed <= 0:
+            break
+        take = min(shard.stock, needed)
+        shard.stock -= take
+        needed -= take
+        used.append((shard, take))
+    StockShard.objects.bulk_update([shard for shard, _ in used], ["stock"])
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, shard=shard.shard, kind="reserve",
+                      quantity=-take, order_id=order_id)
+        for shard, take in used
+    ])
+    if not any(shard.stock > 0 for shard in shards):
+        transaction.on_commit(lambda: _mark_sold_out(product_id))
+    return sum(shard.stock for shard, _ in used)
+
+
+def release_to_shard(product_id, quantity, order_id=None):
+    """Return stock to a random free shard. Returns False if the product has none free."""
+    with connection.cursor() as cursor:
+        cursor.execute(RELEASE_SHARD_SQL.format(lock=_skip_locked()), [quantity, product_id])
+        row = cursor.fetchone()
+    if row is None:
+        return False
+    StockMovement.objects.create(product_id=product_id, shard=row[0], kind="release",
+                                 quantity=Decimal(quantity), order_id=order_id)
+    transaction.on_commit(lambda: _mark_available(product_id))
+    return True
+
+
+def available_stock(product_ids):
+    """Exact sellable stock per product: Product.stock plus any shards."""
+    totals = dict(Product.objects.filter(id__in=product_ids).values_list("id", "stock"))
+    for row in StockShard.objects.filter(product_id__in=product_ids).values(
+        "product_id"
+    ).annotate(total=Sum("stock")):
+        totals[row["product_id"]] += row["total"]
+    return totals
+
+
+def set_shards(product_id, count):
+    """
+    Split a product's stock across count shards (0 folds them back in).
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        shards = _lock_shards(product_id)
+        total = product.stock + sum(shard.stock for shard in shards)
+        StockShard.objects.filter(product_id=product_id).delete()
+
+        per_shard = (total / count).quantize(CENT, rounding=ROUND_DOWN) if count else Decimal(0)
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product_id, shard=index, stock=per_shard)
+            for index in range(count)
+        ])
+        Product.objects.filter(id=product_id).update(
+            stock=total - per_shard * count, stock_shards=count
+        )
+    logger.info(f"Product {product_id} stock ({total}) split across {count} shards")
+
+
+def set_total_stock(product_id, total):
+    """Set a sharded product's available stock (e.g. a seller edit) and re-split it."""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        shards = _lock_shards(product_id)
+        current = product.stock + sum(shard.stock for shard in shards)
+        if total != current:
+            StockMovement.objects.create(product_id=product_id, kind="restock",
+                                         quantity=Decimal(total) - current)
+        _respread(product, shards, Decimal(total))
+
+
+def compact(product_ids=None):
+    """
+    Fold every sharded product's shards into Product.stock and re-split evenly.
+
+    One short transaction per product. Refills drained shards, and sets
+    is_available from the exact total.
+    """
+    started = time.monotonic()
+    if product_ids is None:
+        product_ids = list(
+            Product.objects.filter(stock_shards__gt=0).values_list("id", flat=True)
+        )
+    for product_id in product_ids:
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(id=product_id)
+            shards = _lock_shards(product_id)
+            _respread(product, shards, product.stock + sum(shard.stock for shard in shards))
+
+    if product_ids:
+        logger.info(
+            f"Compacted stock shards for {len(product_ids)} products in "
+            f"{time.monotonic() - started:.2f}s"
+        )
+    return len(product_ids)
+
+
+def _respread(product, shards, total):
+    """Give each shard an equal share of total; the remainder stays on the Product row."""
+    per_shard = (total / len(shards)).quantize(CENT, rounding=ROUND_DOWN) if shards else Decimal(0)
+    for shard in shards:
+        shard.stock = per_shard
+    StockShard.objects.bulk_update(shards, ["stock"])
+
+    is_available = total > 0
+    Product.objects.filter(id=product.id).update(
+        stock=total - per_shard * len(shards), is_available=is_available
+    )
+    if is_available != product.is_available:
+        from .search_cache import bump_version
+        transaction.on_commit(bump_version)
+
+
+def queue_adjustment(product_id, delta):
+    """Buffer a signed stock change for product_id; no database writes."""
+    adjustments.push((product_id, str(delta)))
+
+
+def apply_adjustments(batch_size=None):
+    """
+    Apply buffered stock adjustments, batch_size at a time, until none are left.
+
+    Each batch is coalesced to one delta per product and applied in its own
+    transaction with a single UPDATE ... FROM (VALUES), bypassing
+    Product.save(). Only one run applies adjustments at a time. Returns the
+    number of adjustments applied.
+    """
+    batch_size = batch_size or getattr(settings, "MARKETPLACE_INVENTORY_BATCH", 1000)
+    if not cache.add(ADJUST_LOCK_KEY, True, 300):
+        logger.info("Inventory adjustments already being applied")
+        return 0
+
+    applied = 0
+    try:
+        while True:
+            started = time.monotonic()
+            batch = adjustments.drain(batch_size)
+            if not batch:
+                break
+            try:
+                products = _apply_batch(batch)
+            except Exception:
+                # Put the batch back so the next run retries it.
+                for item in batch:
+                    adjustments.push(item)
+                raise
+            applied += len(batch)
+            logger.info(
+                f"Applied {len(batch)} inventory adjustments to {products} products "
+                f"in {(time.monotonic() - started) * 1000:.1f}ms"
+            )
+            if len(batch) < batch_size:
+                break
+    finally:
+        cache.delete(ADJUST_LOCK_KEY)
+    return applied
+
+
+def _apply_batch(batch):
+    deltas = {}
+    for product_id, delta in batch:
+        deltas[product_id] = deltas.get(product_id, 0) + Decimal(delta)
+    # Sorted so concurrent writers always lock product rows in the same order.
+    ordered = sorted((pk, delta) for pk, delta in deltas.items() if delta)
+    if not ordered:
+        return 0
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            Product._lock_in_order(cursor, [pk for pk, _ in ordered])
+            cursor.execute(
+                ADJUST_STOCK_BULK_SQL.format(values=", ".join(["(%s, %s)"] * len(ordered))),
+                [value for pair in ordered for value in pair],
+            )
+            # Products deleted since the adjustment was queued are skipped
+            updated = {row[0] for row in cursor.fetchall()}
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pk, kind="adjust", quantity=delta)
+            for pk, delta in ordered if pk in updated
+        ])
+        if updated:
+            from .search_cache import bump_version
+            transaction.on_commit(bump_version)
+    return len(updated)
+
+
+def _mark_sold_out(product_id):
+    with connection.cursor() as cursor:
+        cursor.execute(MARK_SOLD_OUT_SQL, [product_id, product_id])
+        changed = cursor.rowcount
+    if changed:
+        from .search_cache import bump_version
+        bump_version()
+
+
+def _mark_available(product_id):
+    with connection.cursor() as cursor:
+        cursor.execute(MARK_AVAILABLE_SQL, [product_id])
+        changed = cursor.rowcount
+    if changed:
+        from .search_cache import bump_version
+        bump_version()
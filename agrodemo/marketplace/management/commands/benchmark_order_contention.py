@@ -0,0 +1,153 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from marketplace import outbox
+from marketplace.models import Order, OutboxEvent, Product, StockMovement
+
+User = get_user_model()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent single-unit orders at one product and report throughput "
+        "and latency for the old locked read-modify-write stock update and the "
+        "conditional UPDATE. Orders, outbox events and stock are restored afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--product", type=int, required=True,
+                            help="ID of the product to order")
+        parser.add_argument("--threads", type=int, default=16,
+                            help="Concurrent buyers (default: 16)")
+        parser.add_argument("--orders", type=int, default=50,
+                            help="Orders per thread (default: 50)")
+        parser.add_argument("--mode", choices=["locked", "conditional", "both"], default="both",
+                            help="Stock update strategy to measure (default: both)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("benchmark_order_contention needs PostgreSQL row locking")
+        if options["threads"] <= 0 or options["orders"] <= 0:
+            raise CommandError("--threads and --orders must be positive")
+
+        try:
+            product = Product.objects.select_related("seller").get(id=options["product"])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product']} does not exist")
+        buyer = User.objects.exclude(id=product.seller_id).first()
+        if buyer is None:
+            raise CommandError("Need at least one user other than the seller")
+
+        modes = ["locked", "conditional"] if options["mode"] == "both" else [options["mode"]]
+        self.stdout.write(
+            f"{options['threads']} threads x {options['orders']} orders on product {product.id}"
+        )
+        self.stdout.write(
+            f"{'mode':<13}{'orders/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}"
+        )
+        for mode in modes:
+            elapsed, samples, failed = self.run(mode, product, buyer,
+                                                options["threads"], options["orders"])
+            self.stdout.write(
+                f"{mode:<13}"
+                f"{len(samples) / elapsed:>10.1f}"
+                f"{statistics.mean(samples) if samples else 0:>10.2f}"
+                f"{percentile(samples, 0.50) if samples else 0:>10.2f}"
+                f"{percentile(samples, 0.99) if samples else 0:>10.2f}"
+                f"{failed:>8}"
+            )
+
+    def run(self, mode, product, buyer, threads, orders):
+        original = Product.objects.values("stock", "is_available").get(id=product.id)
+        # Enough stock that no order fails for lack of it
+        Product.objects.filter(id=product.id).update(
+            stock=threads * orders + 1, is_available=True
+        )
+        self.prepare_product(product)
+
+        place = self.place_locked if mode == "locked" else self.place_conditional
+        samples, order_ids, errors = [], [], []
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def buyer_thread():
+            local_samples, local_ids = [], []
+            start.wait()
+            try:
+                for _ in range(orders):
+                    began = time.perf_counter()
+                    try:
+                        local_ids.append(place(product, buyer))
+                    except Exception as e:
+                        with lock:
+                            errors.append(e)
+                        continue
+                    local_samples.append((time.perf_counter() - began) * 1000)
+            finally:
+                connection.close()
+                with lock:
+                    samples.extend(local_samples)
+                    order_ids.extend(local_ids)
+
+        workers = [threading.Thread(target=buyer_thread) for _ in range(threads)]
+        began = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - began
+
+        OutboxEvent.objects.filter(
+            event_type=outbox.ORDER_CREATED, payload__order_id__in=order_ids
+        ).delete()
+        StockMovement.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+        self.cleanup_product(product)
+        Product.objects.filter(id=product.id).update(**original)
+        if errors:
+            self.stderr.write(f"{mode}: first error: {errors[0]}")
+        return elapsed, samples, len(errors)
+
+    def prepare_product(self, product):
+        """Hook run after the product's stock is reset for a run."""
+
+    def cleanup_product(self, product):
+        """Hook run before the product's original stock is restored."""
+
+    def place_locked(self, product, buyer):
+        """The previous order path: lock the row, then read-modify-write."""
+        with transaction.atomic():
+            locked = Product.objects.select_for_update().get(id=product.id)
+            order = self.insert(locked, buyer)
+            locked.stock -= 1
+            if locked.stock == 0:
+                locked.is_available = False
+            locked.save(update_fields=["stock", "is_available"])
+        return order.id
+
+    def place_conditional(self, product, buyer):
+        with transaction.atomic():
+            order = self.insert(product, buyer)
+            if Product.reserve_stock(product.id, 1, order_id=order.id) is None:
+                raise CommandError("Out of stock")
+        return order.id
+
+    def insert(self, product, buyer):
+        order = Order.objects.create(
+            buyer=buyer, seller_id=product.seller_id, product=product,
+            quantity=1, total_price=product.price, status="pending",
+        )
+        outbox.record(outbox.ORDER_CREATED, outbox.order_payload(
+            order.id, buyer.id, product.seller_id, product.name
+        ))
+        return order
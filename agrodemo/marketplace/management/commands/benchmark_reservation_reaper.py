@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from marketplace.models import Order, Product
+from marketplace.reservations import release_expired_reservations
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed expired pending orders against one product, run the reservation "
+        "reaper over them and report throughput. Everything runs in one "
+        "transaction that is rolled back, so the database is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--product", type=int, required=True,
+                            help="ID of the product the orders reserve stock from")
+        parser.add_argument("--orders", type=int, default=100000,
+                            help="Expired pending orders to seed (default: 100000)")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Orders expired per reaper batch (default: 1000)")
+
+    def handle(self, *args, **options):
+        if options["orders"] <= 0 or options["batch_size"] <= 0:
+            raise CommandError("--orders and --batch-size must be positive")
+        try:
+            product = Product.objects.get(id=options["product"])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product']} does not exist")
+        buyer = User.objects.exclude(id=product.seller_id).first()
+        if buyer is None:
+            raise CommandError("Need at least one user other than the seller")
+
+        try:
+            with transaction.atomic():
+                self.run(product, buyer, options["orders"], options["batch_size"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, product, buyer, count, batch_size):
+        expired_at = timezone.now() - timedelta(minutes=1)
+        started = time.monotonic()
+        Order.objects.bulk_create([
+            Order(buyer=buyer, seller_id=product.seller_id, product=product,
+                  quantity=1, total_price=product.price, status="pending",
+                  reserved_until=expired_at)
+            for _ in range(count)
+        ], batch_size=5000)
+        Product.objects.filter(id=product.id).update(stock=0, is_available=False)
+        self.stdout.write(f"Seeded {count} expired orders in {time.monotonic() - started:.1f}s")
+
+        # The product's own expired orders, if it had any, are reaped along
+        # with the seeded ones; count them so the checks below still hold.
+        due = Order.objects.filter(
+            product=product, status="pending", reserved_until__lt=timezone.now()
+        ).aggregate(orders=Count("id"), units=Sum("quantity"))
+        existing_orders = due["orders"] - count
+
+        started = time.monotonic()
+        expired = release_expired_reservations(batch_size=batch_size, product_ids=[product.id])
+        elapsed = time.monotonic() - started
+
+        product.refresh_from_db(fields=["stock", "is_available"])
+        self.stdout.write(
+            f"Expired {expired} orders in {elapsed:.2f}s "
+            f"({expired / elapsed if elapsed > 0 else 0:.0f} orders/s, batch size {batch_size})"
+        )
+        self.stdout.write(f"Product stock {product.stock}, available: {product.is_available}")
+        if existing_orders:
+            self.stdout.write(f"Including {existing_orders} orders that had already expired")
+        if expired != due["orders"] or product.stock != due["units"]:
+            raise CommandError("Reaper did not release every seeded reservation")
+        self.stdout.write("Rolling back benchmark data")
@@ -0,0 +1,82 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from marketplace.models import Product
+from marketplace.search_backends.bm25 import BM25SearchBackend
+from marketplace.search_backends.postgres import PostgresSearchBackend
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare first-page search latency of the PostgreSQL full-text backend "
+        "and the in-process BM25 backend on the current catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", default="",
+                            help="Comma-separated queries (default: words sampled from product names)")
+        parser.add_argument("--iterations", type=int, default=20,
+                            help="Runs per query (default: 20)")
+        parser.add_argument("--page-size", type=int, default=20,
+                            help="Rows fetched per search (default: 20)")
+
+    def handle(self, *args, **options):
+        queries = [q.strip() for q in options["queries"].split(",") if q.strip()]
+        if not queries:
+            queries = self.sample_queries()
+        if not queries:
+            raise CommandError("No products to benchmark against; pass --queries")
+
+        backends = []
+        if connection.vendor == "postgresql":
+            backends.append(("postgres", PostgresSearchBackend(), None))
+        else:
+            self.stdout.write("Skipping postgres backend: database is not PostgreSQL")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bm25 = BM25SearchBackend(index_path=os.path.join(tmp_dir, "bench.bm25"))
+            started = time.monotonic()
+            bm25.rebuild()
+            backends.append(("bm25", bm25, time.monotonic() - started))
+
+            self.stdout.write(
+                f"{Product.objects.count()} products, {len(queries)} queries x "
+                f"{options['iterations']} iterations"
+            )
+            self.stdout.write(
+                f"{'backend':<10}{'build s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            )
+            for name, backend, build_time in backends:
+                samples = self.run(backend, queries, options["iterations"], options["page_size"])
+                self.stdout.write(
+                    f"{name:<10}"
+                    f"{(f'{build_time:.2f}' if build_time is not None else '-'):>10}"
+                    f"{statistics.mean(samples):>10.2f}"
+                    f"{percentile(samples, 0.50):>10.2f}"
+                    f"{percentile(samples, 0.95):>10.2f}"
+                    f"{percentile(samples, 0.99):>10.2f}"
+                )
+
+    def sample_queries(self, count=10):
+        names = Product.objects.order_by("?").values_list("name", flat=True)[:count]
+        return [name.split()[0] for name in names if name.split()]
+
+    def run(self, backend, queries, iterations, page_size):
+        base = Product.objects.filter(is_available=True)
+        samples = []
+        for _ in range(iterations):
+            for query in queries:
+                started = time.perf_counter()
+                list(backend.search(base, query)[:page_size])
+                samples.append((time.perf_counter() - started) * 1000)
+        return samples
@@ -0,0 +1,76 @@
+import statistics
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection
+
+from marketplace.inventory import set_shards
+from marketplace.models import Product
+
+from .benchmark_order_contention import Command as ContentionCommand, percentile
+
+User = get_user_model()
+
+
+class Command(ContentionCommand):
+    help = (
+        "Fire concurrent single-unit orders at one product split across "
+        "different numbers of stock shards and report throughput and latency "
+        "for each. Orders, ledger rows, shards and stock are restored afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--product", type=int, required=True,
+                            help="ID of the product to order")
+        parser.add_argument("--threads", type=int, default=32,
+                            help="Concurrent buyers (default: 32)")
+        parser.add_argument("--orders", type=int, default=50,
+                            help="Orders per thread (default: 50)")
+        parser.add_argument("--shards", default="0,1,4,16",
+                            help="Comma-separated shard counts to measure (default: 0,1,4,16)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("benchmark_stock_shards needs PostgreSQL row locking")
+        if options["threads"] <= 0 or options["orders"] <= 0:
+            raise CommandError("--threads and --orders must be positive")
+        try:
+            counts = [int(count) for count in options["shards"].split(",")]
+        except ValueError:
+            raise CommandError("--shards must be a comma-separated list of integers")
+
+        try:
+            product = Product.objects.select_related("seller").get(id=options["product"])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product']} does not exist")
+        if product.stock_shards:
+            raise CommandError(f"Product {product.id} is already sharded")
+        buyer = User.objects.exclude(id=product.seller_id).first()
+        if buyer is None:
+            raise CommandError("Need at least one user other than the seller")
+
+        self.stdout.write(
+            f"{options['threads']} threads x {options['orders']} orders on product {product.id}"
+        )
+        self.stdout.write(
+            f"{'shards':<8}{'orders/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}"
+        )
+        for count in counts:
+            self.shards = count
+            elapsed, samples, failed = self.run("conditional", product, buyer,
+                                                options["threads"], options["orders"])
+            self.stdout.write(
+                f"{count:<8}"
+                f"{len(samples) / elapsed:>10.1f}"
+                f"{statistics.mean(samples) if samples else 0:>10.2f}"
+                f"{percentile(samples, 0.50) if samples else 0:>10.2f}"
+                f"{percentile(samples, 0.99) if samples else 0:>10.2f}"
+                f"{failed:>8}"
+            )
+
+    def prepare_product(self, product):
+        # Leaves under one unit on the Product row, so orders hit the shards
+        set_shards(product.id, self.shards)
+
+    def cleanup_product(self, product):
+        set_shards(product.id, 0)
@@ -0,0 +1,192 @@
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max, Min
+
+from marketplace.models import Product
+from marketplace.search import REINDEX_RANGE_SQL
+from marketplace.search_backends import get_search_backend
+from marketplace.search_backends.postgres import PostgresSearchBackend
+
+
+def reindex_worker(worker_id, start, stop, batch_size, only_missing, progress):
+    """
+    Re-index products with start <= id < stop, one committed batch at a time.
+
+    Each batch is a single UPDATE over a primary-key window, so only the rows
+    in that window are locked and only for the duration of the statement.
+    Progress is reported to the parent as (worker_id, next_id, rows).
+    """
+    sql = REINDEX_RANGE_SQL
+    if only_missing:
+        sql += " AND p.search_vector IS NULL"
+
+    try:
+        next_id = start
+        while next_id < stop:
+            upper = min(next_id + batch_size, stop)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [next_id, upper])
+                rows = cursor.rowcount
+            next_id = upper
+            progress.put((worker_id, next_id, rows))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild Product.search_vector in primary-key batches across several "
+        "worker processes. Progress is checkpointed so an interrupted run can "
+        "be resumed by running the command again. With a non-PostgreSQL "
+        "MARKETPLACE_SEARCH_BACKEND, rebuilds that backend's index instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Primary-key window per UPDATE (default: 5000)")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Number of worker processes (default: 4)")
+        parser.add_argument("--checkpoint",
+                            default=os.path.join(settings.BASE_DIR, ".reindex_search.json"),
+                            help="Checkpoint file used to resume an interrupted run")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore any existing checkpoint and start over")
+        parser.add_argument("--only-missing", action="store_true",
+                            help="Only index rows whose search_vector is NULL")
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not isinstance(backend, PostgresSearchBackend):
+            # Other backends keep their own index and rebuild it in one pass.
+            started = time.monotonic()
+            backend.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt {type(backend).__name__} index in {time.monotonic() - started:.1f}s"
+            ))
+            return
+
+        if connection.vendor != "postgresql":
+            raise CommandError("reindex_search requires PostgreSQL full-text search")
+
+        batch_size = options["batch_size"]
+        workers = options["workers"]
+        if batch_size <= 0 or workers <= 0:
+            raise CommandError("--batch-size and --workers must be positive")
+
+        checkpoint_path = options["checkpoint"]
+        state = None
+        if not options["restart"]:
+            state = self.load_checkpoint(checkpoint_path)
+
+        if state is None:
+            state = self.plan(workers)
+            if state is None:
+                self.stdout.write("No products to index.")
+                return
+            self.save_checkpoint(checkpoint_path, state)
+        else:
+            self.stdout.write(f"Resuming from checkpoint {checkpoint_path}")
+
+        pending = [
+            (worker_id, next_id, stop)
+            for worker_id, (start, stop, next_id) in enumerate(state["ranges"])
+            if next_id < stop
+        ]
+        if not pending:
+            self.stdout.write(self.style.SUCCESS("Checkpoint is already complete."))
+            os.remove(checkpoint_path)
+            return
+
+        # Forked workers must not share the parent's database socket.
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
+        progress = ctx.Queue()
+        processes = [
+            ctx.Process(
+                target=reindex_worker,
+                args=(worker_id, next_id, stop, batch_size,
+                      options["only_missing"], progress),
+            )
+            for worker_id, next_id, stop in pending
+        ]
+        for process in processes:
+            process.start()
+
+        total = 0
+        started = last_report = time.monotonic()
+        try:
+            while any(p.is_alive() for p in processes) or not progress.empty():
+                try:
+                    worker_id, next_id, rows = progress.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+                total += rows
+                state["ranges"][worker_id][2] = next_id
+                self.save_checkpoint(checkpoint_path, state)
+
+                now = time.monotonic()
+                if now - last_report >= 5:
+                    self.report(total, now - started)
+                    last_report = now
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            self.save_checkpoint(checkpoint_path, state)
+            raise CommandError(
+                f"Interrupted after {total} rows; run again to resume from {checkpoint_path}"
+            )
+
+        for process in processes:
+            process.join()
+
+        failed = [p for p in processes if p.exitcode != 0]
+        self.report(total, time.monotonic() - started)
+        if failed:
+            raise CommandError(
+                f"{len(failed)} worker(s) failed; run again to resume from {checkpoint_path}"
+            )
+
+        os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(f"Re-indexed {total} products."))
+
+    def plan(self, workers):
+        """Split [min(id), max(id)] into one contiguous range per worker."""
+        bounds = Product.objects.aggregate(low=Min("id"), high=Max("id"))
+        if bounds["low"] is None:
+            return None
+
+        low, high = bounds["low"], bounds["high"] + 1
+        step = max(1, -(-(high - low) // workers))
+        ranges = []
+        for start in range(low, high, step):
+            stop = min(start + step, high)
+            ranges.append([start, stop, start])
+        return {"ranges": ranges}
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Unreadable checkpoint {path}: {e}. Use --restart.")
+
+    def save_checkpoint(self, path, state):
+        # Write-then-rename so a crash never leaves a truncated checkpoint.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(state, fh)
+        os.replace(tmp_path, path)
+
+    def report(self, total, elapsed):
+        rate = total / elapsed if elapsed > 0 else 0
+        self.stdout.write(f"{total} rows indexed in {elapsed:.1f}s ({rate:.0f} rows/s)")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.inventory import available_stock, set_shards
+from marketplace.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Split a product's stock across N shards so concurrent orders write "
+        "different rows (use for flash-sale listings). --shards 0 folds the "
+        "shards back into the product."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product", type=int, help="ID of the product to shard")
+        parser.add_argument("--shards", type=int, default=8,
+                            help="Number of shards (default: 8)")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["shards"] <= 256:
+            raise CommandError("--shards must be between 0 and 256")
+        if not Product.objects.filter(id=options["product"]).exists():
+            raise CommandError(f"Product {options['product']} does not exist")
+
+        set_shards(options["product"], options["shards"])
+        stock = available_stock([options["product"]])[options["product"]]
+        self.stdout.write(self.style.SUCCESS(
+            f"Product {options['product']}: {stock} units across {options['shards']} shards"
+        ))
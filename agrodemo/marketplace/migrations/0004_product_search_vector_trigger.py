@@ -0,0 +1,93 @@
+from django.db import migrations
+
+
+PRODUCT_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION marketplace_product_search_vector() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.name IS NOT DISTINCT FROM OLD.name
+       AND NEW.description IS NOT DISTINCT FROM OLD.description
+       AND NEW.category_id IS NOT DISTINCT FROM OLD.category_id THEN
+        -- ORM saves rewrite every column; keep the stored vector untouched.
+        NEW.search_vector := OLD.search_vector;
+        RETURN NEW;
+    END IF;
+
+    IF current_setting('marketplace.defer_search_vector', true) = 'on' THEN
+        NEW.search_vector := NULL;
+        RETURN NEW;
+    END IF;
+
+    NEW.search_vector :=
+        setweight(to_tsvector('english', COALESCE(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(NEW.description, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(
+            (SELECT name FROM marketplace_category WHERE id = NEW.category_id), ''
+        )), 'C');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS marketplace_product_search_vector_trg ON marketplace_product;
+CREATE TRIGGER marketplace_product_search_vector_trg
+    BEFORE INSERT OR UPDATE OF name, description, category_id ON marketplace_product
+    FOR EACH ROW EXECUTE FUNCTION marketplace_product_search_vector();
+"""
+
+CATEGORY_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION marketplace_category_search_vector() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('marketplace.defer_search_vector', true) = 'on' THEN
+        UPDATE marketplace_product SET search_vector = NULL
+        WHERE category_id = NEW.id;
+        RETURN NULL;
+    END IF;
+
+    UPDATE marketplace_product
+    SET search_vector =
+        setweight(to_tsvector('english', COALESCE(name, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(description, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(NEW.name, '')), 'C')
+    WHERE category_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS marketplace_category_search_vector_trg ON marketplace_category;
+CREATE TRIGGER marketplace_category_search_vector_trg
+    AFTER UPDATE OF name ON marketplace_category
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION marketplace_category_search_vector();
+"""
+
+DROP_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS marketplace_category_search_vector_trg ON marketplace_category;
+DROP FUNCTION IF EXISTS marketplace_category_search_vector();
+DROP TRIGGER IF EXISTS marketplace_product_search_vector_trg ON marketplace_product;
+DROP FUNCTION IF EXISTS marketplace_product_search_vector();
+"""
+
+
+def create_triggers(apps, schema_editor):
+    # Triggers are PostgreSQL-only; other backends keep search_vector empty.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(PRODUCT_TRIGGER_SQL)
+    schema_editor.execute(CATEGORY_TRIGGER_SQL)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(DROP_TRIGGERS_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0003_alter_category_created_at_alter_category_description"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+# PostgreSQL only. Built CONCURRENTLY so large catalogs keep accepting writes
+# while indexing.
+CREATE_INDEXES_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS product_search_vector_gin "
+    "ON marketplace_product USING gin (search_vector)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS product_name_trgm "
+    "ON marketplace_product USING gin (name gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS category_name_trgm "
+    "ON marketplace_category USING gin (name gin_trgm_ops)",
+]
+
+DROP_INDEXES_SQL = [
+    "DROP INDEX CONCURRENTLY IF EXISTS category_name_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS product_name_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS product_search_vector_gin",
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in CREATE_INDEXES_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in DROP_INDEXES_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("marketplace", "0004_product_search_vector_trigger"),
+    ]
+
+    # Database-only: the indexes are kept out of model state because other
+    # backends can't build them, and a SQLite table rebuild in a later
+    # migration would otherwise try to.
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
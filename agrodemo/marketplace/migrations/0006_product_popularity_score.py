@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0005_search_gin_and_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="popularity_score",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_available", True)),
+                fields=["-popularity_score", "-created_at", "-id"],
+                name="product_popularity_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0006_product_popularity_score"),
+    ]
+
+    # Buffered views are written later with bulk_create, which would
+    # overwrite an auto_now_add timestamp with the flush time.
+    operations = [
+        migrations.AlterField(
+            model_name="productview",
+            name="viewed_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0008_productviewdaily_rollupwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingProduct",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("position", models.PositiveIntegerField()),
+                ("score", models.FloatField()),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="trending",
+                        to="marketplace.category",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="marketplace.product",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["category", "position"],
+                "indexes": [
+                    models.Index(fields=["category", "position"], name="trending_category_pos_idx"),
+                ],
+            },
+        ),
+    ]
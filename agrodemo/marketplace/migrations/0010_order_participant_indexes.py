@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+# Built CONCURRENTLY on PostgreSQL so order placement isn't blocked while the
+# indexes build on a large table.
+INDEXES = [
+    ("order_buyer_status_created_idx", "buyer_id, status, created_at"),
+    ("order_seller_status_created_idx", "seller_id, status, created_at"),
+]
+
+
+def create_indexes(apps, schema_editor):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    for name, columns in INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON marketplace_order ({columns})"
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    for name, _ in INDEXES:
+        schema_editor.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("marketplace", "0009_trendingproduct"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="order",
+                    index=models.Index(
+                        fields=["buyer", "status", "created_at"],
+                        name="order_buyer_status_created_idx",
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name="order",
+                    index=models.Index(
+                        fields=["seller", "status", "created_at"],
+                        name="order_seller_status_created_idx",
+                    ),
+                ),
+            ],
+        ),
+    ]
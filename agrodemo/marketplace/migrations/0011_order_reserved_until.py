@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0010_order_participant_indexes"),
+    ]
+
+    # Existing pending orders keep reserved_until NULL and never expire.
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="reserved_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status", "pending")),
+                fields=["reserved_until"],
+                name="order_pending_expiry_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0013_stockshard_stockmovement"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="stockmovement",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("reserve", "Reserve"),
+                    ("release", "Release"),
+                    ("restock", "Restock"),
+                    ("adjust", "Adjustment"),
+                ],
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+
+# Built CONCURRENTLY on PostgreSQL so order flows can keep inserting
+# notifications while the indexes build.
+INDEXES = [
+    ("notification_recipient_ts_idx", "recipient_id, timestamp, id", ""),
+    ("notification_unread_idx", "recipient_id", " WHERE NOT is_read"),
+]
+
+
+def create_indexes(apps, schema_editor):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    for name, columns, condition in INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {name} "
+            f"ON marketplace_notification ({columns}){condition}"
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("marketplace", "0014_alter_stockmovement_kind"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="type",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="reference_id",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="notification",
+                    index=models.Index(
+                        fields=["recipient", "timestamp", "id"],
+                        name="notification_recipient_ts_idx",
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name="notification",
+                    index=models.Index(
+                        condition=models.Q(("is_read", False)),
+                        fields=["recipient"],
+                        name="notification_unread_idx",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+def queue_undispatched_emails(apps, schema_editor):
+    # Events not yet dispatched would have had their email sent by the
+    # dispatcher; the email sender picks them up instead now.
+    OutboxEvent = apps.get_model("marketplace", "OutboxEvent")
+    OutboxEvent.objects.filter(
+        event_type="order.created", processed_at__isnull=True
+    ).update(email_status="pending")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0015_notification_type_reference_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxevent",
+            name="email_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("", "No email"),
+                    ("pending", "Pending"),
+                    ("digest", "Pending digest"),
+                    ("sent", "Sent"),
+                ],
+                default="",
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outboxevent",
+            index=models.Index(
+                condition=models.Q(("email_status__in", ["pending", "digest"])),
+                fields=["email_status", "id"],
+                name="outbox_email_pending_idx",
+            ),
+        ),
+        migrations.RunPython(queue_undispatched_emails, migrations.RunPython.noop),
+    ]
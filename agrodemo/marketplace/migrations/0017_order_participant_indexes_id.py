@@ -0,0 +1,66 @@
+from django.db import migrations, models
+
+
+# The participant indexes gain id so for_participant()'s (created_at, id)
+# ordering is read straight from them. Built CONCURRENTLY on PostgreSQL, the
+# new indexes replacing the old ones only once they exist.
+OLD_INDEXES = [
+    ("order_buyer_status_created_idx", "buyer_id, status, created_at"),
+    ("order_seller_status_created_idx", "seller_id, status, created_at"),
+]
+NEW_INDEXES = [
+    ("order_buyer_recent_idx", "buyer_id, status, created_at, id"),
+    ("order_seller_recent_idx", "seller_id, status, created_at, id"),
+]
+
+
+def _swap(schema_editor, create, drop):
+    concurrently = "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    for name, columns in create:
+        schema_editor.execute(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON marketplace_order ({columns})"
+        )
+    for name, _ in drop:
+        schema_editor.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+def add_id_to_indexes(apps, schema_editor):
+    _swap(schema_editor, NEW_INDEXES, OLD_INDEXES)
+
+
+def remove_id_from_indexes(apps, schema_editor):
+    _swap(schema_editor, OLD_INDEXES, NEW_INDEXES)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("marketplace", "0016_outboxevent_email_status"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_id_to_indexes, remove_id_from_indexes),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(model_name="order", name="order_buyer_status_created_idx"),
+                migrations.RemoveIndex(model_name="order", name="order_seller_status_created_idx"),
+                migrations.AddIndex(
+                    model_name="order",
+                    index=models.Index(
+                        fields=["buyer", "status", "created_at", "id"],
+                        name="order_buyer_recent_idx",
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name="order",
+                    index=models.Index(
+                        fields=["seller", "status", "created_at", "id"],
+                        name="order_seller_recent_idx",
+                    ),
+                ),
+            ],
+        ),
+    ]
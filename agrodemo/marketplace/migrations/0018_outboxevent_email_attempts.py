@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0017_order_participant_indexes_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxevent",
+            name="email_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="outboxevent",
+            name="email_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("", "No email"),
+                    ("pending", "Pending"),
+                    ("digest", "Pending digest"),
+                    ("sent", "Sent"),
+                    ("failed", "Failed"),
+                ],
+                default="",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -1,12 +1,76 @@
 
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
+from django.utils import timezone
 from django.contrib.postgres.search import SearchVectorField, SearchVector, SearchRank, SearchQuery
-from django.db.models import Q
+from django.db.models import Q, F
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from .search_backends import get_search_backend
 User = get_user_model()
 
+# Both branches of an order's stock change are single statements, so buyers
+# never wait on a read-modify-write under a row lock. SET expressions see the
+# pre-update stock, so is_available flips in the same statement (sharded
+# products still have stock in their shards; see inventory.py).
+RESERVE_STOCK_SQL = """
+    UPDATE marketplace_product
+    SET stock = stock - %s, is_available = (stock - %s) > 0 OR stock_shards > 0
+    WHERE id = %s AND is_available AND stock >= %s
+    RETURNING stock
+"""
+
+# Multi-line variants for checkout and bulk cancellation. The rows are locked
+# in primary-key order first (LOCK_PRODUCTS_SQL) so concurrent carts can't
+# deadlock on each other. NO KEY UPDATE is the lock the UPDATE itself takes;
+# unlike FOR UPDATE it doesn't wait on the KEY SHARE locks that inserting an
+# order (its product FK) holds, which checkout does before reserving.
+LOCK_PRODUCTS_SQL = """
+    SELECT id FROM marketplace_product
+    WHERE id IN ({ids})
+    ORDER BY id
+    FOR NO KEY UPDATE
+"""
+
+RESERVE_STOCK_BULK_SQL = """
+    WITH v(id, q) AS (VALUES {values})
+    UPDATE marketplace_product
+    SET stock = marketplace_product.stock - v.q,
+        is_available = (marketplace_product.stock - v.q) > 0 OR marketplace_product.stock_shards > 0
+    FROM v
+    WHERE marketplace_product.id = v.id
+      AND marketplace_product.is_available
+      AND marketplace_product.stock >= v.q
+    RETURNING marketplace_product.id, marketplace_product.stock
+"""
+
+# {shards} is "AND stock_shards = 0" on the first pass; sharded products get
+# their units back in a shard instead (see release_stock_bulk).
+RELEASE_STOCK_BULK_SQL = """
+    WITH v(id, q) AS (VALUES {values})
+    UPDATE marketplace_product
+    SET stock = marketplace_product.stock + v.q, is_available = TRUE
+    FROM v
+    WHERE marketplace_product.id = v.id {shards}
+    RETURNING marketplace_product.id
+"""
+
+RELEASE_STOCK_SQL = """
+    UPDATE marketplace_product
+    SET stock = stock + %s, is_available = TRUE
+    WHERE id = %s
+    RETURNING stock
+"""
+
+# Seller bulk status changes: the status check is part of the UPDATE, so
+# only orders still in an allowed state are moved.
+BULK_TRANSITION_SQL = """
+    UPDATE marketplace_order
+    SET status = %s, updated_at = %s, reserved_until = NULL
+    WHERE seller_id = %s AND id IN ({ids}) AND status IN ({allowed})
+    RETURNING id, product_id, quantity, buyer_id
+"""
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, help_text="Category name")
     slug = models.SlugField(max_length=100, unique=True, blank=True,null=True)
@@ -18,6 +82,8 @@ class Category(models.Model):
         verbose_name = "Category"
         verbose_name_plural = "Categories"
         ordering = ['name']
+        # category_name_trgm (GIN, pg_trgm) is created by migration 0005 on
+        # PostgreSQL only, so it is deliberately not declared here.
 
     def __str__(self):
         return self.name
@@ -46,6 +112,9 @@ class Product(models.Model):
     unit = models.CharField(max_length=10, choices=UNIT_CHOICES, default='kg')
     is_available = models.BooleanField(default=True)
     views = models.PositiveIntegerField(default=0)
+    popularity_score = models.FloatField(default=0)  # Refreshed by tasks.refresh_popularity_scores
+    # >0 for hot listings whose stock is split across StockShard rows (see inventory.py)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     search_vector = SearchVectorField(null=True, blank=True)  # New field for search
@@ -55,6 +124,15 @@ class Product(models.Model):
             models.Index(fields=['name']),
             models.Index(fields=['created_at']),
             models.Index(fields=['is_available']),
+            # product_search_vector_gin and product_name_trgm are GIN indexes
+            # created by migration 0005 on PostgreSQL only. They stay out of
+            # model state so SQLite table rebuilds don't try to recreate them.
+            # "Sort by popular" listing order, see Product.search
+            models.Index(
+                fields=['-popularity_score', '-created_at', '-id'],
+                name='product_popularity_idx',
+                condition=Q(is_available=True),
+            ),
         ]
 
     def save(self, *args, **kwargs):
@@ -68,26 +146,10 @@ class Product(models.Model):
                 counter += 1
             self.slug = unique_slug
 
-        # First save without search vector
-        self.search_vector = None  # Clear the search vector for initial save
+        # search_vector is maintained by a database trigger (migration 0004),
+        # so a save is a single write and never touches self.category.
         super().save(*args, **kwargs)
-        
-        # Now update the search vector after initial save
-        from django.db import connection
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """
-                UPDATE marketplace_product 
-                SET search_vector = (
-                    setweight(to_tsvector('english', COALESCE(%s, '')), 'A') ||
-                    setweight(to_tsvector('english', COALESCE(%s, '')), 'B') ||
-                    setweight(to_tsvector('english', COALESCE(%s, '')), 'C')
-                )
-                WHERE id = %s
-                """,
-                [self.name, self.description, self.category.name, self.pk]
-            )
-            
+
     # def save(self, *args, **kwargs):
     #     # Handle slug creation
     #     if not self.slug:
@@ -116,13 +178,16 @@ class Product(models.Model):
 
         Args:
             query (str): Search query string
-            filters (dict): Optional filters like category, price range, availability
+            filters (dict): Optional filters like category, price range, availability,
+                and ``sort='popular'`` to order by popularity_score instead of relevance
 
         Returns:
-            QuerySet: Filtered and ordered product queryset
+            QuerySet: Filtered and ordered product queryset. Ordering is always
+            (-rank, -created_at, -id), or (-created_at, -id) without a query or
+            sort, so results can be cursor-paginated.
         """
         if not query and not filters:
-            return Product.objects.filter(is_available=True)
+            return Product.objects.filter(is_available=True).order_by('-created_at', '-id')
 
         queryset = Product.objects.all()
 
@@ -137,36 +202,206 @@ class Product(models.Model):
             if 'availability' in filters:
                 queryset = queryset.filter(is_available=filters['availability'])
 
+        queryset = queryset.filter(is_available=True)
+
+        # Delegate matching and ranking to the configured backend
+        if query:
+            queryset = get_search_backend().search(queryset, query)
+
+        if filters and filters.get('sort') == 'popular':
+            # Walks product_popularity_idx; the score doubles as rank so
+            # cursor pagination works the same way.
+            return queryset.annotate(
+                rank=F('popularity_score')
+            ).order_by('-rank', '-created_at', '-id')
+
         # If no search query, return filtered queryset
         if not query:
-            return queryset.filter(is_available=True)
-
-        # Try PostgreSQL full-text search first
-        try:
-            search_query = SearchQuery(query)
-            search_rank = SearchRank('search_vector', search_query)
-
-            queryset = queryset.annotate(
-                rank=search_rank
-            ).filter(
-                search_vector=search_query,
-                is_available=True
-            ).order_by('-rank', '-created_at')
-
-        except Exception:
-            # Fallback to basic search if PostgreSQL search is unavailable
-            queryset = queryset.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(category__name__icontains=query),
-                is_available=True
-            ).order_by('-created_at')
+            return queryset.order_by('-created_at', '-id')
 
         return queryset
 
+    @classmethod
+    def reserve_stock(cls, product_id, quantity, order_id=None):
+        """
+        Atomically take quantity units from a product's stock.
+
+        Returns the remaining stock, or None when the product is unavailable
+        or has fewer than quantity units. Taking the last unit marks the
+        product unavailable. Sharded products are served from their shards
+        once the Product row itself can't cover the order.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(RESERVE_STOCK_SQL, [quantity, quantity, product_id, quantity])
+            row = cursor.fetchone()
+        if row is None:
+            from .inventory import reserve_from_shards
+            return reserve_from_shards(product_id, quantity, order_id=order_id)
+        StockMovement.objects.create(product_id=product_id, kind='reserve',
+                                     quantity=-quantity, order_id=order_id)
+        if row[0] <= 0:
+            # Sold out: cached search pages may still list it
+            from .search_cache import bump_version
+            transaction.on_commit(bump_version)
+        return row[0]
+
+    @classmethod
+    def reserve_stock_bulk(cls, quantities, order_ids=None):
+        """
+        Atomically take stock for several products.
+
+        quantities maps product id to units (order_ids, optionally, to the
+        order each line belongs to). Returns {product_id: remaining} for the
+        lines that were reserved; callers must roll back the transaction if
+        any line is missing from the result.
+        """
+        order_ids = order_ids or {}
+        ids = sorted(quantities)
+        if not ids:
+            return {}
+        with connection.cursor() as cursor:
+            cls._lock_in_order(cursor, ids)
+            cursor.execute(
+                RESERVE_STOCK_BULK_SQL.format(values=", ".join(["(%s, %s)"] * len(ids))),
+                [value for pk in ids for value in (pk, quantities[pk])],
+            )
+            remaining = dict(cursor.fetchall())
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pk, kind='reserve', quantity=-quantities[pk],
+                          order_id=order_ids.get(pk))
+            for pk in sorted(remaining)
+        ])
+        if any(stock <= 0 for stock in remaining.values()):
+            from .search_cache import bump_version
+            transaction.on_commit(bump_version)
+
+        # Lines the Product rows couldn't cover may still fit in shards
+        from .inventory import reserve_from_shards
+        for pk in ids:
+            if pk not in remaining:
+                stock = reserve_from_shards(pk, quantities[pk], order_id=order_ids.get(pk))
+                if stock is not None:
+                    remaining[pk] = stock
+        return remaining
+
+    @classmethod
+    def release_stock_bulk(cls, lines):
+        """
+        Atomically return the stock of several orders.
+
+        lines are (order_id, product_id, quantity). Unsharded products are
+        credited with one UPDATE; a sharded product's units go back to one of
+        its shards, as in release_stock(), or to the Product row when every
+        shard is busy.
+        """
+        lines = list(lines)
+        quantities = {}
+        for _, product_id, quantity in lines:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        ids = sorted(quantities)
+        if not ids:
+            return
+        with connection.cursor() as cursor:
+            cls._lock_in_order(cursor, ids)
+            credited = cls._release_rows(cursor, quantities, "AND marketplace_product.stock_shards = 0")
+
+            from .inventory import release_to_shard
+            released = [line for line in lines if line[1] in credited]
+            leftover = {}
+            for order_id, product_id, quantity in lines:
+                if product_id in credited:
+                    continue
+                if not release_to_shard(product_id, quantity, order_id=order_id):
+                    leftover[product_id] = leftover.get(product_id, 0) + quantity
+                    released.append((order_id, product_id, quantity))
+            if leftover:
+                cls._release_rows(cursor, leftover, "")
+
+        # release_to_shard() records its own movements
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, kind='release', quantity=quantity,
+                          order_id=order_id)
+            for order_id, product_id, quantity in released
+        ])
+        from .search_cache import bump_version
+        transaction.on_commit(bump_version)
+
+    @staticmethod
+    def _release_rows(cursor, quantities, shards):
+        ids = sorted(quantities)
+        cursor.execute(
+            RELEASE_STOCK_BULK_SQL.format(values=", ".join(["(%s, %s)"] * len(ids)), shards=shards),
+            [value for pk in ids for value in (pk, quantities[pk])],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    @staticmethod
+    def _lock_in_order(cursor, ids):
+        # SQLite serializes writers, so only PostgreSQL needs explicit locks
+        if connection.vendor == 'postgresql':
+            cursor.execute(LOCK_PRODUCTS_SQL.format(ids=", ".join(["%s"] * len(ids))), ids)
+
+    @classmethod
+    def release_stock(cls, product_id, quantity, order_id=None):
+        """Atomically return quantity units to stock and mark the product available."""
+        from .inventory import release_to_shard
+        if release_to_shard(product_id, quantity, order_id=order_id):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_STOCK_SQL, [quantity, product_id])
+            row = cursor.fetchone()
+        StockMovement.objects.create(product_id=product_id, kind='release',
+                                     quantity=quantity, order_id=order_id)
+        from .search_cache import bump_version
+        transaction.on_commit(bump_version)
+        return row[0] if row else None
+
     def __str__(self):
         return self.name
 
+class StockShard(models.Model):
+    """
+    Slice of a sharded product's stock. Concurrent orders take stock from
+    different shards instead of all rewriting the Product row; available
+    stock is Product.stock plus every shard.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='stockshard_product_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} shard {self.shard}: {self.stock}"
+
+class StockMovement(models.Model):
+    """Append-only record of every stock change; never updated in place."""
+    KIND_CHOICES = [
+        ('reserve', 'Reserve'),
+        ('release', 'Release'),
+        ('restock', 'Restock'),
+        ('adjust', 'Adjustment'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    # None when Product.stock itself was changed
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)  # signed
+    order = models.ForeignKey('Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='stockmovement_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity} of {self.product.name}"
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/') # You might use FileField
@@ -187,17 +422,122 @@ class Review(models.Model):
 class ProductView(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_views')
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    viewed_at = models.DateTimeField(auto_now_add=True)
+    viewed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Retention pruning and ad-hoc time-range queries
+            models.Index(fields=['viewed_at'], name='productview_viewed_at_idx'),
+        ]
 
     def __str__(self):
         return f"View of {self.product.name} at {self.viewed_at}"
 
+class ProductViewDaily(models.Model):
+    """Per-product, per-day (UTC) view totals rolled up from ProductView."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_views')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    # Distinct signed-in viewers; anonymous views only count towards views
+    unique_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='productviewdaily_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='productviewdaily_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.views} views of {self.product.name} on {self.day}"
+
+class RollupWatermark(models.Model):
+    """Highest source row id an incremental aggregation has processed."""
+    name = models.CharField(max_length=100, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+class TrendingProduct(models.Model):
+    """
+    Top-K trending products, overall (category is NULL) and per category.
+
+    Rewritten wholesale by the trending job; the API reads the cached copy.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='trending')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    position = models.PositiveIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['category', 'position']
+        indexes = [
+            models.Index(fields=['category', 'position'], name='trending_category_pos_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.position} {self.product.name}"
+
+class OutboxEvent(models.Model):
+    """
+    Side effect of an order change, written in the same transaction as the
+    change and fanned out later by outbox.dispatch().
+    """
+    EMAIL_PENDING = 'pending'
+    EMAIL_DIGEST = 'digest'
+    EMAIL_SENT = 'sent'
+    EMAIL_FAILED = 'failed'
+    EMAIL_STATUS_CHOICES = [
+        ('', 'No email'),
+        (EMAIL_PENDING, 'Pending'),
+        (EMAIL_DIGEST, 'Pending digest'),
+        (EMAIL_SENT, 'Sent'),
+        (EMAIL_FAILED, 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Emails are sent from these rows by emails.py, separately from
+    # processed_at, and marked sent only once the send has succeeded
+    email_status = models.CharField(max_length=10, choices=EMAIL_STATUS_CHOICES, blank=True, default='')
+    # Failed sends; the email is given up (failed) after MARKETPLACE_EMAIL_MAX_ATTEMPTS
+    email_attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # The dispatcher only ever reads the unprocessed tail
+            models.Index(fields=['id'], name='outbox_pending_idx', condition=Q(processed_at__isnull=True)),
+            # Likewise the email sender, for events with an unsent email
+            models.Index(fields=['email_status', 'id'], name='outbox_email_pending_idx',
+                         condition=Q(email_status__in=['pending', 'digest'])),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk}"
+
 class Notification(models.Model):
     recipient = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Outbox event type (e.g. "order.created") and the order it refers to
+    type = models.CharField(max_length=50, blank=True, default='')
+    reference_id = models.PositiveIntegerField(null=True, blank=True)
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Newest-first keyset pagination per recipient
+            models.Index(fields=['recipient', 'timestamp', 'id'], name='notification_recipient_ts_idx'),
+            # Unread counts on a cache miss and mark-all-read
+            models.Index(fields=['recipient'], name='notification_unread_idx', condition=Q(is_read=False)),
+        ]
+
     def __str__(self):
         return f"Notification for {self.recipient.username}"
 
@@ -210,15 +550,34 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
+    # Target status -> statuses an order may move to it from
+    TRANSITIONS = {
+        'confirmed': ['pending'],
+        'shipped': ['confirmed'],
+        'delivered': ['shipped'],
+        'cancelled': ['pending', 'confirmed'],
+    }
+
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Stock held by a pending order is released once this passes (see reservations.py)
+    reserved_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # One per participant side; see for_participant()
+            models.Index(fields=['buyer', 'status', 'created_at', 'id'], name='order_buyer_recent_idx'),
+            models.Index(fields=['seller', 'status', 'created_at', 'id'], name='order_seller_recent_idx'),
+            models.Index(fields=['reserved_until'], name='order_pending_expiry_idx',
+                         condition=Q(status='pending')),
+        ]
+
     def clean(self):
         # Validation to check quantity is positive
         if self.quantity <= 0:
@@ -238,14 +597,20 @@ class Order(models.Model):
         """Confirm the order if it's in pending status."""
         if self.status != 'pending':
             raise ValueError("Only pending orders can be confirmed")
-        self.status = 'confirmed'
-        self.save()
+        # Conditional, so an order the reservation reaper just expired
+        # can't be confirmed from a stale instance
+        now = timezone.now()
+        if not Order.objects.filter(pk=self.pk, status='pending').update(
+            status='confirmed', reserved_until=None, updated_at=now
+        ):
+            raise ValueError("Only pending orders can be confirmed")
+        self.status, self.reserved_until, self.updated_at = 'confirmed', None, now
 
-        # Create notification for buyer
-        Notification.objects.create(
-            recipient=self.buyer,
-            message=f"Your order #{self.id} for {self.product.name} has been confirmed"
-        )
+        # Buyer notification goes through the outbox
+        from . import outbox
+        outbox.record(outbox.ORDER_CONFIRMED, outbox.order_payload(
+            self.id, self.buyer_id, self.seller_id, self.product.name
+        ))
 
     @transaction.atomic
     def cancel_order(self, reason=None):
@@ -253,23 +618,118 @@ class Order(models.Model):
         if self.status not in ['pending', 'confirmed']:
             raise ValueError("Only pending or confirmed orders can be cancelled")
 
+        # Claim the transition first so a concurrent cancel or reservation
+        # expiry can't return the same stock twice
+        now = timezone.now()
+        if not Order.objects.filter(
+            pk=self.pk, status__in=['pending', 'confirmed']
+        ).update(status='cancelled', reserved_until=None, updated_at=now):
+            raise ValueError("Only pending or confirmed orders can be cancelled")
+        self.status, self.reserved_until, self.updated_at = 'cancelled', None, now
+
         try:
             # Return stock to inventory
-            self.product.stock += self.quantity
-            self.product.is_available = True
-            self.product.save()
+            Product.release_stock(self.product_id, self.quantity, order_id=self.id)
         except Exception as e:
             raise Exception(f"Failed to update product stock during cancellation: {e}")
 
-        self.status = 'cancelled'
-        self.save()
+        # Buyer notification goes through the outbox
+        from . import outbox
+        outbox.record(outbox.ORDER_CANCELLED, outbox.order_payload(
+            self.id, self.buyer_id, self.seller_id, self.product.name, reason=reason
+        ))
+
+    @classmethod
+    def for_participant(cls, user, status=None, limit=None):
+        """
+        Orders the user bought or sold, newest first, at most limit rows.
+        Ties on created_at are broken by id, so OFFSET pages are stable.
 
-        # Create notifications
-        cancel_message = f"Order #{self.id} has been cancelled"
-        if reason:
-            cancel_message += f": {reason}"
+        An OR across buyer and seller can't use either participant index, so
+        on PostgreSQL this is a UNION of a buyer branch and a seller branch,
+        each reading its own index and stopping after limit rows. Databases
+        that can't limit UNION branches get the plain OR query.
+        """
+        # select_related on every path, so serializing a page adds no queries
+        orders = cls.objects.select_related('buyer', 'seller', 'product')
+        branches = [orders.filter(buyer=user), orders.filter(seller=user)]
+        if status:
+            branches = [branch.filter(status=status) for branch in branches]
+
+        if limit is None or not connection.features.supports_slicing_ordering_in_compound:
+            queryset = orders.filter(Q(buyer=user) | Q(seller=user))
+            if status:
+                queryset = queryset.filter(status=status)
+            queryset = queryset.order_by('-created_at', '-id')
+            return queryset if limit is None else queryset[:limit]
+
+        buyer_branch, seller_branch = [
+            branch.order_by('-created_at', '-id')[:limit] for branch in branches
+        ]
+        return buyer_branch.union(seller_branch).order_by('-created_at', '-id')
+
+    @classmethod
+    def bulk_transition(cls, seller, order_ids, target, reason=None):
+        """
+        Move many of a seller's orders to target status at once.
+
+        Transitions are validated set-wise by a single conditional UPDATE, so
+        an order whose status changed concurrently is simply reported as an
+        invalid transition. Cancelling returns stock in one statement. Buyer
+        notifications are queued with one outbox insert.
+
+        Returns {order_id: outcome}, where outcome is "updated", "not_found"
+        or "invalid_transition".
+        """
+        allowed_from = cls.TRANSITIONS[target]
+        order_ids = sorted(set(order_ids))
+        current = {
+            pk: (status, product_name)
+            for pk, status, product_name in cls.objects.filter(
+                id__in=order_ids, seller=seller
+            ).values_list('id', 'status', 'product__name')
+        }
+        if not current:
+            return {pk: 'not_found' for pk in order_ids}
+
+        candidates = sorted(current)
+        placeholders = ", ".join(["%s"] * len(candidates))
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    BULK_TRANSITION_SQL.format(
+                        ids=placeholders,
+                        allowed=", ".join(["%s"] * len(allowed_from)),
+                    ),
+                    [target, timezone.now(), seller.pk, *candidates, *allowed_from],
+                )
+                updated = {pk: (product_id, quantity, buyer_id)
+                           for pk, product_id, quantity, buyer_id in cursor.fetchall()}
+
+            if target == 'cancelled' and updated:
+                Product.release_stock_bulk(
+                    (pk, product_id, quantity)
+                    for pk, (product_id, quantity, _) in sorted(updated.items())
+                )
 
-        Notification.objects.create(
-            recipient=self.buyer,
-            message=cancel_message
-        )
\ No newline at end of file
+            from . import outbox
+            if target == 'confirmed':
+                event_type, extra = outbox.ORDER_CONFIRMED, {}
+            elif target == 'cancelled':
+                event_type, extra = outbox.ORDER_CANCELLED, {'reason': reason}
+            else:
+                event_type, extra = outbox.ORDER_STATUS_CHANGED, {'status': target}
+            outbox.record_many(event_type, [
+                outbox.order_payload(pk, buyer_id, seller.pk, current[pk][1], **extra)
+                for pk, (_, _, buyer_id) in sorted(updated.items())
+            ])
+
+        outcomes = {}
+        for pk in order_ids:
+            if pk in updated:
+                outcomes[pk] = 'updated'
+            elif pk in current:
+                outcomes[pk] = 'invalid_transition'
+            else:
+                outcomes[pk] = 'not_found'
+        return outcomes
\ No newline at end of file
@@ -0,0 +1,75 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .events import publish_on_commit
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Per-user unread count. Writers adjust it in place; it is only rebuilt with
+# a COUNT when missing, so the navbar badge poll is a single cache read.
+UNREAD_KEY = "notifications_unread_{}"
+
+
+def unread_count(user_id):
+    count = cache.get(UNREAD_KEY.format(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        # add() so a count adjusted by a concurrent writer isn't overwritten
+        ttl = getattr(settings, "MARKETPLACE_UNREAD_COUNT_TTL", 60 * 60)
+        if not cache.add(UNREAD_KEY.format(user_id), count, ttl):
+            count = cache.get(UNREAD_KEY.format(user_id), count)
+    return max(0, count)
+
+
+def _adjust(counts):
+    for user_id, delta in counts.items():
+        try:
+            cache.incr(UNREAD_KEY.format(user_id), delta)
+        except ValueError:
+            pass  # Not cached; the next read counts from the database
+
+
+def notify_many(notifications):
+    """
+    Insert notifications and, once committed, bump their recipients' unread
+    counts and push them to any open event streams.
+    """
+    created = Notification.objects.bulk_create(notifications)
+    counts = {}
+    for notification in created:
+        counts[notification.recipient_id] = counts.get(notification.recipient_id, 0) + 1
+    transaction.on_commit(lambda: _adjust(counts))
+    for notification in created:
+        publish_on_commit([notification.recipient_id], "notification", {
+            "id": notification.pk,
+            "type": notification.type,
+            "reference_id": notification.reference_id,
+            "message": notification.message,
+            "timestamp": notification.timestamp,
+        })
+    return created
+
+
+def mark_read(user_id, notification_ids):
+    """Mark some of a user's notifications read. Returns how many changed."""
+    changed = Notification.objects.filter(
+        recipient_id=user_id, id__in=notification_ids, is_read=False
+    ).update(is_read=True)
+    if changed:
+        transaction.on_commit(lambda: _adjust({user_id: -changed}))
+    return changed
+
+
+def mark_all_read(user_id):
+    """Mark every unread notification of a user read in one UPDATE."""
+    changed = Notification.objects.filter(
+        recipient_id=user_id, is_read=False
+    ).update(is_read=True)
+    # Dropped rather than set to 0: a notification committed in between would
+    # be lost from the count. The next read recounts from the partial index.
+    transaction.on_commit(lambda: cache.delete(UNREAD_KEY.format(user_id)))
+    return changed
@@ -0,0 +1,173 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .events import publish_on_commit
+from .models import Notification, OutboxEvent
+from .notifications import notify_many
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "order.created"
+ORDER_CONFIRMED = "order.confirmed"
+ORDER_CANCELLED = "order.cancelled"
+ORDER_EXPIRED = "order.expired"
+ORDER_STATUS_CHANGED = "order.status_changed"
+
+# Event type -> (payload key of the recipient, message template)
+NOTIFICATIONS = {
+    ORDER_CREATED: ("seller_id", "New order #{order_id} received for {product_name}"),
+    ORDER_CONFIRMED: ("buyer_id", "Your order #{order_id} for {product_name} has been confirmed"),
+    ORDER_CANCELLED: ("buyer_id", "Order #{order_id} has been cancelled"),
+    ORDER_EXPIRED: ("buyer_id", "Order #{order_id} has expired: the seller did not confirm it in time"),
+    ORDER_STATUS_CHANGED: ("buyer_id", "Your order #{order_id} for {product_name} has been {status}"),
+}
+
+# Events that send the buyer an email
+EMAIL_EVENTS = {ORDER_CREATED}
+
+# Low-priority updates rolled into the recipient's email digest, when
+# MARKETPLACE_EMAIL_DIGEST is on
+DIGEST_EVENTS = {ORDER_CONFIRMED, ORDER_CANCELLED, ORDER_EXPIRED, ORDER_STATUS_CHANGED}
+
+# Order status after each event, pushed to both parties' event streams
+ORDER_STATUSES = {
+    ORDER_CREATED: "pending",
+    ORDER_CONFIRMED: "confirmed",
+    ORDER_CANCELLED: "cancelled",
+    ORDER_EXPIRED: "cancelled",
+}
+
+
+def order_payload(order_id, buyer_id, seller_id, product_name, **extra):
+    return {
+        "order_id": order_id,
+        "buyer_id": buyer_id,
+        "seller_id": seller_id,
+        "product_name": product_name,
+        **extra,
+    }
+
+
+def email_status(event_type):
+    """Which email, if any, an event of this type sends (see emails.py)."""
+    if event_type in EMAIL_EVENTS:
+        return OutboxEvent.EMAIL_PENDING
+    if event_type in DIGEST_EVENTS and getattr(settings, "MARKETPLACE_EMAIL_DIGEST", False):
+        return OutboxEvent.EMAIL_DIGEST
+    return ''
+
+
+def record(event_type, payload):
+    """Queue one event; call inside the transaction making the change."""
+    _publish(event_type, payload)
+    return OutboxEvent.objects.create(
+        event_type=event_type, payload=payload, email_status=email_status(event_type)
+    )
+
+
+def record_many(event_type, payloads):
+    """Queue several events of one type with a single insert."""
+    for payload in payloads:
+        _publish(event_type, payload)
+    status = email_status(event_type)
+    return OutboxEvent.objects.bulk_create([
+        OutboxEvent(event_type=event_type, payload=payload, email_status=status)
+        for payload in payloads
+    ])
+
+
+def format_message(event):
+    """(recipient id, message) for an event's notification."""
+    recipient_key, template = NOTIFICATIONS[event.event_type]
+    message = template.format(**event.payload)
+    if event.payload.get("reason"):
+        message += f": {event.payload['reason']}"
+    return event.payload[recipient_key], message
+
+
+def _publish(event_type, payload):
+    # Live status updates don't wait for the dispatcher; notifications do.
+    publish_on_commit([payload["buyer_id"], payload["seller_id"]], "order", {
+        "order_id": payload["order_id"],
+        "event": event_type,
+        "status": payload.get("status") or ORDER_STATUSES.get(event_type),
+    })
+
+
+def dispatch(batch_size=None):
+    """
+    Fan out unprocessed events, oldest first, one batch per transaction.
+
+    Each batch bulk-inserts its notifications and marks the events
+    processed in the same transaction. Emails are sent from the same rows
+    by emails.send_pending(), which tracks them separately. A crash
+    anywhere leaves the batch unprocessed, so it is retried in full:
+    delivery is at-least-once. Rows are claimed with SKIP LOCKED, so
+    several dispatchers can run side by side.
+    """
+    batch_size = batch_size or getattr(settings, "MARKETPLACE_OUTBOX_BATCH", 500)
+    started = time.monotonic()
+    dispatched = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True)
+                .order_by("id")[:batch_size]
+            )
+            if not events:
+                break
+
+            notifications = []
+            for event in events:
+                if event.event_type in NOTIFICATIONS:
+                    recipient_id, message = format_message(event)
+                    notifications.append(Notification(
+                        recipient_id=recipient_id,
+                        type=event.event_type,
+                        reference_id=event.payload.get("order_id"),
+                        message=message,
+                    ))
+                else:
+                    logger.warning(f"Outbox event {event.pk} has unknown type {event.event_type}")
+
+            notify_many(notifications)
+            OutboxEvent.objects.filter(
+                id__in=[event.pk for event in events]
+            ).update(processed_at=timezone.now())
+
+        dispatched += len(events)
+        if len(events) < batch_size:
+            break
+
+    if dispatched:
+        logger.info(f"Dispatched {dispatched} outbox events in {time.monotonic() - started:.2f}s")
+    return dispatched
+
+
+def prune(retention_days=None, batch_size=10000):
+    """
+    Delete processed events older than the retention window, in bounded
+    batches. Events whose email hasn't been sent yet are kept.
+    """
+    retention_days = retention_days or getattr(settings, "MARKETPLACE_OUTBOX_RETENTION_DAYS", 7)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        ids = list(
+            OutboxEvent.objects.filter(processed_at__lt=cutoff)
+            .exclude(email_status__in=[OutboxEvent.EMAIL_PENDING, OutboxEvent.EMAIL_DIGEST])
+            .order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        count, _ = OutboxEvent.objects.filter(id__in=ids).delete()
+        deleted += count
+        if len(ids) < batch_size:
+            break
+    return deleted
@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator, Page, PageNotAnInteger, EmptyPage, InvalidPage
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(item, ranked, field="created_at"):
+    """Build an opaque token pointing just past ``item`` in the result order."""
+    payload = {
+        "c": getattr(item, field).isoformat(),
+        "i": item.pk,
+    }
+    if ranked:
+        payload["r"] = item.rank
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (rank, created_at, id) from a token; raises ValueError if malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(payload["c"])
+        pk = int(payload["i"])
+        rank = payload.get("r")
+        if rank is not None:
+            rank = float(rank)
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+    if created_at is None:
+        raise ValueError("Invalid cursor: bad timestamp")
+    return rank, created_at, pk
+
+
+def paginate_by_cursor(queryset, cursor, page_size, field="created_at"):
+    """
+    Keyset pagination over a Product.search() queryset, or any queryset
+    ordered newest first by a timestamp field.
+
+    The queryset must be ordered by (-rank, -field, -id), or by
+    (-field, -id) when it carries no rank annotation. Instead of an
+    OFFSET the next page is selected with a seek predicate on those columns,
+    so every page costs O(page_size) regardless of depth and no COUNT(*) runs.
+
+    Returns:
+        tuple: (list of products, next cursor token or None)
+    """
+    ranked = "rank" in queryset.query.annotations
+
+    if cursor:
+        rank, created_at, pk = decode_cursor(cursor)
+        after = Q(**{f"{field}__lt": created_at}) | Q(**{field: created_at, "id__lt": pk})
+        if ranked:
+            if rank is None:
+                raise ValueError("Invalid cursor: missing rank")
+            after = Q(rank__lt=rank) | (Q(rank=rank) & after)
+        queryset = queryset.filter(after)
+
+    # One extra row tells us whether another page exists.
+    items = list(queryset[:page_size + 1])
+    if len(items) <= page_size:
+        return items, None
+
+    items = items[:page_size]
+    return items, encode_cursor(items[-1], ranked, field)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids an exact COUNT(*) on large result sets.
+
+    The total is looked up in the cache first, keyed by the SQL of the
+    queryset so each filter combination gets its own entry. On a miss the
+    PostgreSQL planner estimate is used when it is at or above
+    MARKETPLACE_COUNT_ESTIMATE_THRESHOLD; smaller sets are counted exactly.
+    ``count_is_approximate`` tells callers which one they got.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+
+        queryset = self.object_list.order_by()
+        sql, params = queryset.query.sql_with_params()
+        signature = hashlib.sha1(f"{sql}|{params!r}".encode()).hexdigest()
+        cache_key = f"paginator_count_{signature}"
+
+        cached = cache.get(cache_key)
+        if cached is not None:
+            total, self.count_is_approximate = cached
+            return total
+
+        threshold = getattr(settings, "MARKETPLACE_COUNT_ESTIMATE_THRESHOLD", 10000)
+        estimate = self.planner_estimate(queryset, sql, params)
+        if estimate is not None and estimate >= threshold:
+            total, self.count_is_approximate = estimate, True
+        else:
+            total, self.count_is_approximate = queryset.count(), False
+
+        ttl = getattr(settings, "MARKETPLACE_COUNT_CACHE_TTL", 30)
+        cache.set(cache_key, (total, self.count_is_approximate), ttl)
+        return total
+
+    def planner_estimate(self, queryset, sql, params):
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except Exception as e:
+            logger.warning(f"Count estimate failed, falling back to COUNT(*): {str(e)}")
+            return None
+
+    def validate_number(self, number):
+        # An estimated total can undercount, so don't reject pages past it;
+        # a page beyond the real end simply comes back empty.
+        if not self.count_is_approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        # Resolve the count first so validate_number sees the right mode.
+        self.count
+        return super().page(number)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """PageNumberPagination backed by EstimatedCountPaginator."""
+
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.page.paginator.count,
+            "count_is_approximate": self.page.paginator.count_is_approximate,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def paginate_slices(self, count_queryset, fetch, request):
+        """
+        Paginate when a page is read by a different query than the total.
+
+        count_queryset only supplies the count; fetch(offset, limit) returns
+        the page's rows. For page queries that can't simply be sliced, such as
+        a UNION that needs its limit pushed into each branch.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(count_queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+
+        offset = (number - 1) * page_size
+        self.page = Page(list(fetch(offset, page_size)), number, paginator)
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count_is_approximate"] = {"type": "boolean"}
+        return schema
@@ -0,0 +1,90 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import outbox
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Expires one batch of pending orders in a single statement. SKIP LOCKED lets
+# the reaper pass over orders a seller is confirming right now; the outer
+# status check catches any that changed before the UPDATE reached them.
+EXPIRE_BATCH_SQL = """
+    UPDATE marketplace_order
+    SET status = 'cancelled', reserved_until = NULL, updated_at = %s
+    WHERE status = 'pending'
+      AND id IN (
+          SELECT id FROM marketplace_order
+          WHERE status = 'pending' AND reserved_until < %s{scope}
+          ORDER BY reserved_until
+          LIMIT %s
+          {lock}
+      )
+    RETURNING id, product_id, quantity, buyer_id, seller_id
+"""
+
+
+def reservation_deadline():
+    """When a pending order placed now stops holding its stock."""
+    minutes = getattr(settings, "MARKETPLACE_RESERVATION_MINUTES", 48 * 60)
+    return timezone.now() + timedelta(minutes=minutes)
+
+
+def release_expired_reservations(batch_size=None, max_batches=None, product_ids=None):
+    """
+    Cancel pending orders whose reservation has expired and return their stock,
+    only for orders of product_ids if given.
+
+    Each batch is one transaction: one UPDATE expires up to batch_size orders,
+    one UPDATE returns their stock per product (re-enabling is_available), and
+    one outbox insert queues the buyer notifications. Returns the number of
+    orders expired.
+    """
+    batch_size = batch_size or getattr(settings, "MARKETPLACE_RESERVATION_REAPER_BATCH", 1000)
+    lock = "FOR UPDATE SKIP LOCKED" if connection.vendor == "postgresql" else ""
+    scope = ""
+    scope_params = []
+    if product_ids is not None:
+        scope_params = sorted(set(product_ids))
+        if not scope_params:
+            return 0
+        scope = f" AND product_id IN ({', '.join(['%s'] * len(scope_params))})"
+    sql = EXPIRE_BATCH_SQL.format(lock=lock, scope=scope)
+
+    started = time.monotonic()
+    expired = batches = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [now, now, *scope_params, batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                break
+
+            Product.release_stock_bulk(
+                (order_id, product_id, quantity) for order_id, product_id, quantity, _, _ in rows
+            )
+
+            outbox.record_many(outbox.ORDER_EXPIRED, [
+                outbox.order_payload(order_id, buyer_id, seller_id, None)
+                for order_id, _, _, buyer_id, seller_id in rows
+            ])
+
+        expired += len(rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+
+    if expired:
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Expired {expired} pending orders in {batches} batches, {elapsed:.2f}s "
+            f"({expired / elapsed if elapsed > 0 else 0:.0f} orders/s)"
+        )
+    return expired
@@ -0,0 +1,104 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ProductView, RollupWatermark
+from .view_counter import LOCK_KEY as VIEW_FLUSH_LOCK_KEY
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "product_view_daily"
+
+# Recomputes every (product, day) touched by views in (low, high] from the raw
+# rows, so unique_users stays exact when a day is rolled up in several passes.
+ROLLUP_SQL = """
+    WITH touched AS (
+        SELECT DISTINCT product_id, (viewed_at AT TIME ZONE 'UTC')::date AS day
+        FROM marketplace_productview
+        WHERE id > %s AND id <= %s
+    )
+    INSERT INTO marketplace_productviewdaily (product_id, day, views, unique_users)
+    SELECT v.product_id, t.day, COUNT(*), COUNT(DISTINCT v.user_id)
+    FROM touched t
+    JOIN marketplace_productview v
+      ON v.product_id = t.product_id
+     AND v.viewed_at >= t.day::timestamp AT TIME ZONE 'UTC'
+     AND v.viewed_at < (t.day + 1)::timestamp AT TIME ZONE 'UTC'
+    GROUP BY v.product_id, t.day
+    ON CONFLICT (product_id, day)
+    DO UPDATE SET views = EXCLUDED.views, unique_users = EXCLUDED.unique_users
+"""
+
+
+def rollup_product_views(batch_size=None):
+    """
+    Fold ProductView rows newer than the watermark into ProductViewDaily.
+
+    Works through the new rows in primary-key windows, advancing the watermark
+    in the same transaction as each window's upsert. Holds the view flush lock
+    so no ProductView insert can commit an id below the watermark behind it.
+    """
+    batch_size = batch_size or getattr(settings, "MARKETPLACE_VIEW_ROLLUP_BATCH", 50000)
+    if not cache.add(VIEW_FLUSH_LOCK_KEY, True, 300):
+        logger.info("Product view flush running; rollup deferred")
+        return 0
+
+    started = time.monotonic()
+    processed = 0
+    try:
+        watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+        high = ProductView.objects.aggregate(high=Max("id"))["high"] or 0
+        low = watermark.last_id
+        while low < high:
+            upper = min(low + batch_size, high)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(ROLLUP_SQL, [low, upper])
+                RollupWatermark.objects.filter(name=WATERMARK_NAME).update(last_id=upper)
+            processed += upper - low
+            low = upper
+    finally:
+        cache.delete(VIEW_FLUSH_LOCK_KEY)
+
+    if processed:
+        logger.info(f"Rolled up product views up to id {high} in {time.monotonic() - started:.2f}s")
+    return processed
+
+
+def prune_product_views(retention_days=None, batch_size=None):
+    """
+    Delete raw ProductView rows older than the retention window.
+
+    Rows are deleted in bounded batches, each its own short transaction, and
+    only once the rollup has processed them.
+    """
+    retention_days = retention_days or getattr(settings, "MARKETPLACE_VIEW_RETENTION_DAYS", 90)
+    batch_size = batch_size or getattr(settings, "MARKETPLACE_VIEW_PRUNE_BATCH", 10000)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    if watermark is None:
+        return 0
+
+    deleted = 0
+    while True:
+        ids = list(
+            ProductView.objects.filter(
+                viewed_at__lt=cutoff, id__lte=watermark.last_id
+            ).order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        count, _ = ProductView.objects.filter(id__in=ids).delete()
+        deleted += count
+        if len(ids) < batch_size:
+            break
+
+    if deleted:
+        logger.info(f"Pruned {deleted} product views older than {retention_days} days")
+    return deleted
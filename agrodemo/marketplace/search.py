@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Weighted document used for Product.search_vector. Keep in sync with the
+# trigger function installed by migration 0004_product_search_vector_trigger.
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english', COALESCE(p.name, '')), 'A') ||
+    setweight(to_tsvector('english', COALESCE(p.description, '')), 'B') ||
+    setweight(to_tsvector('english', COALESCE(c.name, '')), 'C')
+"""
+
+# Session flag read by the trigger. While it is 'on' the trigger only clears
+# search_vector so bulk loads don't pay for to_tsvector row by row.
+DEFER_SETTING = "marketplace.defer_search_vector"
+
+REFRESH_PENDING_SQL = f"""
+    UPDATE marketplace_product AS p
+    SET search_vector = {SEARCH_VECTOR_SQL}
+    FROM marketplace_category AS c
+    WHERE c.id = p.category_id AND p.search_vector IS NULL
+"""
+
+# Used by the reindex_search command; one statement per primary-key window.
+REINDEX_RANGE_SQL = f"""
+    UPDATE marketplace_product AS p
+    SET search_vector = {SEARCH_VECTOR_SQL}
+    FROM marketplace_category AS c
+    WHERE c.id = p.category_id AND p.id >= %s AND p.id < %s
+"""
+
+
+@contextmanager
+def deferred_search_vector(using=DEFAULT_DB_ALIAS):
+    """
+    Defer search_vector maintenance for bulk loads.
+
+    Inside the block save(), bulk_create() and QuerySet.update() write each
+    product row once with an empty search_vector. On exit the pending rows
+    are indexed with a single set-based UPDATE in the same transaction.
+
+    Usage:
+        with deferred_search_vector():
+            Product.objects.bulk_create(products)
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        yield
+        return
+
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config(%s, 'on', true)", [DEFER_SETTING])
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config(%s, 'off', true)", [DEFER_SETTING])
+            cursor.execute(REFRESH_PENDING_SQL)
+            logger.info(f"Indexed {cursor.rowcount} deferred products")
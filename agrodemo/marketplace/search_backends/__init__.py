@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = "marketplace.search_backends.postgres.PostgresSearchBackend"
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the backend configured by MARKETPLACE_SEARCH_BACKEND (one per process)."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "MARKETPLACE_SEARCH_BACKEND", DEFAULT_BACKEND)
+        _backend = import_string(path)()
+    return _backend
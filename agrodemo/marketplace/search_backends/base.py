@@ -0,0 +1,25 @@
+class BaseSearchBackend:
+    """
+    Interface for Product.search() backends.
+
+    search() receives the already-filtered product queryset and must return
+    it narrowed to matches, annotated with a float ``rank`` (relevance blended
+    with popularity_score via popularity.blend_popularity) and ordered by
+    (-rank, -created_at, -id) so cursor pagination keeps working.
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def product_saved(self, product):
+        """Called after a product's searchable fields change."""
+
+    def product_deleted(self, product_id):
+        """Called after a product is deleted."""
+
+    def category_saved(self, category):
+        """Called after a category is saved (e.g. renamed)."""
+
+    def rebuild(self):
+        """Rebuild the backend's index for every product."""
+        raise NotImplementedError
@@ -0,0 +1,471 @@
+import array
+import atexit
+import fcntl
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from ..popularity import blend_popularity
+from .base import BaseSearchBackend
+
+logger = logging.getLogger(__name__)
+
+# Same A/B/C weighting as the PostgreSQL search_vector (ts_rank defaults).
+FIELD_WEIGHTS = (("name", 1.0), ("description", 0.4), ("category", 0.2))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have in is it its of on or that
+    the this to was were will with
+""".split())
+
+MAGIC = b"BM25IDX1"
+HEADER = struct.Struct("<8sQ")
+
+
+def stem(token):
+    """Very small English plural stemmer; enough to match "tomatoes" to "tomato"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes", "oes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [stem(t) for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def document_terms(name, description, category_name):
+    """Return ({term: weighted term frequency}, weighted document length)."""
+    terms = {}
+    length = 0.0
+    for text, (field, weight) in zip((name, description, category_name), FIELD_WEIGHTS):
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0.0) + weight
+            length += weight
+    return terms, length
+
+
+def write_segment(path, postings, doc_lens):
+    """
+    Write an immutable index segment and atomically replace ``path``.
+
+    Layout: magic, header length, JSON header (lexicon and counts), padding
+    to 8 bytes, then posting doc ids (int64), document ids (int64), posting
+    term frequencies (float32) and document lengths (float32). Arrays use the
+    machine's native byte order; the file is a local cache, not an exchange
+    format.
+    """
+    terms = []
+    post_ids = []
+    post_tfs = []
+    for term in sorted(postings):
+        entries = sorted(postings[term].items())
+        terms.append([term, len(post_ids), len(entries)])
+        post_ids.extend(doc for doc, tf in entries)
+        post_tfs.extend(tf for doc, tf in entries)
+
+    doc_ids = sorted(doc_lens)
+    header = json.dumps({
+        "terms": terms,
+        "postings": len(post_ids),
+        "docs": len(doc_ids),
+        "total_len": sum(doc_lens.values()),
+    }).encode()
+    data_offset = HEADER.size + len(header)
+    padding = -data_offset % 8
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, len(header)))
+        fh.write(header)
+        fh.write(b"\0" * padding)
+        array.array("q", post_ids).tofile(fh)
+        array.array("q", doc_ids).tofile(fh)
+        array.array("f", post_tfs).tofile(fh)
+        array.array("f", (doc_lens[d] for d in doc_ids)).tofile(fh)
+    os.replace(tmp_path, path)
+
+
+class IndexSegment:
+    """Read-only, memory-mapped view of a segment written by write_segment()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, "rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_len = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a BM25 index segment")
+        header = json.loads(self._mmap[HEADER.size:HEADER.size + header_len])
+        offset = HEADER.size + header_len
+        offset += -offset % 8
+
+        view = memoryview(self._mmap)
+        n_post, n_docs = header["postings"], header["docs"]
+        sections = []
+        for fmt, size, count in (("q", 8, n_post), ("q", 8, n_docs), ("f", 4, n_post), ("f", 4, n_docs)):
+            sections.append(view[offset:offset + size * count].cast(fmt))
+            offset += size * count
+        self.post_ids, doc_ids, self.post_tfs, doc_lens = sections
+
+        self.lexicon = {term: (start, count) for term, start, count in header["terms"]}
+        self.doc_len = dict(zip(doc_ids, doc_lens))
+        self.total_len = header["total_len"]
+
+    def postings(self, term):
+        start, count = self.lexicon.get(term, (0, 0))
+        return zip(self.post_ids[start:start + count], self.post_tfs[start:start + count])
+
+
+class BM25Index:
+    """
+    BM25 inverted index: a memory-mapped base segment plus an update log.
+
+    Saves and deletes are appended to ``<path>.log`` and applied to an
+    in-memory overlay that shadows the base segment for the documents it
+    contains. Every process replays the log on open and picks up other
+    processes' appends in maybe_reload(), so all workers see the same index
+    and an update survives the process that made it. Once the overlay holds
+    ``flush_every`` documents it is merged with the base into a new segment
+    and the log is emptied.
+
+    Writers append under a shared file lock; flush() and replace_all() take
+    it exclusively, so no append can fall between a merge and the truncate.
+    """
+
+    def __init__(self, path, k1=1.2, b=0.75, flush_every=200):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.k1 = k1
+        self.b = b
+        self.flush_every = flush_every
+        self.lock = threading.RLock()
+        self.segment = None
+        self.overlay = {}             # doc id -> (terms, length), or None if deleted
+        self.overlay_postings = {}    # term -> {doc id: tf}
+        self.doc_count = 0
+        self.total_len = 0.0
+        self._log_offset = 0
+        self._last_stat = 0.0
+        with self.lock, self._file_lock(shared=True):
+            self._sync()
+
+    @property
+    def is_empty(self):
+        # Without a segment the log alone is an incomplete index
+        return self.segment is None
+
+    def _recount(self):
+        count, total = 0, 0.0
+        if self.segment is not None:
+            count, total = len(self.segment.doc_len), self.segment.total_len
+            for doc in self.overlay:
+                if doc in self.segment.doc_len:
+                    count -= 1
+                    total -= self.segment.doc_len[doc]
+        for entry in self.overlay.values():
+            if entry is not None:
+                count += 1
+                total += entry[1]
+        self.doc_count, self.total_len = count, total
+
+    def _sync(self):
+        """Catch up with the segment and log on disk. Call holding a file lock."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        try:
+            log_size = os.stat(self.log_path).st_size
+        except FileNotFoundError:
+            log_size = 0
+        # A new segment always comes with an emptied log, so start over
+        if mtime != (self.segment.mtime if self.segment else None) or log_size < self._log_offset:
+            self.segment = IndexSegment(self.path) if mtime is not None else None
+            self.overlay.clear()
+            self.overlay_postings.clear()
+            self._log_offset = 0
+        if log_size > self._log_offset:
+            self._replay()
+        self._recount()
+
+    def _replay(self):
+        with open(self.log_path, "rb") as fh:
+            fh.seek(self._log_offset)
+            data = fh.read()
+        # Leave a line still being written for the next sync
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping corrupt line in {self.log_path}")
+                continue
+            self._apply(entry)
+        self._log_offset += end
+
+    def _apply(self, entry):
+        doc = entry["d"]
+        self._drop_overlay_postings(doc)
+        if "t" not in entry:
+            self.overlay[doc] = None
+            return
+        self.overlay[doc] = (entry["t"], entry["l"])
+        for term, tf in entry["t"].items():
+            self.overlay_postings.setdefault(term, {})[doc] = tf
+
+    def maybe_reload(self, interval=5):
+        """Pick up segments and log entries written by other processes."""
+        now = time.monotonic()
+        if now - self._last_stat < interval:
+            return
+        self._last_stat = now
+        with self.lock, self._file_lock(shared=True):
+            self._sync()
+
+    def _drop_overlay_postings(self, doc):
+        previous = self.overlay.get(doc)
+        if previous:
+            for term in previous[0]:
+                docs = self.overlay_postings.get(term)
+                if docs is not None:
+                    docs.pop(doc, None)
+                    if not docs:
+                        del self.overlay_postings[term]
+
+    def _append(self, entries):
+        data = b"".join(
+            json.dumps(entry, separators=(",", ":")).encode() + b"\n" for entry in entries
+        )
+        if not data:
+            return
+        with self.lock:
+            with self._file_lock(shared=True):
+                fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+                self._sync()
+            if len(self.overlay) >= self.flush_every:
+                self.flush()
+
+    def upsert(self, doc, terms, length):
+        self._append([{"d": doc, "t": terms, "l": length}])
+
+    def upsert_many(self, documents):
+        """Upsert an iterable of (doc id, terms, length) with a single log write."""
+        self._append([{"d": doc, "t": terms, "l": length} for doc, terms, length in documents])
+
+    def delete(self, doc):
+        self._append([{"d": doc}])
+
+    def _doc_len(self, doc):
+        entry = self.overlay.get(doc)
+        if entry is not None:
+            return entry[1]
+        return self.segment.doc_len[doc]
+
+    def search(self, query):
+        """Return {doc id: score} for every document matching query."""
+        terms = set(tokenize(query))
+        with self.lock:
+            if not terms or not self.doc_count:
+                return {}
+            avgdl = self.total_len / self.doc_count or 1.0
+            k1, b = self.k1, self.b
+
+            scores = {}
+            for term in terms:
+                postings = []
+                if self.segment is not None:
+                    postings.extend(
+                        (doc, tf) for doc, tf in self.segment.postings(term)
+                        if doc not in self.overlay
+                    )
+                postings.extend(self.overlay_postings.get(term, {}).items())
+                if not postings:
+                    continue
+
+                df = len(postings)
+                idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+                for doc, tf in postings:
+                    norm = k1 * (1 - b + b * self._doc_len(doc) / avgdl)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        return scores
+
+    def _file_lock(self, shared=False):
+        # Serializes segment writers against each other and against log
+        # appends, across processes; released when the returned file closes.
+        fh = open(f"{self.path}.lock", "a")
+        fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return fh
+
+    def _reset(self):
+        # The new segment covers everything in the log
+        open(self.log_path, "wb").close()
+        self.overlay.clear()
+        self.overlay_postings.clear()
+        self._log_offset = 0
+        self.segment = IndexSegment(self.path)
+        self._recount()
+
+    def flush(self):
+        """Merge the log into a new on-disk segment."""
+        with self.lock, self._file_lock():
+            # Merge the latest segment and every process's updates, not
+            # just this process's view of them.
+            self._sync()
+            if not self.overlay:
+                return
+            postings = {}
+            doc_lens = {}
+            if self.segment is not None:
+                for term in self.segment.lexicon:
+                    for doc, tf in self.segment.postings(term):
+                        if doc not in self.overlay:
+                            postings.setdefault(term, {})[doc] = tf
+                doc_lens = {
+                    doc: length for doc, length in self.segment.doc_len.items()
+                    if doc not in self.overlay
+                }
+            for doc, entry in self.overlay.items():
+                if entry is None:
+                    continue
+                terms, length = entry
+                doc_lens[doc] = length
+                for term, tf in terms.items():
+                    postings.setdefault(term, {})[doc] = tf
+
+            # A crash before the log is emptied only replays it onto the
+            # new segment, which changes nothing.
+            write_segment(self.path, postings, doc_lens)
+            self._reset()
+
+    def replace_all(self, documents):
+        """Write a fresh segment from an iterable of (doc id, terms, length)."""
+        postings = {}
+        doc_lens = {}
+        for doc, terms, length in documents:
+            doc_lens[doc] = length
+            for term, tf in terms.items():
+                postings.setdefault(term, {})[doc] = tf
+        with self.lock, self._file_lock():
+            write_segment(self.path, postings, doc_lens)
+            self._reset()
+
+
+class BM25SearchBackend(BaseSearchBackend):
+    """
+    In-process BM25 search for deployments without PostgreSQL full-text search.
+
+    Products are indexed on name, description and category name with the
+    same A/B/C weights as search_vector. The index is built from the database
+    on first use (or when the segment file is missing), kept current from the
+    save/delete signals once their transaction commits, and persisted to
+    MARKETPLACE_BM25_INDEX_PATH and its update log. Writes that bypass signals (bulk_create,
+    QuerySet.update) need ``manage.py reindex_search`` afterwards.
+    """
+
+    def __init__(self, index_path=None):
+        self.index = BM25Index(
+            index_path or getattr(
+                settings, "MARKETPLACE_BM25_INDEX_PATH",
+                os.path.join(settings.BASE_DIR, "search_index.bm25"),
+            ),
+            flush_every=getattr(settings, "MARKETPLACE_BM25_FLUSH_EVERY", 200),
+        )
+        self.max_results = getattr(settings, "MARKETPLACE_BM25_MAX_RESULTS", 500)
+        atexit.register(self.index.flush)
+
+    def search(self, queryset, query):
+        self.index.maybe_reload()
+        if self.index.is_empty:
+            self.rebuild()
+
+        scores = self.index.search(query)
+        if not scores:
+            return queryset.none()
+
+        # Every match is returned, so counts and deep pages are complete; only
+        # the best max_results carry their BM25 score into the CASE; the rest
+        # score 0 and order by popularity and recency. IDs and scores are
+        # numbers we computed, so they are inlined as literals to keep the
+        # statement within SQLite's bound-parameter limit.
+        scored = heapq.nlargest(self.max_results, scores.items(), key=lambda item: item[1])
+        if len(scores) > self.max_results:
+            logger.info(
+                f"BM25 search {query!r} matched {len(scores)} products; "
+                f"ranking the top {self.max_results} by relevance"
+            )
+        qn = connections[queryset.db].ops.quote_name
+        column = f"{qn(queryset.model._meta.db_table)}.{qn('id')}"
+        cases = " ".join(f"WHEN {int(pk)} THEN {float(score)!r}" for pk, score in scored)
+        rank = RawSQL(f"CASE {column} {cases} ELSE 0.0 END", [], output_field=FloatField())
+        matches = RawSQL(", ".join(str(int(pk)) for pk in scores), [])
+
+        return queryset.filter(
+            id__in=matches
+        ).annotate(rank=blend_popularity(rank)).order_by('-rank', '-created_at', '-id')
+
+    def product_saved(self, product):
+        from ..models import Category, Product
+
+        # Callers (serializers, admin) normally assign the category object;
+        # fall back to fetching just its name rather than the whole row.
+        if Product.category.is_cached(product):
+            category_name = product.category.name
+        else:
+            category_name = Category.objects.filter(
+                pk=product.category_id
+            ).values_list("name", flat=True).first()
+        pk = product.pk
+        terms, length = document_terms(product.name, product.description, category_name)
+        # Only committed saves reach the index; a rolled-back one never does
+        transaction.on_commit(lambda: self.index.upsert(pk, terms, length))
+
+    def product_deleted(self, product_id):
+        transaction.on_commit(lambda: self.index.delete(product_id))
+
+    def category_saved(self, category):
+        documents = [
+            (product.pk, *document_terms(product.name, product.description, category.name))
+            for product in category.products.only("id", "name", "description")
+        ]
+        transaction.on_commit(lambda: self.index.upsert_many(documents))
+
+    def rebuild(self):
+        from ..models import Product
+
+        started = time.monotonic()
+        rows = Product.objects.values_list(
+            "id", "name", "description", "category__name"
+        ).iterator(chunk_size=2000)
+        self.index.replace_all(
+            (pk, *document_terms(name, description, category_name))
+            for pk, name, description, category_name in rows
+        )
+        logger.info(
+            f"BM25 index rebuilt: {self.index.doc_count} products in "
+            f"{time.monotonic() - started:.2f}s"
+        )
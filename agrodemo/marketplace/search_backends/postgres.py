@@ -0,0 +1,51 @@
+from django.contrib.postgres.search import SearchRank, SearchQuery, TrigramSimilarity
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from ..popularity import blend_popularity
+from .base import BaseSearchBackend
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full-text search over Product.search_vector.
+
+    The vector is maintained by database triggers, so the save/delete hooks
+    are no-ops. On other databases this falls back to unranked icontains.
+    """
+
+    def search(self, queryset, query):
+        # Full-text search and trigram matching need PostgreSQL
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=query) |
+                Q(description__icontains=query) |
+                Q(category__name__icontains=query)
+            ).order_by('-created_at', '-id')
+
+        search_query = SearchQuery(query)
+        matches = queryset.annotate(
+            rank=blend_popularity(SearchRank('search_vector', search_query))
+        ).filter(
+            search_vector=search_query
+        ).order_by('-rank', '-created_at', '-id')
+
+        # Typo-tolerant fallback ("tomatos", "maze") when nothing matches the
+        # full-text query. Both branches are served by GIN indexes.
+        if not matches.exists():
+            matches = queryset.filter(
+                Q(name__trigram_similar=query) |
+                Q(category__name__trigram_similar=query)
+            ).annotate(
+                rank=blend_popularity(Greatest(
+                    TrigramSimilarity('name', query),
+                    TrigramSimilarity('category__name', query),
+                ))
+            ).order_by('-rank', '-created_at', '-id')
+
+        return matches
+
+    def rebuild(self):
+        from django.core.management import call_command
+        call_command("reindex_search", restart=True)
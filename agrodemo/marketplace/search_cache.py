@@ -0,0 +1,84 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_utils import incr
+
+VERSION_KEY = "search_cache_version"
+HITS_KEY = "search_cache_hits"
+MISSES_KEY = "search_cache_misses"
+
+# Product fields that can change which products match a search or their
+# order. Saves limited to other fields (e.g. the views counter) leave the
+# cached results valid.
+SEARCH_FIELDS = {
+    "name", "description", "category", "category_id", "price",
+    "is_available", "created_at", "popularity_score",
+}
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old
+        # namespace whose entries may still be in the cache.
+        cache.add(VERSION_KEY, int(time.time()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Invalidate every cached search result by moving to a new namespace."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
+
+
+def result_key(query, filters, page_size, page=None, cursor=None):
+    signature = "|".join([
+        normalize_query(query),
+        str(filters.get("category", "")),
+        str(filters.get("min_price", "")),
+        str(filters.get("max_price", "")),
+        str(filters.get("sort", "")),
+        str(page_size),
+        f"c:{cursor}" if cursor is not None else f"p:{page}",
+    ])
+    digest = hashlib.sha1(signature.encode()).hexdigest()
+    return f"search_results_{get_version()}_{digest}"
+
+
+def get_results(key):
+    """Return the cached ``{"ids": [...], "meta": {...}}`` entry, counting hits and misses."""
+    entry = cache.get(key)
+    incr(HITS_KEY if entry is not None else MISSES_KEY)
+    return entry
+
+
+def set_results(key, ids, meta):
+    ttl = getattr(settings, "MARKETPLACE_SEARCH_CACHE_TTL", 120)
+    cache.set(key, {"ids": ids, "meta": meta}, ttl)
+
+
+def get_stats():
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        "version": cache.get(VERSION_KEY),
+        "ttl": getattr(settings, "MARKETPLACE_SEARCH_CACHE_TTL", 120),
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Product, Category, ProductImage, Order
+from . import inventory
+from .models import Product, Category, ProductImage, Order, Notification
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.contrib.auth import get_user_model
@@ -145,6 +146,18 @@ class ProductSerializer(serializers.ModelSerializer):
 
         return data
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Most of a sharded product's stock lives in its shards; list views
+        # prefetch them (prefetch_related("shards")) to avoid a query per row
+        if instance.stock_shards:
+            if "shards" in getattr(instance, "_prefetched_objects_cache", {}):
+                stock = instance.stock + sum(shard.stock for shard in instance.shards.all())
+            else:
+                stock = inventory.available_stock([instance.id])[instance.id]
+            data["stock"] = self.fields["stock"].to_representation(stock)
+        return data
+
     def create(self, validated_data):
         # category is already in validated_data due to 'source' in category_id
         product = Product.objects.create(**validated_data)
@@ -154,8 +167,14 @@ class ProductSerializer(serializers.ModelSerializer):
         # Handle images separately
         images_data = validated_data.pop("images", [])
 
+        # A sharded product's stock is re-split across its shards
+        stock = validated_data.pop("stock", None) if instance.stock_shards else None
+
         # Update the product instance
         instance = super().update(instance, validated_data)
+        if stock is not None:
+            inventory.set_total_stock(instance.id, stock)
+            instance.refresh_from_db(fields=["stock", "is_available"])
 
         # Update or create images
         for image_data in images_data:
@@ -184,10 +203,11 @@ class OrderSerializer(serializers.ModelSerializer):
             "quantity",
             "total_price",
             "status",
+            "reserved_until",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["total_price", "status"]
+        read_only_fields = ["total_price", "status", "reserved_until"]
 
     def validate(self, data):
         logger.debug(f"Validating order data: {data}")
@@ -223,9 +243,12 @@ class OrderSerializer(serializers.ModelSerializer):
                     {"product_id": "Product is not available"}
                 )
 
-            if quantity > product.stock:
+            available = product.stock
+            if product.stock_shards:
+                available = inventory.available_stock([product.id])[product.id]
+            if quantity > available:
                 raise serializers.ValidationError(
-                    {"quantity": f"Only {product.stock} units available"}
+                    {"quantity": f"Only {available} units available"}
                 )
 
             # Store product instance for later use
@@ -235,3 +258,10 @@ class OrderSerializer(serializers.ModelSerializer):
         except Exception as e:
             logger.error(f"Validation error in OrderSerializer: {str(e)}")
             raise
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ["id", "type", "reference_id", "message", "timestamp", "is_read"]
+        read_only_fields = fields
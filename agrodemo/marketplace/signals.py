@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Category
+from .search_cache import SEARCH_FIELDS, bump_version
+from . import suggest
+from .search_backends import get_search_backend
+
+
+# Cache versions are bumped only once the write commits; bumping earlier
+# lets a concurrent search cache pre-commit results under the new version.
+@receiver(post_save, sender=Product)
+def invalidate_search_on_product_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(bump_version)
+    suggest.mark_product_changed(instance)
+    get_search_backend().product_saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_search_on_product_delete(sender, instance, **kwargs):
+    transaction.on_commit(bump_version)
+    suggest.mark_product_changed(instance)
+    get_search_backend().product_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_search_on_category_save(sender, instance, **kwargs):
+    transaction.on_commit(bump_version)
+    suggest.mark_categories_changed()
+    get_search_backend().category_saved(instance)
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_search_on_category_delete(sender, instance, **kwargs):
+    transaction.on_commit(bump_version)
+    suggest.mark_categories_changed()
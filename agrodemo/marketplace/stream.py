@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from . import notifications
+from .events import format_event, get_broker
+
+logger = logging.getLogger(__name__)
+
+
+def _user_from_token(token):
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(token))
+    except (InvalidToken, TokenError):
+        return None
+
+
+async def _authenticate(request):
+    # EventSource can't send an Authorization header, so a JWT may come in
+    # ?token=; same-origin clients can rely on their session instead.
+    token = request.GET.get("token")
+    if token:
+        return await sync_to_async(_user_from_token)(token)
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def event_stream(request):
+    """
+    Server-sent events for the signed-in user: "notification" for each new
+    notification and "order" for each status change of an order they buy or
+    sell.
+
+    Each open stream costs one coroutine and a bounded queue, so one worker
+    can hold thousands. A comment line is sent every
+    MARKETPLACE_SSE_HEARTBEAT seconds to keep proxies from timing the
+    connection out. Streams close after MARKETPLACE_SSE_MAX_AGE seconds and
+    the browser reconnects, which re-checks the token.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    broker = get_broker()
+    if len(broker) >= getattr(settings, "MARKETPLACE_SSE_MAX_CONNECTIONS", 10000):
+        return JsonResponse({"error": "Too many open streams, retry later"}, status=503)
+    if broker.subscriber_count(user.id) >= getattr(settings, "MARKETPLACE_SSE_MAX_PER_USER", 5):
+        return JsonResponse({"error": "Too many open streams for this user"}, status=429)
+
+    heartbeat = getattr(settings, "MARKETPLACE_SSE_HEARTBEAT", 15)
+    max_age = getattr(settings, "MARKETPLACE_SSE_MAX_AGE", 10 * 60)
+    queue = asyncio.Queue(maxsize=getattr(settings, "MARKETPLACE_SSE_QUEUE_SIZE", 100))
+
+    async def stream():
+        deadline = time.monotonic() + max_age
+        # Subscribed inside the generator, so the finally below releases it
+        # whatever fails, and a response that is never read never subscribes.
+        # Before the unread count, so nothing created in between is missed.
+        subscription = broker.subscribe(user.id, asyncio.get_running_loop(), queue)
+        try:
+            unread = await sync_to_async(notifications.unread_count)(user.id)
+            yield f"retry: {heartbeat * 1000}\n"
+            yield format_event("ready", {"unread_count": unread})
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.get(), timeout=min(heartbeat, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield message
+        finally:
+            # Also runs when the client disconnects and the response is cancelled
+            broker.unsubscribe(subscription)
+            if subscription.dropped:
+                logger.info(
+                    f"Event stream for user {user.id} dropped {subscription.dropped} "
+                    f"events for a slow client"
+                )
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,227 @@
+import heapq
+import logging
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Lower, Trim
+
+from .cache_utils import CacheQueue
+from .models import Product, Category
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "suggest_index_snapshot"
+VERSION_KEY = "suggest_index_version"
+CATEGORIES_DIRTY_KEY = "suggest_categories_dirty"
+
+# Names of products saved since the last refresh_suggestion_index run.
+pending_names = CacheQueue("suggest_pending")
+
+# Process-local copy of the shared index and when we last checked its version.
+_local_index = None
+_last_checked = 0.0
+
+
+def normalize_term(text):
+    # Must match Trim(Lower("name")) used by refresh_index().
+    return text.strip().lower()
+
+
+class SuggestionIndex:
+    """
+    Immutable prefix index over product and category names.
+
+    Terms are kept in a sorted list of (term, kind) tuples so a prefix is a
+    contiguous range found with bisect. Prefixes of up to SHORT_PREFIX
+    characters match too much of the catalog to scan per keystroke, so their
+    top results are precomputed when the index is built.
+    """
+
+    SHORT_PREFIX = 2
+
+    def __init__(self, entries, version):
+        # entries: {(term, kind): (display, weight)}
+        self.entries = entries
+        self.version = version
+        self.terms = sorted(entries)
+        self.max_results = getattr(settings, "MARKETPLACE_SUGGEST_MAX_RESULTS", 20)
+        self.short = self._precompute_short_prefixes()
+
+    def _precompute_short_prefixes(self):
+        heaps = {}
+        for key, (display, weight) in self.entries.items():
+            term = key[0]
+            for length in range(1, min(self.SHORT_PREFIX, len(term)) + 1):
+                heap = heaps.setdefault(term[:length], [])
+                item = (weight, key)
+                if len(heap) < self.max_results:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        return {
+            prefix: [key for weight, key in sorted(heap, reverse=True)]
+            for prefix, heap in heaps.items()
+        }
+
+    def suggest(self, prefix, limit):
+        prefix = normalize_term(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, self.max_results)
+
+        if len(prefix) <= self.SHORT_PREFIX:
+            keys = self.short.get(prefix, [])[:limit]
+        else:
+            matches = []
+            start = bisect_left(self.terms, (prefix,))
+            for key in self.terms[start:]:
+                if not key[0].startswith(prefix):
+                    break
+                matches.append(key)
+            keys = heapq.nlargest(limit, matches, key=lambda k: self.entries[k][1])
+
+        return [
+            {"text": self.entries[key][0], "type": key[1], "weight": self.entries[key][1]}
+            for key in keys
+        ]
+
+    def updated(self, changes, version):
+        """Return a new index with ``changes`` applied; a weight of 0 removes a term."""
+        entries = dict(self.entries)
+        for key, value in changes.items():
+            if value[1] > 0:
+                entries[key] = value
+            else:
+                entries.pop(key, None)
+        return SuggestionIndex(entries, version)
+
+
+def product_terms(queryset):
+    """{(term, "product"): (display, weight)} weighted by listings and views."""
+    entries = {}
+    rows = queryset.values("name").annotate(
+        listings=Count("id"), total_views=Sum("views")
+    ).order_by()
+    for row in rows.iterator():
+        key = (normalize_term(row["name"]), "product")
+        weight = row["listings"] + (row["total_views"] or 0)
+        display, current = entries.get(key, (row["name"], 0))
+        entries[key] = (display, current + weight)
+    return entries
+
+
+def category_terms():
+    """{(term, "category"): (display, weight)} weighted by available listings."""
+    rows = Category.objects.annotate(
+        listings=Count("products", filter=Q(products__is_available=True))
+    ).values("name", "listings")
+    return {
+        (normalize_term(row["name"]), "category"): (row["name"], row["listings"])
+        for row in rows
+    }
+
+
+def publish(index):
+    cache.set(SNAPSHOT_KEY, (index.version, index.entries), None)
+    cache.set(VERSION_KEY, index.version, None)
+    global _local_index
+    _local_index = index
+
+
+def rebuild_index():
+    """Rebuild the whole index from the database and publish it."""
+    started = time.monotonic()
+    pending_names.drain()
+    cache.delete(CATEGORIES_DIRTY_KEY)
+
+    entries = product_terms(Product.objects.filter(is_available=True))
+    entries.update(category_terms())
+    index = SuggestionIndex(entries, version=time.time_ns())
+    publish(index)
+    logger.info(
+        f"Suggestion index rebuilt: {len(entries)} terms in {time.monotonic() - started:.2f}s"
+    )
+    return index
+
+
+def refresh_index(batch_size=10000):
+    """
+    Fold recently saved products into the published index.
+
+    Only the terms named in the pending queue are re-aggregated, with one
+    grouped query. Terms left behind by renames age out at the next full
+    rebuild.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        return rebuild_index()
+    version, entries = snapshot
+    if _local_index is not None and _local_index.version == version:
+        index = _local_index
+    else:
+        index = SuggestionIndex(entries, version)
+
+    names = pending_names.drain(batch_size)
+    categories_dirty = cache.get(CATEGORIES_DIRTY_KEY)
+    if not names and not categories_dirty:
+        return index
+
+    changes = {}
+    if names:
+        terms = {normalize_term(name) for name in names}
+        for term in terms:
+            changes[(term, "product")] = (term, 0)
+        changes.update(product_terms(
+            Product.objects.annotate(term=Trim(Lower("name"))).filter(
+                term__in=terms, is_available=True
+            )
+        ))
+    if categories_dirty:
+        cache.delete(CATEGORIES_DIRTY_KEY)
+        for key in index.entries:
+            if key[1] == "category":
+                changes[key] = (key[0], 0)
+        changes.update(category_terms())
+
+    index = index.updated(changes, version=time.time_ns())
+    publish(index)
+    logger.info(f"Suggestion index refreshed: {len(changes)} terms updated")
+    return index
+
+
+def get_index(rebuild_if_missing=True):
+    """
+    Process-local index, reloaded from the shared cache when its version moves.
+
+    The version check is throttled to once per MARKETPLACE_SUGGEST_SYNC_INTERVAL
+    seconds, so a keystroke normally touches no shared state at all.
+    """
+    global _local_index, _last_checked
+
+    now = time.monotonic()
+    interval = getattr(settings, "MARKETPLACE_SUGGEST_SYNC_INTERVAL", 5)
+    if _local_index is not None and now - _last_checked < interval:
+        return _local_index
+    _last_checked = now
+
+    version = cache.get(VERSION_KEY)
+    if _local_index is not None and version == _local_index.version:
+        return _local_index
+
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is not None:
+        _local_index = SuggestionIndex(snapshot[1], version=snapshot[0])
+    elif rebuild_if_missing:
+        _local_index = rebuild_index()
+    return _local_index
+
+
+def mark_product_changed(product):
+    pending_names.push(product.name)
+
+
+def mark_categories_changed():
+    cache.set(CATEGORIES_DIRTY_KEY, True, None)
@@ -11,31 +11,199 @@ def process_order_notification(order_id):
     """
     Sends an order confirmation email to the buyer.
     """
+    from .emails import send_orders
     try:
-        order = Order.objects.get(pk=order_id)
-        subject = f"Your Order #{order.id} Confirmation"
-        message = f"Thank you for your order! Here are the details:\n\n{order}"  # Customize this
-        recipient_list = [order.buyer.email]
-
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
+        send_orders([order_id])
         logger.info(f"Order notification sent successfully for order ID: {order_id}")
-    except Order.DoesNotExist:
-        logger.error(f"Order with ID {order_id} not found.")
     except Exception as e:
         logger.error(f"Error sending order notification for order ID {order_id}: {e}")
 
+@shared_task
+def process_order_notifications(order_ids):
+    """
+    Sends order confirmation emails for a batch of orders over one connection.
+    """
+    from .emails import send_orders
+    try:
+        sent = send_orders(order_ids)
+        logger.info(f"Order notifications sent for {sent} orders")
+    except Exception as e:
+        logger.error(f"Error sending order notifications for orders {order_ids}: {e}")
+
+@shared_task
+def send_order_emails():
+    """
+    Sends pending order emails over one reused SMTP connection, committing
+    each chunk as it goes.
+    """
+    from .emails import send_pending
+    try:
+        send_pending()
+    except Exception as e:
+        logger.error(f"Error sending order emails: {e}")
+
+@shared_task
+def send_order_email_digests():
+    """
+    Sends each user one digest of their pending low-priority order updates.
+    """
+    from .emails import send_digests
+    try:
+        send_digests()
+    except Exception as e:
+        logger.error(f"Error sending order email digests: {e}")
+
 @shared_task
 def update_inventory_after_purchase(product_id, quantity):
     """
-    Updates the inventory of a product after a purchase.
+    Queues a purchase's stock decrement for the next inventory batch.
+    """
+    from .inventory import queue_adjustment
+    try:
+        queue_adjustment(product_id, -quantity)
+    except Exception as e:
+        logger.error(f"Error queueing inventory update for product ID {product_id}: {e}")
+
+@shared_task
+def apply_inventory_adjustments():
+    """
+    Applies queued stock adjustments in coalesced batches.
+    """
+    from .inventory import apply_adjustments
+    try:
+        apply_adjustments()
+    except Exception as e:
+        logger.error(f"Error applying inventory adjustments: {e}")
+
+@shared_task
+def refresh_suggestion_index():
+    """
+    Applies product saves queued since the last run to the autocomplete index.
+    """
+    from . import suggest
+    try:
+        suggest.refresh_index()
+    except Exception as e:
+        logger.error(f"Error refreshing suggestion index: {e}")
+
+@shared_task
+def rebuild_suggestion_index():
+    """
+    Rebuilds the autocomplete index from scratch (drops terms left by renames).
+    """
+    from . import suggest
+    try:
+        suggest.rebuild_index()
+    except Exception as e:
+        logger.error(f"Error rebuilding suggestion index: {e}")
+
+
+@shared_task
+def refresh_popularity_scores():
+    """
+    Recomputes Product.popularity_score from views, recent orders and reviews.
+    """
+    from .popularity import refresh_popularity_scores as refresh
+    from .search_cache import bump_version
+    try:
+        if refresh():
+            bump_version()
+    except Exception as e:
+        logger.error(f"Error refreshing popularity scores: {e}")
+
+
+@shared_task
+def flush_product_views():
+    """
+    Writes buffered product views to ProductView and Product.views.
+    """
+    from . import view_counter
+    try:
+        view_counter.flush()
+    except Exception as e:
+        logger.error(f"Error flushing product views: {e}")
+
+
+@shared_task
+def rollup_product_views():
+    """
+    Folds new ProductView rows into the ProductViewDaily rollup.
+    """
+    from . import rollups
+    try:
+        rollups.rollup_product_views()
+    except Exception as e:
+        logger.error(f"Error rolling up product views: {e}")
+
+
+@shared_task
+def prune_product_views():
+    """
+    Deletes rolled-up ProductView rows past the retention window.
+    """
+    from . import rollups
+    try:
+        rollups.prune_product_views()
+    except Exception as e:
+        logger.error(f"Error pruning product views: {e}")
+
+
+@shared_task
+def refresh_trending_products():
+    """
+    Recomputes the time-decayed trending rankings and republishes them.
+    """
+    from .trending import refresh_trending
+    try:
+        refresh_trending()
+    except Exception as e:
+        logger.error(f"Error refreshing trending products: {e}")
+
+
+@shared_task
+def release_expired_reservations():
+    """
+    Cancels pending orders past reserved_until and returns their stock.
+    """
+    from .reservations import release_expired_reservations as release
+    try:
+        release()
+    except Exception as e:
+        logger.error(f"Error releasing expired reservations: {e}")
+
+
+@shared_task
+def dispatch_outbox():
+    """
+    Fans pending outbox events out to notifications and event streams.
+    Their emails are sent by send_order_emails/send_order_email_digests.
+    """
+    from . import outbox
+    try:
+        outbox.dispatch()
+    except Exception as e:
+        logger.error(f"Error dispatching outbox events: {e}")
+
+
+@shared_task
+def prune_outbox():
+    """
+    Deletes dispatched outbox events past the retention window.
+    """
+    from . import outbox
+    try:
+        outbox.prune()
+    except Exception as e:
+        logger.error(f"Error pruning outbox events: {e}")
+
+
+@shared_task
+def compact_stock_shards():
+    """
+    Rebalances sharded products' stock and refreshes their availability.
     """
-    from .models import Product  # Changed import to relative path
+    from .inventory import compact
     try:
-        product = Product.objects.get(pk=product_id)
-        product.stock -= quantity
-        product.save()
-        logger.info(f"Inventory updated for product ID {product_id}. New stock: {product.stock}")
-    except Product.DoesNotExist:
-        logger.error(f"Product with ID {product_id} not found.")
+        compact()
     except Exception as e:
-        logger.error(f"Error updating inventory for product ID {product_id}: {e}")
\ No newline at end of file
+        logger.error(f"Error compacting stock shards: {e}")
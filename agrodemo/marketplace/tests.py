@@ -1,3 +1,915 @@
-from django.test import TestCase
+import os
+import smtplib
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.db import connection, connections
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import emails, idempotency, inventory, outbox, view_counter
+from .cache_utils import CacheQueue, incr
+from .models import (
+    Category, Notification, Order, OutboxEvent, Product, ProductView, StockMovement, StockShard,
+)
+from .pagination import paginate_by_cursor
+from .reservations import release_expired_reservations
+from .search_backends import bm25
+from .search_backends.bm25 import BM25Index, BM25SearchBackend, document_terms
+from .serializers import ProductSerializer
+
+User = get_user_model()
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def make_products(seller, *stocks):
+    """One product per stock level, all sold by seller."""
+    category, _ = Category.objects.get_or_create(name="Produce", slug="produce")
+    return Product.objects.bulk_create([
+        Product(seller=seller, category=category, name=f"Produce {i}",
+                slug=f"{seller.username}-produce-{i}", description="", price=10, stock=stock)
+        for i, stock in enumerate(stocks)
+    ])
+
+
+@skipUnless(connection.vendor == "postgresql", "query plans are PostgreSQL-specific")
+class OrderParticipantQueryPlanTests(TestCase):
+    """Order listing must read the participant indexes, not scan and sort."""
+
+    SELLERS = 20
+    BUYERS = 180
+    ORDERS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(username=f"user{i}") for i in range(cls.SELLERS + cls.BUYERS)]
+        )
+        cls.sellers, cls.buyers = users[:cls.SELLERS], users[cls.SELLERS:]
+        category = Category.objects.create(name="Vegetables", slug="vegetables")
+        products = Product.objects.bulk_create([
+            Product(seller=seller, category=category, name=f"Produce {i}",
+                    slug=f"produce-{i}", description="", price=10, stock=1000)
+            for i, seller in enumerate(cls.sellers)
+        ])
+        statuses = [value for value, _ in Order.STATUS_CHOICES]
+        Order.objects.bulk_create([
+            Order(buyer=cls.buyers[i % cls.BUYERS], seller_id=products[i % cls.SELLERS].seller_id,
+                  product=products[i % cls.SELLERS], quantity=1, total_price=10,
+                  status=statuses[i % len(statuses)])
+            for i in range(cls.ORDERS)
+        ], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE marketplace_order")
+
+    def assertUsesParticipantIndexes(self, queryset):
+        plan = queryset.explain()
+        self.assertIn("order_buyer_recent_idx", plan)
+        self.assertIn("order_seller_recent_idx", plan)
+        self.assertNotIn("Seq Scan on marketplace_order", plan)
+
+    def test_status_filtered_listing_uses_indexes(self):
+        self.assertUsesParticipantIndexes(
+            Order.for_participant(self.buyers[0], status="pending", limit=10)
+        )
+
+    def test_unfiltered_listing_uses_indexes(self):
+        self.assertUsesParticipantIndexes(Order.for_participant(self.sellers[0], limit=10))
+
+    def test_union_matches_or_query(self):
+        user = self.sellers[0]
+        expected = list(
+            Order.objects.filter(Q(buyer=user) | Q(seller=user))
+            .order_by("-created_at", "-id").values_list("id", flat=True)[:25]
+        )
+        actual = [order.id for order in Order.for_participant(user, limit=25)]
+        self.assertEqual(actual, expected)
+
+
+class OrderParticipantListingTests(TestCase):
+    """for_participant() lists both sides of a user's orders in a stable order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other, cls.third = User.objects.bulk_create(
+            [User(username=name) for name in ("grower", "buyer", "bystander")]
+        )
+        category = Category.objects.create(name="Vegetables", slug="vegetables")
+        own, theirs = Product.objects.bulk_create([
+            Product(seller=seller, category=category, name=f"Produce {i}",
+                    slug=f"produce-{i}", description="", price=10, stock=100)
+            for i, seller in enumerate((cls.user, cls.other))
+        ])
+        orders = Order.objects.bulk_create(
+            [Order(buyer=cls.other, seller=cls.user, product=own, quantity=1, total_price=10)
+             for _ in range(7)]
+            + [Order(buyer=cls.user, seller=cls.other, product=theirs, quantity=1, total_price=10)
+               for _ in range(6)]
+            + [Order(buyer=cls.third, seller=cls.other, product=theirs, quantity=1, total_price=10)
+               for _ in range(3)]
+        )
+        # Every row ties on created_at, so only the id tiebreaker orders them
+        Order.objects.update(created_at=orders[0].created_at)
+        cls.expected = sorted((order.id for order in orders[:13]), reverse=True)
+
+    def test_lists_bought_and_sold_orders(self):
+        self.assertEqual([order.id for order in Order.for_participant(self.user)], self.expected)
+        self.assertEqual(
+            [order.id for order in Order.for_participant(self.user, limit=5)], self.expected[:5]
+        )
+
+    def test_offset_pages_neither_skip_nor_repeat(self):
+        page_size = 4
+        seen = []
+        for offset in range(0, len(self.expected), page_size):
+            page = Order.for_participant(self.user, limit=offset + page_size)[offset:offset + page_size]
+            seen.extend(order.id for order in page)
+        self.assertEqual(seen, self.expected)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_list_endpoint_reads_page_in_one_query(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("marketplace:order-list")
+        client.get(url)  # caches the total
+        with self.assertNumQueries(1):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [order["id"] for order in response.data["results"]],
+            self.expected[:len(response.data["results"])],
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "full-text ranking is PostgreSQL-specific")
+class SearchCursorTests(TestCase):
+    """Cursor pages over tied ranks must neither skip nor repeat products."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create(username="grower")
+        category = Category.objects.create(name="Vegetables", slug="vegetables")
+        Product.objects.bulk_create([
+            Product(seller=seller, category=category, name="Red tomato",
+                    slug=f"red-tomato-{i}", description="Fresh tomato", price=10, stock=10)
+            for i in range(10)
+        ])
+        # Identical text and timestamps: only the id breaks ties
+        Product.objects.update(created_at=Product.objects.first().created_at)
+
+    def page_through(self, page_size):
+        seen, cursor = [], ""
+        for _ in range(20):
+            items, cursor = paginate_by_cursor(Product.search("tomato"), cursor, page_size)
+            seen.extend(product.id for product in items)
+            if cursor is None:
+                return seen
+        self.fail("cursor pagination did not terminate")
+
+    def assertPagesCoverResults(self):
+        expected = list(Product.search("tomato").values_list("id", flat=True))
+        self.assertEqual(len(expected), 10)
+        self.assertEqual(self.page_through(3), expected)
+
+    @override_settings(MARKETPLACE_POPULARITY_WEIGHT=0)
+    def test_tied_ranks_without_popularity(self):
+        self.assertPagesCoverResults()
+
+    def test_tied_ranks_with_popularity(self):
+        self.assertPagesCoverResults()
+
+
+class OrderEmailBatchTests(TestCase):
+    """Pending order emails go out in one batch over one connection (locmem backend)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller", email="seller@example.com")
+        cls.buyer = User.objects.create(username="buyer", email="buyer@example.com")
+        category = Category.objects.create(name="Fruit", slug="fruit")
+        product, = Product.objects.bulk_create([
+            Product(seller=cls.seller, category=category, name="Mango",
+                    slug="mango", description="", price=10, stock=100)
+        ])
+        cls.orders = Order.objects.bulk_create([
+            Order(buyer=cls.buyer, seller=cls.seller, product=product,
+                  quantity=1, total_price=10, status="pending")
+            for _ in range(3)
+        ])
+
+    def record(self, event_type):
+        outbox.record_many(event_type, [
+            outbox.order_payload(order.id, self.buyer.id, self.seller.id, "Mango")
+            for order in self.orders
+        ])
+
+    def test_pending_emails_share_one_connection(self):
+        self.record(outbox.ORDER_CREATED)
+
+        with mock.patch.object(emails, "get_connection", wraps=emails.get_connection) as opened:
+            self.assertEqual(emails.send_pending(), 3)
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboxEvent.objects.exclude(email_status=OutboxEvent.EMAIL_SENT).exists())
+        self.assertEqual(emails.send_pending(), 0)
+
+    @override_settings(MARKETPLACE_EMAIL_BATCH=2)
+    def test_failed_chunk_keeps_earlier_chunks_sent(self):
+        self.record(outbox.ORDER_CREATED)
+        last = f"Your Order #{self.orders[-1].id} Confirmation"
+        send = locmem.EmailBackend.send_messages
+
+        def drop_last(backend, messages):
+            if any(message.subject == last for message in messages):
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            return send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", drop_last), \
+                mock.patch.object(locmem.EmailBackend, "open", side_effect=[None, OSError("SMTP down")]):
+            with self.assertRaises(OSError):
+                emails.send_pending()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by("id").values_list("email_status", "email_attempts")),
+            [(OutboxEvent.EMAIL_SENT, 0), (OutboxEvent.EMAIL_SENT, 0), (OutboxEvent.EMAIL_PENDING, 1)],
+        )
+
+        self.assertEqual(emails.send_pending(), 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(MARKETPLACE_EMAIL_MAX_ATTEMPTS=2)
+    def test_refused_email_is_given_up_without_blocking_others(self):
+        self.record(outbox.ORDER_CREATED)
+        refused = User.objects.create(username="refused", email="refused@example.com")
+        order = Order.objects.create(buyer=refused, seller=self.seller, product=self.orders[0].product,
+                                     quantity=1, total_price=10)
+        event = outbox.record(outbox.ORDER_CREATED,
+                              outbox.order_payload(order.id, refused.id, self.seller.id, "Mango"))
+        send = locmem.EmailBackend.send_messages
+
+        def refuse(backend, messages):
+            if any(refused.email in message.to for message in messages):
+                raise smtplib.SMTPRecipientsRefused({refused.email: (550, b"No such user")})
+            return send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", refuse):
+            self.assertEqual(emails.send_pending(), 3)
+            event.refresh_from_db()
+            self.assertEqual((event.email_status, event.email_attempts), (OutboxEvent.EMAIL_PENDING, 1))
+
+            self.assertEqual(emails.send_pending(), 0)
+            event.refresh_from_db()
+            self.assertEqual((event.email_status, event.email_attempts), (OutboxEvent.EMAIL_FAILED, 2))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(emails.send_pending(), 0)
+
+    @override_settings(MARKETPLACE_EMAIL_DIGEST=True)
+    def test_digest_rolls_updates_into_one_email_per_user(self):
+        self.record(outbox.ORDER_CONFIRMED)
+
+        self.assertEqual(emails.send_digests(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["buyer@example.com"])
+        for order in self.orders:
+            self.assertIn(f"order #{order.id} for Mango has been confirmed", mail.outbox[0].body)
+
+
+@skipUnless(connection.vendor == "postgresql", "row lock conflicts are PostgreSQL-specific")
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Overlapping carts checked out at the same moment must both go through."""
+
+    def setUp(self):
+        seller = User.objects.create(username="seller")
+        self.buyers = [User.objects.create(username=f"buyer{i}") for i in range(2)]
+        category = Category.objects.create(name="Vegetables", slug="vegetables")
+        self.products = Product.objects.bulk_create([
+            Product(seller=seller, category=category, name=f"Produce {i}",
+                    slug=f"produce-{i}", description="", price=10, stock=10)
+            for i in range(3)
+        ])
+
+    def test_overlapping_carts_both_succeed(self):
+        # Both transactions wait here after inserting their orders (which
+        # KEY SHARE-locks the products) and before locking stock.
+        barrier = threading.Barrier(2, timeout=10)
+        reserve = Product.reserve_stock_bulk.__func__
+
+        def paused_reserve(cls, *args, **kwargs):
+            barrier.wait()
+            return reserve(cls, *args, **kwargs)
+
+        first, shared, last = self.products
+        carts = [[first, shared], [last, shared]]
+        responses = [None, None]
+
+        def checkout(index):
+            try:
+                client = APIClient()
+                client.force_authenticate(self.buyers[index])
+                responses[index] = client.post(
+                    reverse("marketplace:order-checkout"),
+                    {"items": [{"product_id": p.id, "quantity": 1} for p in carts[index]]},
+                    format="json",
+                )
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(Product, "reserve_stock_bulk", classmethod(paused_reserve)):
+            threads = [threading.Thread(target=checkout, args=(i,)) for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        shared.refresh_from_db()
+        self.assertEqual(shared.stock, 8)
+        self.assertEqual(Order.objects.count(), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CacheQueueTests(TestCase):
+    """A missing slot holds the queue only while its push may still be in flight."""
+
+    def setUp(self):
+        cache.clear()
+        self.queue = CacheQueue("test_queue")
+        self.queue.push("a")
+        # A producer that claimed a sequence number but hasn't written (or crashed)
+        self.hole = incr(self.queue.tail_key)
+        self.queue.push("c")
+
+    def test_in_flight_push_is_waited_for(self):
+        self.assertEqual(self.queue.drain(), ["a"])
+        cache.set(self.queue._item_key(self.hole), "b")
+        self.assertEqual(self.queue.drain(), ["b", "c"])
+
+    def test_hole_near_tail_is_skipped_once_settled(self):
+        with mock.patch("marketplace.cache_utils.time.time", return_value=1000.0) as clock:
+            self.assertEqual(self.queue.drain(), ["a"])
+            self.assertEqual(self.queue.drain(), [])
+            clock.return_value += CacheQueue.IN_FLIGHT_TIMEOUT
+            self.assertEqual(self.queue.drain(), ["c"])
+        self.assertEqual(len(self.queue), 0)
+
+
+class BM25SearchTests(TestCase):
+    """In-process BM25 search: ranking, and updates shared through the update log."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "search_index.bm25")
+
+    def documents(self):
+        return [
+            (1, *document_terms("Red tomatoes", "Vine ripened", "Vegetables")),
+            (2, *document_terms("Pasta sauce", "Made with tomato", "Pantry")),
+            (3, *document_terms("Green apple", "Crisp", "Fruit")),
+        ]
+
+    def test_name_match_outranks_description_match(self):
+        index = BM25Index(self.path)
+        index.replace_all(self.documents())
+        scores = index.search("tomato")
+        self.assertEqual(set(scores), {1, 2})
+        self.assertGreater(scores[1], scores[2])
+        self.assertEqual(index.search("the"), {})
+
+    def test_unflushed_updates_reach_other_processes_and_survive_restart(self):
+        writer = BM25Index(self.path)
+        writer.replace_all(self.documents())
+        reader = BM25Index(self.path)
+
+        writer.upsert(4, *document_terms("Cherry tomatoes", "", "Vegetables"))
+        writer.delete(1)
+        reader.maybe_reload(interval=0)
+        self.assertEqual(set(reader.search("tomato")), {2, 4})
+
+        del writer  # never flushed, as if killed
+        self.assertEqual(set(BM25Index(self.path).search("tomato")), {2, 4})
+
+    def test_flush_merges_every_process_updates(self):
+        first = BM25Index(self.path, flush_every=2)
+        first.replace_all(self.documents())
+        second = BM25Index(self.path)
+
+        second.upsert(4, *document_terms("Cherry tomatoes", "", "Vegetables"))
+        first.upsert(5, *document_terms("Tomato seedlings", "", "Plants"))
+        self.assertEqual(os.path.getsize(first.log_path), 0)
+        self.assertEqual(set(first.segment.doc_len), {1, 2, 3, 4, 5})
+
+        second.maybe_reload(interval=0)
+        self.assertEqual(set(second.search("tomato")), {1, 2, 4, 5})
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_backend_ranks_products_and_indexes_only_committed_saves(self):
+        seller = User.objects.create(username="grower")
+        vegetables = Category.objects.create(name="Vegetables", slug="vegetables")
+        pantry = Category.objects.create(name="Pantry", slug="pantry")
+        sauce, tomatoes = Product.objects.bulk_create([
+            Product(seller=seller, category=pantry, name="Pasta sauce", slug="pasta-sauce",
+                    description="Made with tomato", price=5, stock=10),
+            Product(seller=seller, category=vegetables, name="Red tomatoes", slug="red-tomatoes",
+                    description="Vine ripened", price=3, stock=10),
+        ])
+        with mock.patch.object(bm25.atexit, "register"):
+            backend = BM25SearchBackend(index_path=self.path)
+        results = backend.search(Product.objects.all(), "tomatoes")
+        self.assertEqual([product.pk for product in results], [tomatoes.pk, sauce.pk])
+
+        cherry = Product.objects.create(seller=seller, category=vegetables, name="Cherry tomatoes",
+                                        slug="cherry-tomatoes", description="", price=4, stock=10)
+        with self.captureOnCommitCallbacks() as callbacks:
+            backend.product_saved(cherry)
+        self.assertNotIn(cherry.pk, backend.index.search("cherry"))
+        for callback in callbacks:
+            callback()
+        self.assertIn(cherry.pk, backend.index.search("cherry"))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CheckoutTests(TestCase):
+    """A checkout orders every line of the cart or none of them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.buyer = User.objects.create(username="buyer")
+        cls.products = make_products(cls.seller, 5, 1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def checkout(self, *quantities):
+        return self.client.post(reverse("marketplace:order-checkout"), {"items": [
+            {"product_id": product.id, "quantity": quantity}
+            for product, quantity in zip(self.products, quantities)
+        ]}, format="json")
+
+    def test_orders_every_line_and_reserves_stock(self):
+        response = self.checkout(2, 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["orders"]), 2)
+        self.assertEqual(response.data["total_price"], "30.00")
+
+        orders = {order.product_id: order for order in Order.objects.filter(buyer=self.buyer)}
+        self.assertEqual(set(orders), {product.id for product in self.products})
+        self.assertTrue(all(order.reserved_until for order in orders.values()))
+        stock = dict(Product.objects.values_list("id", "stock"))
+        self.assertEqual([stock[product.id] for product in self.products], [3, 0])
+        self.assertFalse(Product.objects.get(id=self.products[1].id).is_available)
+        self.assertEqual(
+            set(StockMovement.objects.filter(kind="reserve").values_list("product_id", "order_id")),
+            {(pk, order.id) for pk, order in orders.items()},
+        )
+
+    def test_short_line_orders_nothing(self):
+        response = self.checkout(2, 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            sorted(Product.objects.values_list("stock", flat=True)), [1, 5]
+        )
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_line_lost_to_a_concurrent_order_rolls_back_the_rest(self):
+        # Passes the stock pre-check but is gone by the time it is reserved
+        reserve = Product.reserve_stock_bulk.__func__
+
+        def drained(cls, quantities, order_ids=None):
+            Product.objects.filter(id=self.products[1].id).update(stock=0)
+            return reserve(cls, quantities, order_ids)
+
+        with mock.patch.object(Product, "reserve_stock_bulk", classmethod(drained)):
+            response = self.checkout(2, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class IdempotencyKeyTests(TestCase):
+    """Retries with the same Idempotency-Key replay the first response."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.buyer = User.objects.create(username="buyer")
+        cls.product, = make_products(cls.seller, 5)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def checkout(self, quantity, key="retry-1"):
+        return self.client.post(
+            reverse("marketplace:order-checkout"),
+            {"items": [{"product_id": self.product.id, "quantity": quantity}]},
+            format="json", HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_without_ordering_again(self):
+        first = self.checkout(2)
+        retry = self.checkout(2)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry[idempotency.REPLAY_HEADER], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 3)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.checkout(2)
+        response = self.checkout(1)
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn(idempotency.REPLAY_HEADER, response)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 3)
+
+    def test_retry_while_first_request_runs_conflicts(self):
+        body = {"items": [{"product_id": self.product.id, "quantity": 2}]}
+        key = idempotency._cache_key(
+            SimpleNamespace(user=self.buyer), SimpleNamespace(__name__="checkout"), {}, "retry-1"
+        )
+        cache.set(key, {
+            "fingerprint": idempotency._fingerprint(SimpleNamespace(data=body)),
+            "in_progress": True,
+        })
+        self.assertEqual(self.checkout(2).status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(MARKETPLACE_IDEMPOTENCY_ERROR_TTL=0)
+    def test_rejected_request_can_be_retried_once_its_replay_expires(self):
+        self.assertEqual(self.checkout(6).status_code, 400)
+        Product.objects.filter(id=self.product.id).update(stock=10)
+        self.assertEqual(self.checkout(6).status_code, 201)
+
+
+class BulkTransitionTests(TestCase):
+    """A seller's bulk status change reports an outcome per order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.other_seller = User.objects.create(username="other-seller")
+        cls.buyer = User.objects.create(username="buyer")
+        cls.product, = make_products(cls.seller, 5)
+        cls.other_product, = make_products(cls.other_seller, 5)
+        cls.pending, cls.confirmed, cls.delivered, cls.foreign = Order.objects.bulk_create([
+            Order(buyer=cls.buyer, seller=cls.seller, product=cls.product,
+                  quantity=2, total_price=20, status="pending"),
+            Order(buyer=cls.buyer, seller=cls.seller, product=cls.product,
+                  quantity=1, total_price=10, status="confirmed"),
+            Order(buyer=cls.buyer, seller=cls.seller, product=cls.product,
+                  quantity=1, total_price=10, status="delivered"),
+            Order(buyer=cls.buyer, seller=cls.other_seller, product=cls.other_product,
+                  quantity=1, total_price=10, status="pending"),
+        ])
+
+    def test_reports_each_outcome(self):
+        missing = self.foreign.id + 1000
+        outcomes = Order.bulk_transition(
+            self.seller,
+            [self.pending.id, self.confirmed.id, self.delivered.id, self.foreign.id, missing],
+            "confirmed",
+        )
+        self.assertEqual(outcomes, {
+            self.pending.id: "updated",
+            self.confirmed.id: "invalid_transition",
+            self.delivered.id: "invalid_transition",
+            self.foreign.id: "not_found",
+            missing: "not_found",
+        })
+        statuses = dict(Order.objects.values_list("id", "status"))
+        self.assertEqual(statuses[self.pending.id], "confirmed")
+        self.assertEqual(statuses[self.foreign.id], "pending")
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list("event_type", "payload__order_id")),
+            [(outbox.ORDER_CONFIRMED, self.pending.id)],
+        )
+
+    def test_cancel_returns_stock_and_queues_reason(self):
+        outcomes = Order.bulk_transition(
+            self.seller, [self.pending.id, self.confirmed.id, self.delivered.id],
+            "cancelled", reason="Out of season",
+        )
+        self.assertEqual(
+            sorted(pk for pk, outcome in outcomes.items() if outcome == "updated"),
+            [self.pending.id, self.confirmed.id],
+        )
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 8)
+        self.assertEqual(Product.objects.get(id=self.other_product.id).stock, 5)
+        self.assertEqual(
+            set(StockMovement.objects.values_list("kind", "order_id", "quantity")),
+            {("release", self.pending.id, 2), ("release", self.confirmed.id, 1)},
+        )
+        events = OutboxEvent.objects.filter(event_type=outbox.ORDER_CANCELLED)
+        self.assertEqual(
+            sorted((event.payload["order_id"], event.payload["reason"]) for event in events),
+            [(self.pending.id, "Out of season"), (self.confirmed.id, "Out of season")],
+        )
+
+    def test_nothing_of_the_sellers_changes_nothing(self):
+        outcomes = Order.bulk_transition(self.seller, [self.foreign.id], "cancelled")
+        self.assertEqual(outcomes, {self.foreign.id: "not_found"})
+        self.assertEqual(Order.objects.get(id=self.foreign.id).status, "pending")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class ReservationReaperTests(TestCase):
+    """Pending orders past their reservation give their stock back."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.buyer = User.objects.create(username="buyer")
+        cls.products = make_products(cls.seller, 0, 0)
+        now = timezone.now()
+        expired, live = now - timedelta(minutes=5), now + timedelta(hours=1)
+        cls.expired = Order.objects.bulk_create([
+            Order(buyer=cls.buyer, seller=cls.seller, product=product, quantity=2,
+                  total_price=20, status="pending", reserved_until=expired)
+            for product in cls.products for _ in range(3)
+        ])
+        cls.live = Order.objects.create(
+            buyer=cls.buyer, seller=cls.seller, product=cls.products[0], quantity=1,
+            total_price=10, status="pending", reserved_until=live,
+        )
+        Product.objects.filter(id__in=[product.id for product in cls.products]).update(
+            is_available=False
+        )
+
+    def test_expires_in_batches_and_returns_stock(self):
+        self.assertEqual(release_expired_reservations(batch_size=4), 6)
+
+        statuses = dict(Order.objects.values_list("id", "status"))
+        self.assertTrue(all(statuses[order.id] == "cancelled" for order in self.expired))
+        self.assertEqual(statuses[self.live.id], "pending")
+        self.assertEqual(
+            list(Product.objects.order_by("id").values_list("stock", "is_available")),
+            [(6, True), (6, True)],
+        )
+        self.assertEqual(
+            sorted(OutboxEvent.objects.filter(event_type=outbox.ORDER_EXPIRED)
+                   .values_list("payload__order_id", flat=True)),
+            sorted(order.id for order in self.expired),
+        )
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_max_batches_leaves_the_rest_for_the_next_run(self):
+        self.assertEqual(release_expired_reservations(batch_size=4, max_batches=1), 4)
+        self.assertEqual(Order.objects.filter(status="pending").count(), 3)
+        self.assertEqual(release_expired_reservations(batch_size=4), 2)
+
+    def test_scoped_to_product_ids(self):
+        first, second = self.products
+        self.assertEqual(release_expired_reservations(product_ids=[first.id]), 3)
+        self.assertEqual(
+            Order.objects.filter(product=second, status="pending").count(), 3
+        )
+        self.assertEqual(Product.objects.get(id=second.id).stock, 0)
+        self.assertEqual(release_expired_reservations(product_ids=[]), 0)
+
+
+class OutboxDispatchTests(TestCase):
+    """Dispatching turns queued order events into notifications exactly once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.buyer = User.objects.create(username="buyer")
+        product, = make_products(cls.seller, 10)
+        cls.orders = Order.objects.bulk_create([
+            Order(buyer=cls.buyer, seller=cls.seller, product=product,
+                  quantity=1, total_price=10, status="pending")
+            for _ in range(3)
+        ])
+
+    def setUp(self):
+        outbox.record_many(outbox.ORDER_CREATED, [
+            outbox.order_payload(order.id, self.buyer.id, self.seller.id, "Produce 0")
+            for order in self.orders
+        ])
+        outbox.record(outbox.ORDER_CANCELLED, outbox.order_payload(
+            self.orders[0].id, self.buyer.id, self.seller.id, "Produce 0", reason="Sold out"
+        ))
+
+    def test_notifies_recipients_and_marks_events_processed(self):
+        self.assertEqual(outbox.dispatch(batch_size=3), 4)
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+
+        notifications = Notification.objects.order_by("id")
+        self.assertEqual(
+            [(n.recipient_id, n.type, n.reference_id) for n in notifications],
+            [(self.seller.id, outbox.ORDER_CREATED, order.id) for order in self.orders]
+            + [(self.buyer.id, outbox.ORDER_CANCELLED, self.orders[0].id)],
+        )
+        self.assertEqual(
+            notifications.last().message,
+            f"Order #{self.orders[0].id} has been cancelled: Sold out",
+        )
+
+    def test_processed_events_are_not_dispatched_again(self):
+        outbox.dispatch()
+        self.assertEqual(outbox.dispatch(), 0)
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_unknown_event_is_skipped_but_processed(self):
+        OutboxEvent.objects.create(event_type="order.refunded", payload={})
+        self.assertEqual(outbox.dispatch(), 5)
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+class StockShardTests(TestCase):
+    """A sharded product's stock is taken from and returned to its shards."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.buyer = User.objects.create(username="buyer")
+        cls.product, cls.plain = make_products(cls.seller, 10, 4)
+        cls.orders = Order.objects.bulk_create([
+            Order(buyer=cls.buyer, seller=cls.seller, product=product,
+                  quantity=2, total_price=20, status="pending")
+            for product in (cls.product, cls.product, cls.plain)
+        ])
+
+    def setUp(self):
+        inventory.set_shards(self.product.id, 3)
+
+    def available(self):
+        return inventory.available_stock([self.product.id])[self.product.id]
+
+    def test_split_keeps_the_remainder_on_the_product_row(self):
+        self.assertEqual(
+            list(StockShard.objects.filter(product=self.product).values_list("stock", flat=True)),
+            [Decimal("3.33")] * 3,
+        )
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, Decimal("0.01"))
+        self.assertEqual(self.available(), 10)
+
+        inventory.set_shards(self.product.id, 0)
+        self.assertFalse(StockShard.objects.exists())
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 10)
+
+    def test_reserve_takes_from_shards(self):
+        self.assertEqual(Product.reserve_stock(self.product.id, 2, order_id=self.orders[0].id),
+                         Decimal("1.33"))
+        movement = StockMovement.objects.get()
+        self.assertIsNotNone(movement.shard)
+        self.assertEqual((movement.kind, movement.order_id, movement.quantity),
+                         ("reserve", self.orders[0].id, -2))
+
+        # No shard holds 5 alone, so several are drawn down
+        self.assertIsNotNone(Product.reserve_stock(self.product.id, 5))
+        self.assertEqual(self.available(), 3)
+        self.assertIsNone(Product.reserve_stock(self.product.id, 4))
+        self.assertEqual(self.available(), 3)
+
+    def test_release_bulk_credits_shards_with_order_ids(self):
+        Product.release_stock_bulk(
+            (order.id, order.product_id, 2) for order in self.orders
+        )
+        self.assertEqual(self.available(), 14)
+        # Only the unsharded product is credited on its row
+        self.assertEqual(
+            list(Product.objects.order_by("id").values_list("stock", flat=True)),
+            [Decimal("0.01"), 6],
+        )
+        released = StockMovement.objects.filter(kind="release").values_list("order_id", "shard")
+        self.assertEqual(
+            {order_id: shard is not None for order_id, shard in released},
+            {self.orders[0].id: True, self.orders[1].id: True, self.orders[2].id: False},
+        )
+
+    def test_serializer_uses_prefetched_shards(self):
+        products = list(Product.objects.select_related("category", "seller")
+                        .prefetch_related("images", "shards").order_by("id"))
+        with self.assertNumQueries(0):
+            data = ProductSerializer(products, many=True).data
+        self.assertEqual([Decimal(row["stock"]) for row in data], [10, 4])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class InventoryAdjustmentTests(TestCase):
+    """Queued stock adjustments are coalesced per product and applied in batches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.products = make_products(cls.seller, 10, 10, 2)
+
+    def setUp(self):
+        cache.clear()
+
+    def stocks(self):
+        return list(Product.objects.order_by("id").values_list("stock", "is_available"))
+
+    def test_coalesces_each_batch_to_one_movement_per_product(self):
+        first, second, third = self.products
+        for product_id, delta in [(first.id, 5), (second.id, 1), (first.id, -2),
+                                  (second.id, -1), (third.id, -2)]:
+            inventory.queue_adjustment(product_id, delta)
+
+        self.assertEqual(inventory.apply_adjustments(batch_size=10), 5)
+        self.assertEqual(self.stocks(), [(13, True), (10, True), (0, False)])
+        # second's deltas cancel out, so it isn't touched
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list("product_id", "kind", "quantity")),
+            [(first.id, "adjust", 3), (third.id, "adjust", -2)],
+        )
+        self.assertEqual(inventory.adjustments.drain(), [])
+
+    def test_applies_every_batch(self):
+        first = self.products[0]
+        for _ in range(5):
+            inventory.queue_adjustment(first.id, "1.5")
+
+        self.assertEqual(inventory.apply_adjustments(batch_size=2), 5)
+        self.assertEqual(Product.objects.get(id=first.id).stock, Decimal("17.5"))
+        self.assertEqual(StockMovement.objects.filter(kind="adjust").count(), 3)
+
+    def test_concurrent_run_leaves_the_queue_alone(self):
+        inventory.queue_adjustment(self.products[0].id, 1)
+        cache.add(inventory.ADJUST_LOCK_KEY, True)
+        self.assertEqual(inventory.apply_adjustments(), 0)
+        cache.delete(inventory.ADJUST_LOCK_KEY)
+        self.assertEqual(inventory.apply_adjustments(), 1)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 11)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ViewCounterTests(TestCase):
+    """Buffered product views reach the database only when flushed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username="seller")
+        cls.viewer = User.objects.create(username="viewer")
+        cls.products = make_products(cls.seller, 1, 1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_flush_writes_every_batch_and_clears_pending(self):
+        first, second = self.products
+        self.assertEqual(
+            [view_counter.record_view(first.id, self.viewer.id),
+             view_counter.record_view(first.id),
+             view_counter.record_view(second.id, self.viewer.id),
+             view_counter.record_view(first.id, self.viewer.id)],
+            [1, 2, 1, 3],
+        )
+        self.assertFalse(ProductView.objects.exists())
+
+        self.assertEqual(view_counter.flush(batch_size=3), 4)
+        self.assertEqual(
+            list(Product.objects.order_by("id").values_list("views", flat=True)), [3, 1]
+        )
+        self.assertEqual(
+            sorted(ProductView.objects.values_list("product_id", "user_id"),
+                   key=lambda row: (row[0], row[1] or 0)),
+            [(first.id, None), (first.id, self.viewer.id), (first.id, self.viewer.id),
+             (second.id, self.viewer.id)],
+        )
+        self.assertEqual(
+            [view_counter.pending_views(first.id), view_counter.pending_views(second.id)], [0, 0]
+        )
+        self.assertEqual(view_counter.flush(), 0)
+
+    def test_views_of_deleted_rows_are_dropped(self):
+        product = self.products[0]
+        gone = User.objects.create(username="gone")
+        view_counter.record_view(product.id, gone.id)
+        view_counter.record_view(self.products[1].id)
+        gone.delete()
+        Product.objects.filter(id=self.products[1].id).delete()
+
+        self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(
+            list(ProductView.objects.values_list("product_id", "user_id")), [(product.id, None)]
+        )
+        self.assertEqual(Product.objects.get(id=product.id).views, 1)
+
+    def test_concurrent_flush_leaves_the_backlog(self):
+        view_counter.record_view(self.products[0].id)
+        cache.add(view_counter.LOCK_KEY, True)
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.pending_views(self.products[0].id), 1)
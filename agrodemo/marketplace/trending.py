@@ -0,0 +1,152 @@
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Category, Product, TrendingProduct
+
+logger = logging.getLogger(__name__)
+
+ALL = "all"
+CACHE_KEY = "trending_products_{}"
+
+# Each view or order contributes weight * exp(-decay * age_seconds), so a
+# signal loses half its value every half-life. Ranked overall and within each
+# category in one pass; only rows that make either top K come back.
+SCORE_SQL = """
+    WITH events AS (
+        SELECT product_id,
+               %(view_weight)s * EXP(-%(decay)s * EXTRACT(EPOCH FROM (%(now)s - viewed_at))) AS w
+        FROM marketplace_productview
+        WHERE viewed_at >= %(since)s
+        UNION ALL
+        SELECT product_id,
+               %(order_weight)s * EXP(-%(decay)s * EXTRACT(EPOCH FROM (%(now)s - created_at)))
+        FROM marketplace_order
+        WHERE created_at >= %(since)s AND status <> 'cancelled'
+    ),
+    scored AS (
+        SELECT e.product_id, p.category_id, SUM(e.w) AS score
+        FROM events e
+        JOIN marketplace_product p ON p.id = e.product_id
+        WHERE p.is_available
+        GROUP BY e.product_id, p.category_id
+    ),
+    ranked AS (
+        SELECT product_id, category_id, score,
+               ROW_NUMBER() OVER (ORDER BY score DESC, product_id DESC) AS overall_pos,
+               ROW_NUMBER() OVER (PARTITION BY category_id ORDER BY score DESC, product_id DESC) AS category_pos
+        FROM scored
+    )
+    SELECT product_id, category_id, score, overall_pos, category_pos
+    FROM ranked
+    WHERE overall_pos <= %(top_k)s OR category_pos <= %(top_k)s
+"""
+
+
+def refresh_trending():
+    """
+    Recompute trending rankings and publish them to the table and the cache.
+
+    The cache holds the serialized response for each scope ("all" and every
+    category slug), so the endpoint does a single cache read.
+    """
+    from .serializers import ProductSerializer
+
+    top_k = getattr(settings, "MARKETPLACE_TRENDING_TOP_K", 20)
+    half_life = getattr(settings, "MARKETPLACE_TRENDING_HALF_LIFE_HOURS", 24) * 3600
+    window = getattr(settings, "MARKETPLACE_TRENDING_WINDOW_DAYS", 7)
+    now = timezone.now()
+
+    started = time.monotonic()
+    with connection.cursor() as cursor:
+        cursor.execute(SCORE_SQL, {
+            "view_weight": 1.0,
+            "order_weight": float(getattr(settings, "MARKETPLACE_TRENDING_ORDER_WEIGHT", 5.0)),
+            "decay": math.log(2) / half_life,
+            "now": now,
+            "since": now - timedelta(days=window),
+            "top_k": top_k,
+        })
+        rows = cursor.fetchall()
+
+    rankings = {}
+    for product_id, category_id, score, overall_pos, category_pos in rows:
+        if overall_pos <= top_k:
+            rankings.setdefault(None, []).append((overall_pos, product_id, score))
+        if category_pos <= top_k:
+            rankings.setdefault(category_id, []).append((category_pos, product_id, score))
+
+    entries = [
+        TrendingProduct(category_id=category_id, product_id=product_id,
+                        position=position, score=score, computed_at=now)
+        for category_id, ranked in rankings.items()
+        for position, product_id, score in ranked
+    ]
+    with transaction.atomic():
+        TrendingProduct.objects.all().delete()
+        TrendingProduct.objects.bulk_create(entries)
+
+    products = Product.objects.select_related("category", "seller").prefetch_related(
+        "images", "shards"
+    ).in_bulk({entry.product_id for entry in entries})
+    serialized = {pk: ProductSerializer(product).data for pk, product in products.items()}
+
+    # Every category gets an entry, so one that dropped out is emptied too.
+    payloads = {}
+    for category_id, slug in [(None, ALL)] + list(Category.objects.values_list("id", "slug")):
+        ranked = sorted(rankings.get(category_id, []))
+        payloads[CACHE_KEY.format(slug)] = _payload(
+            [(serialized[pk], score) for _, pk, score in ranked if pk in serialized], now
+        )
+    cache.set_many(payloads, None)
+
+    logger.info(
+        f"Trending refreshed: {len(entries)} entries across {len(rankings)} scopes "
+        f"in {time.monotonic() - started:.2f}s"
+    )
+    return len(entries)
+
+
+def get_trending(category_slug=None):
+    """
+    Return the published ranking for a scope, rebuilding its cache entry from
+    the table on a miss. Returns None for an unknown category slug, which is
+    never cached.
+    """
+    slug = category_slug or ALL
+    payload = cache.get(CACHE_KEY.format(slug))
+    if payload is not None:
+        return payload
+    if category_slug and not Category.objects.filter(slug=category_slug).exists():
+        return None
+
+    from .serializers import ProductSerializer
+
+    entries = TrendingProduct.objects.select_related(
+        "product__category", "product__seller"
+    ).prefetch_related("product__images", "product__shards").order_by("position")
+    if category_slug:
+        entries = entries.filter(category__slug=category_slug)
+    else:
+        entries = entries.filter(category__isnull=True)
+    entries = list(entries)
+
+    payload = _payload(
+        [(ProductSerializer(entry.product).data, entry.score) for entry in entries],
+        entries[0].computed_at if entries else None,
+    )
+    cache.set(CACHE_KEY.format(slug), payload, None)
+    return payload
+
+
+def _payload(ranked, computed_at):
+    return {
+        "computed_at": computed_at.isoformat() if computed_at else None,
+        "results": [{**data, "trending_score": round(score, 4)} for data, score in ranked],
+    }
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views 
+from . import stream, views
 from .views import ProductSearchView
 
 app_name = 'marketplace'
@@ -12,6 +12,7 @@ router = DefaultRouter()
 router.register(r'products', views.ProductViewSet, basename='product')
 router.register(r'orders', views.OrderViewSet, basename='order')
 router.register(r'categories', views.CategoryViewSet, basename='category')
+router.register(r'notifications', views.NotificationViewSet, basename='notification')
 # router.register(r'search', views.ProductSearchView ,basename='search')
 
 # URL patterns
@@ -19,6 +20,11 @@ urlpatterns = [
     # Include router URLs
     path('', include(router.urls)),
     path('search/', ProductSearchView.as_view(), name='search'),
+    path('search/suggest/', views.SearchSuggestView.as_view(), name='search_suggest'),
+    path('search/cache-stats/', views.SearchCacheStatsView.as_view(), name='search_cache_stats'),
+    path('product-views/stats/', views.ProductViewStatsView.as_view(), name='product_view_stats'),
+    # Server-sent events; needs the ASGI application (agrodemo.asgi)
+    path('events/', stream.event_stream, name='event_stream'),
 #     Product-related custom endpoints
     path('my-products/',
          views.ProductViewSet.as_view({'get': 'my_products'}),
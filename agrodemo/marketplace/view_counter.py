@@ -0,0 +1,156 @@
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .cache_utils import CacheQueue, incr
+from .models import Product, ProductView
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# (product_id, user_id, unix timestamp) per detail view, waiting to be flushed.
+events = CacheQueue("product_view_events")
+
+PENDING_KEY = "product_views_pending_{}"
+LOCK_KEY = "product_views_flush_lock"
+LOCK_TIMEOUT = 300
+STATS_KEY = "product_views_flush_stats"
+
+# SQLite also accepts this form (3.33+), so it isn't Postgres-specific.
+BATCH_UPDATE_SQL = """
+    WITH v(id, n) AS (VALUES {values})
+    UPDATE marketplace_product
+    SET views = marketplace_product.views + v.n
+    FROM v
+    WHERE marketplace_product.id = v.id
+"""
+
+
+def record_view(product_id, user_id=None):
+    """
+    Buffer one product view in the cache; no database writes.
+
+    Returns the number of views recorded for the product that haven't been
+    flushed yet, so callers can show an up-to-date count.
+    """
+    events.push((product_id, user_id, time.time()))
+    return incr(PENDING_KEY.format(product_id))
+
+
+def pending_views(product_id):
+    return cache.get(PENDING_KEY.format(product_id)) or 0
+
+
+def flush(batch_size=None):
+    """
+    Write buffered views to the database, batch_size at a time, until the
+    backlog is drained.
+
+    Each batch is one bulk_create for the ProductView rows and one
+    UPDATE ... FROM (VALUES) for the counters, in a single transaction.
+    Only one flush runs at a time. Returns the number of views written.
+    """
+    batch_size = batch_size or getattr(settings, "MARKETPLACE_VIEW_FLUSH_BATCH", 5000)
+    if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        logger.info("Product view flush already running")
+        return 0
+
+    started = time.monotonic()
+    flushed = 0
+    products = set()
+    try:
+        while True:
+            batch = events.drain(batch_size)
+            if not batch:
+                break
+            try:
+                _write(batch)
+            except Exception:
+                # Put the events back so the next run retries them.
+                for event in batch:
+                    events.push(event)
+                raise
+
+            # Still under the lock, so a concurrent flush can't decrement twice
+            counts = {}
+            for product_id, user_id, viewed_at in batch:
+                counts[product_id] = counts.get(product_id, 0) + 1
+            for product_id, count in counts.items():
+                try:
+                    cache.decr(PENDING_KEY.format(product_id), count)
+                except ValueError:
+                    pass  # Counter was evicted; nothing to reconcile
+            flushed += len(batch)
+            products.update(counts)
+
+            # Stop well before the lock expires; the next run picks up the rest
+            if len(batch) < batch_size or time.monotonic() - started > LOCK_TIMEOUT / 2:
+                break
+    finally:
+        cache.delete(LOCK_KEY)
+
+    elapsed = time.monotonic() - started
+    cache.set(STATS_KEY, {
+        "last_flush_at": time.time(),
+        "last_flush_rows": flushed,
+        "last_flush_seconds": round(elapsed, 3),
+    }, None)
+    if flushed:
+        logger.info(f"Flushed {flushed} product views for {len(products)} products in {elapsed:.2f}s")
+    return flushed
+
+
+def _write(batch):
+    product_ids = {event[0] for event in batch}
+    user_ids = {event[1] for event in batch if event[1] is not None}
+
+    # Products or users deleted since the view was recorded are skipped.
+    live_products = set(
+        Product.objects.filter(id__in=product_ids).values_list("id", flat=True)
+    )
+    live_users = set(
+        User.objects.filter(id__in=user_ids).values_list("id", flat=True)
+    ) if user_ids else set()
+
+    rows = []
+    counts = {}
+    for product_id, user_id, viewed_at in batch:
+        if product_id not in live_products:
+            continue
+        rows.append(ProductView(
+            product_id=product_id,
+            user_id=user_id if user_id in live_users else None,
+            viewed_at=datetime.fromtimestamp(viewed_at, tz=dt_timezone.utc),
+        ))
+        counts[product_id] = counts.get(product_id, 0) + 1
+
+    if not rows:
+        return
+
+    # Sorted so concurrent writers always lock product rows in the same order.
+    ordered = sorted(counts.items())
+    values = ", ".join(["(%s, %s)"] * len(ordered))
+    params = [value for pair in ordered for value in pair]
+
+    with transaction.atomic():
+        ProductView.objects.bulk_create(rows, batch_size=1000)
+        with connection.cursor() as cursor:
+            cursor.execute(BATCH_UPDATE_SQL.format(values=values), params)
+
+
+def get_stats():
+    stats = cache.get(STATS_KEY) or {}
+    last_flush_at = stats.get("last_flush_at")
+    return {
+        "backlog": len(events),
+        "flush_interval": getattr(settings, "MARKETPLACE_VIEW_FLUSH_INTERVAL", 30),
+        "last_flush_rows": stats.get("last_flush_rows"),
+        "last_flush_seconds": stats.get("last_flush_seconds"),
+        "seconds_since_last_flush": round(time.time() - last_flush_at, 1) if last_flush_at else None,
+    }
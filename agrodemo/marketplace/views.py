@@ -1,14 +1,14 @@
 from rest_framework import status, viewsets
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db.models import Q, F
 from django.db import transaction
 from django.core.cache import cache
 
-# from django.conf import settings
+from django.conf import settings
 from .models import Product, Category, ProductImage, Order, ProductView, Notification
 from .serializers import (
     ProductSerializer,
@@ -16,8 +16,15 @@ from .serializers import (
     OrderSerializer,
     UserSerializer,
     ProductImageSerializer,
+    NotificationSerializer,
 )
 from .permissions import IsSellerOrReadOnly, IsOrderParticipant
+from .pagination import paginate_by_cursor, EstimatedCountPagination, EstimatedCountPaginator
+from .facets import parse_facets, get_facets
+from .idempotency import idempotent
+from .reservations import reservation_deadline
+from . import inventory, notifications, outbox, search_cache, suggest, view_counter
+from .trending import get_trending
 import logging
 import os
 from dotenv import load_dotenv
@@ -60,6 +67,8 @@ class ProductSearchView(APIView):
             try:
                 page = int(page)
                 page_size = int(page_size)
+                if page_size <= 0:
+                    raise ValueError("page_size must be positive")
                 if min_price:
                     float(min_price)
                 if max_price:
@@ -80,41 +89,107 @@ class ProductSearchView(APIView):
             if max_price:
                 filters["max_price"] = float(max_price)
 
-            # Perform search
-            try:
-                products = Product.search(query, filters)
-            except Exception as e:
-                logger.error(f"Search error: {str(e)}")
+            sort = request.query_params.get("sort", "relevance")
+            if sort not in ("relevance", "popular"):
                 return Response(
-                    {"message": "Error performing search"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    {"message": "sort must be 'relevance' or 'popular'"},
+                    status=status.HTTP_400_BAD_REQUEST,
                     content_type="application/json",
                 )
+            if sort == "popular":
+                filters["sort"] = sort
 
-            # Paginate results
-            paginator = Paginator(products, page_size)
+            try:
+                facets = parse_facets(request.query_params.get("facets", ""))
+            except ValueError as e:
+                return Response(
+                    {"message": str(e)},
+                    status=status.HTTP_400_BAD_REQUEST,
+                    content_type="application/json",
+                )
 
             try:
-                page_obj = paginator.page(page)
+                facet_data = get_facets(query, filters, facets) if facets else None
             except Exception as e:
-                logger.error(f"Pagination error: {str(e)}")
+                logger.error(f"Facet error: {str(e)}")
                 return Response(
-                    {"message": "Invalid page number"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"message": "Error performing search"},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     content_type="application/json",
                 )
 
+            # Cursor mode (?cursor= for the first page): seek-based, no COUNT(*)
+            cursor = request.query_params.get("cursor") if "cursor" in request.query_params else None
+
+            # Cached entries hold product IDs plus pagination metadata
+            cache_key = search_cache.result_key(
+                query, filters, page_size, page=page, cursor=cursor
+            )
+            cached = search_cache.get_results(cache_key)
+
+            if cached is not None:
+                items = self.load_products(cached["ids"])
+                meta = cached["meta"]
+            else:
+                # Perform search
+                try:
+                    products = Product.search(query, filters).select_related(
+                        "category", "seller"
+                    ).prefetch_related("images", "shards")
+                except Exception as e:
+                    logger.error(f"Search error: {str(e)}")
+                    return Response(
+                        {"message": "Error performing search"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        content_type="application/json",
+                    )
+
+                if cursor is not None:
+                    try:
+                        items, next_cursor = paginate_by_cursor(products, cursor, page_size)
+                    except ValueError as e:
+                        logger.warning(f"Cursor pagination error: {str(e)}")
+                        return Response(
+                            {"message": "Invalid cursor"},
+                            status=status.HTTP_400_BAD_REQUEST,
+                            content_type="application/json",
+                        )
+                    meta = {
+                        "next_cursor": next_cursor,
+                        "has_next": next_cursor is not None,
+                    }
+                else:
+                    # Paginate results
+                    paginator = EstimatedCountPaginator(products, page_size)
+
+                    try:
+                        page_obj = paginator.page(page)
+                    except Exception as e:
+                        logger.error(f"Pagination error: {str(e)}")
+                        return Response(
+                            {"message": "Invalid page number"},
+                            status=status.HTTP_400_BAD_REQUEST,
+                            content_type="application/json",
+                        )
+
+                    items = list(page_obj)
+                    meta = {
+                        "total": paginator.count,
+                        "total_is_approximate": paginator.count_is_approximate,
+                        "total_pages": paginator.num_pages,
+                        "current_page": page,
+                        "has_next": page_obj.has_next(),
+                        "has_previous": page_obj.has_previous(),
+                    }
+
+                search_cache.set_results(cache_key, [p.pk for p in items], meta)
+
             # Prepare response data
             try:
-                serializer = ProductSerializer(page_obj, many=True)
-                response_data = {
-                    "results": serializer.data,
-                    "total": paginator.count,
-                    "total_pages": paginator.num_pages,
-                    "current_page": page,
-                    "has_next": page_obj.has_next(),
-                    "has_previous": page_obj.has_previous(),
-                }
+                serializer = ProductSerializer(items, many=True)
+                response_data = {"results": serializer.data, **meta}
+                if facet_data is not None:
+                    response_data["facets"] = facet_data
             except Exception as e:
                 logger.error(f"Serialization error: {str(e)}")
                 return Response(
@@ -140,6 +215,116 @@ class ProductSearchView(APIView):
                 content_type="application/json",
             )
 
+    def load_products(self, ids):
+        """Fetch cached result IDs in one query, preserving their order."""
+        products = Product.objects.select_related("category", "seller").prefetch_related(
+            "images", "shards"
+        ).in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+class SearchSuggestView(APIView):
+    """Prefix autocomplete over product and category names."""
+
+    def get(self, request):
+        prefix = request.query_params.get("q", "")
+        try:
+            limit = int(request.query_params.get("limit", "8"))
+            if limit <= 0:
+                raise ValueError("limit must be positive")
+        except ValueError:
+            return Response(
+                {"message": "Invalid numeric parameter provided"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            suggestions = suggest.get_index().suggest(prefix, limit)
+        except Exception as e:
+            logger.error(f"Suggestion error: {str(e)}")
+            return Response(
+                {"message": "Error fetching suggestions"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return Response({"suggestions": suggestions})
+
+class SearchCacheStatsView(APIView):
+    """Search result cache hit/miss counters, for tuning MARKETPLACE_SEARCH_CACHE_TTL."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(search_cache.get_stats())
+
+    def delete(self, request):
+        search_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ProductViewStatsView(APIView):
+    """Backlog and flush lag of the buffered product view counter."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(view_counter.get_stats())
+
+class NotificationViewSet(viewsets.GenericViewSet):
+    """
+    The signed-in user's notifications, newest first.
+
+    Pages are keyset-paginated on (timestamp, id): pass ?cursor= for the first
+    page and the returned next_cursor for each following one.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user).order_by("-timestamp", "-id")
+
+    def list(self, request):
+        try:
+            page_size = min(int(request.query_params.get("page_size", 20)), 100)
+            if page_size <= 0:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset()
+        if request.query_params.get("unread") == "true":
+            queryset = queryset.filter(is_read=False)
+        try:
+            items, next_cursor = paginate_by_cursor(
+                queryset, request.query_params.get("cursor"), page_size, field="timestamp"
+            )
+        except ValueError as e:
+            logger.warning(f"Notification cursor error: {str(e)}")
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "results": self.get_serializer(items, many=True).data,
+            "next_cursor": next_cursor,
+            "has_next": next_cursor is not None,
+            "unread_count": notifications.unread_count(request.user.id),
+        })
+
+    @action(detail=False, methods=["get"], url_path="unread-count")
+    def unread_count(self, request):
+        # Served from the cache; see notifications.UNREAD_KEY
+        return Response({"unread_count": notifications.unread_count(request.user.id)})
+
+    @action(detail=False, methods=["post"], url_path="mark-read")
+    def mark_read(self, request):
+        ids = request.data.get("ids")
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response({"error": "ids must be a list of notification IDs"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        changed = notifications.mark_read(request.user.id, ids)
+        return Response({"marked_read": changed})
+
+    @action(detail=False, methods=["post"], url_path="mark-all-read")
+    def mark_all_read(self, request):
+        changed = notifications.mark_all_read(request.user.id)
+        logger.info(f"User {request.user.id} marked {changed} notifications read")
+        return Response({"marked_read": changed})
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def test_image_upload(request):
@@ -166,7 +351,7 @@ def test_image_upload(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(EstimatedCountPagination):
     # ... (rest of StandardResultsSetPagination remains the same)
     page_size = 10
     page_size_query_param = "page_size"
@@ -188,7 +373,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = Product.objects.select_related(
             "category", "seller"
-        ).prefetch_related("images")
+        ).prefetch_related("images", "shards")
 
         if self.action == "list":
             # Only filter for available products in list view
@@ -238,7 +423,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
             # Base queryset with optimization
             queryset = Product.objects.select_related('category', 'seller')\
-                                    .prefetch_related('images')\
+                                    .prefetch_related('images', 'shards')\
                                     .filter(is_available=True)
 
             # Apply search filters
@@ -295,20 +480,18 @@ class ProductViewSet(viewsets.ModelViewSet):
         return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
-        # ... (rest of retrieve method remains the same)
         instance = self.get_object()
 
-        # Track view in a transaction
-        with transaction.atomic():
-            ProductView.objects.create(
-                product=instance,
-                user=request.user if request.user.is_authenticated else None,
-            )
-            instance.views = F("views") + 1
-            instance.save(update_fields=["views"])
+        # Views are buffered in the cache and written by flush_product_views
+        pending = view_counter.record_view(
+            instance.pk,
+            request.user.pk if request.user.is_authenticated else None,
+        )
 
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        data = serializer.data
+        data["views"] = instance.views + pending
+        return Response(data)
 
     @transaction.atomic
     def perform_create(self, serializer):
@@ -369,6 +552,35 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=False, methods=["get"])
+    def trending(self, request):
+        """Precomputed trending products, overall or for ?category=<slug>."""
+        try:
+            limit = int(request.query_params.get("limit", "20"))
+            if limit <= 0:
+                raise ValueError("limit must be positive")
+        except ValueError:
+            return Response(
+                {"message": "Invalid numeric parameter provided"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        payload = get_trending(request.query_params.get("category"))
+        if payload is None:
+            return Response(
+                {"error": "Category not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        results = payload["results"][:limit]
+        # Serialized without a request, so image URLs are still relative
+        for product in results:
+            product["images"] = [
+                {**image, "image": request.build_absolute_uri(image["image"])}
+                if image.get("image") else image
+                for image in product["images"]
+            ]
+        return Response({"computed_at": payload["computed_at"], "results": results})
+
 class OrderViewSet(viewsets.ModelViewSet):
     # ... (rest of OrderViewSet remains the same)
     serializer_class = OrderSerializer
@@ -385,8 +597,27 @@ class OrderViewSet(viewsets.ModelViewSet):
         if status_filter:
             queryset = queryset.filter(status=status_filter)
 
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        # The OR queryset only feeds the (cached/estimated) count; the page
+        # itself is read with a per-branch-limited UNION.
+        status_filter = request.query_params.get('status')
+        orders = self.paginator.paginate_slices(
+            self.get_queryset(),
+            lambda offset, limit: Order.for_participant(
+                request.user, status_filter, limit=offset + limit
+            )[offset:offset + limit],
+            request,
+        )
+        if orders is None:
+            orders = Order.for_participant(request.user, status_filter)
+            return Response(self.get_serializer(orders, many=True).data)
+
+        serializer = self.get_serializer(orders, many=True)
+        return self.get_paginated_response(serializer.data)
 
+    @idempotent
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         # ... (rest of create action remains the same)
@@ -397,14 +628,14 @@ class OrderViewSet(viewsets.ModelViewSet):
             print(product_id)
             logger.info(f"Attempting to create order for product ID: {product_id}")
             logger.info(f"Request data: {request.data}")
-            # Validate product existence and access
+            # Validate product existence and access. No row lock here: stock
+            # is taken by a conditional UPDATE just before commit.
             try:
-                product = Product.objects.select_for_update().get(
+                product = Product.objects.select_related("seller").get(
                     id=product_id,
                     is_available=True
                 )
                 logger.info(f"Product found: {product.id}, is_available: {product.is_available}")
-                # ... rest of your create logic
             except Product.DoesNotExist:
                 logger.warning(f"Product with ID {product_id} not found or unavailable.")
                 return Response(
@@ -424,8 +655,12 @@ class OrderViewSet(viewsets.ModelViewSet):
             if request.user == product.seller:
                 raise ValidationError("Cannot order your own product")
 
-            if quantity > product.stock:
-                raise ValidationError(f"Only {product.stock} units available")
+            # Fail fast on a stale read; the UPDATE below is authoritative
+            available = product.stock
+            if product.stock_shards:
+                available = inventory.available_stock([product.id])[product.id]
+            if quantity > available:
+                raise ValidationError(f"Only {available} units available")
 
             # Check if user has pending orders for this product
             existing_pending_order = Order.objects.filter(
@@ -433,33 +668,33 @@ class OrderViewSet(viewsets.ModelViewSet):
                 product=product,
                 status__in=['pending', 'processing']
             ).exists()
-            print(existing_pending_order)
             if existing_pending_order:
                 raise ValidationError("You already have a pending order for this product")
 
-            # Create order with proper calculations
-            total_price = quantity * product.price
-            order = Order.objects.create(
-                buyer=request.user,
-                seller=product.seller,
-                product=product,
-                quantity=quantity,
-                total_price=total_price,
-                status='pending'
-            )
-            # Update product stock
-            product.stock -= quantity
-            if product.stock == 0:
-                product.is_available = False
-            product.save()
-
-            # Create notifications
-            Notification.objects.create(
-                recipient=product.seller,
-                message=f"New order #{order.id} received for {product.name}",
-                type='new_order',
-                reference_id=order.id
-            )
+            # Savepoint so a failed reservation also rolls back the inserts
+            with transaction.atomic():
+                # Create order with proper calculations
+                total_price = quantity * product.price
+                order = Order.objects.create(
+                    buyer=request.user,
+                    seller=product.seller,
+                    product=product,
+                    quantity=quantity,
+                    total_price=total_price,
+                    status='pending',
+                    reserved_until=reservation_deadline()
+                )
+
+                # Seller notification and buyer email go through the outbox
+                outbox.record(outbox.ORDER_CREATED, outbox.order_payload(
+                    order.id, request.user.id, product.seller_id, product.name
+                ))
+
+                # Reserve stock last so the product row is locked only
+                # from this statement until commit
+                if Product.reserve_stock(product.id, quantity, order_id=order.id) is None:
+                    available = inventory.available_stock([product.id])[product.id]
+                    raise ValidationError(f"Only {available} units available")
 
             # Send order confirmation email (commented out as email service isn't shown)
             # self.send_order_confirmation_email(order)
@@ -489,6 +724,165 @@ class OrderViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
+    @action(detail=False, methods=["post"])
+    @idempotent
+    def checkout(self, request):
+        """
+        Place orders for several products in one transaction.
+
+        Body: {"items": [{"product_id": 1, "quantity": 2}, ...]}. Either every
+        line is ordered or none is.
+        """
+        try:
+            items = request.data.get("items")
+            max_items = getattr(settings, "MARKETPLACE_CHECKOUT_MAX_ITEMS", 50)
+            if not isinstance(items, list) or not items:
+                raise ValidationError("items must be a non-empty list")
+            if len(items) > max_items:
+                raise ValidationError(f"A checkout may contain at most {max_items} items")
+
+            # Repeated products are merged into one line
+            quantities = {}
+            try:
+                for item in items:
+                    product_id = int(item["product_id"])
+                    quantity = int(item.get("quantity", 1))
+                    if quantity <= 0:
+                        raise ValidationError("Quantity must be positive")
+                    quantities[product_id] = quantities.get(product_id, 0) + quantity
+            except (TypeError, ValueError, KeyError, AttributeError):
+                raise ValidationError("Each item needs an integer product_id and quantity")
+
+            products = Product.objects.select_related("seller").filter(
+                is_available=True
+            ).in_bulk(list(quantities))
+            missing = sorted(set(quantities) - set(products))
+            if missing:
+                return Response(
+                    {"error": "Products not found or unavailable", "product_ids": missing},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            if any(product.seller_id == request.user.id for product in products.values()):
+                raise ValidationError("Cannot order your own product")
+
+            available = {pk: product.stock for pk, product in products.items()}
+            sharded = [pk for pk, product in products.items() if product.stock_shards]
+            if sharded:
+                available.update(inventory.available_stock(sharded))
+            short = sorted(pk for pk, quantity in quantities.items() if quantity > available[pk])
+            if short:
+                raise ValidationError(f"Insufficient stock for products {short}")
+
+            pending = sorted(Order.objects.filter(
+                buyer=request.user,
+                product_id__in=list(quantities),
+                status__in=['pending', 'processing']
+            ).values_list("product_id", flat=True))
+            if pending:
+                raise ValidationError(f"You already have pending orders for products {pending}")
+
+            reserved_until = reservation_deadline()
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([
+                    Order(
+                        buyer=request.user,
+                        seller=products[pk].seller,
+                        product=products[pk],
+                        quantity=quantity,
+                        total_price=quantity * products[pk].price,
+                        status='pending',
+                        reserved_until=reserved_until
+                    )
+                    for pk, quantity in sorted(quantities.items())
+                ])
+
+                outbox.record_many(outbox.ORDER_CREATED, [
+                    outbox.order_payload(
+                        order.id, request.user.id, order.seller_id, order.product.name
+                    )
+                    for order in orders
+                ])
+
+                # Stock last, so product rows are locked only until commit
+                reserved = Product.reserve_stock_bulk(
+                    quantities, order_ids={order.product_id: order.id for order in orders}
+                )
+                if len(reserved) != len(quantities):
+                    short = sorted(set(quantities) - set(reserved))
+                    raise ValidationError(f"Insufficient stock for products {short}")
+
+            logger.info(f"Checkout by user {request.user.id} created {len(orders)} orders")
+            return Response(
+                {
+                    "orders": self.get_serializer(orders, many=True).data,
+                    "total_price": str(sum(order.total_price for order in orders)),
+                },
+                status=status.HTTP_201_CREATED
+            )
+
+        except ValidationError as e:
+            logger.warning(f"Validation error in checkout: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            logger.error(f"Error during checkout: {str(e)}", exc_info=True)
+            return Response(
+                {"error": "Failed to complete checkout"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=["post"], url_path="bulk-status")
+    @idempotent
+    def bulk_status(self, request):
+        """
+        Move many of the seller's orders to one status.
+
+        Body: {"order_ids": [...], "status": "confirmed", "reason": "..."}.
+        Each ID is reported as updated, not_found or invalid_transition.
+        """
+        try:
+            target = request.data.get("status")
+            if target not in Order.TRANSITIONS:
+                raise ValidationError(
+                    f"status must be one of: {', '.join(Order.TRANSITIONS)}"
+                )
+
+            order_ids = request.data.get("order_ids")
+            max_orders = getattr(settings, "MARKETPLACE_BULK_STATUS_MAX_ORDERS", 200)
+            if not isinstance(order_ids, list) or not order_ids:
+                raise ValidationError("order_ids must be a non-empty list")
+            if len(order_ids) > max_orders:
+                raise ValidationError(f"At most {max_orders} orders can be updated at once")
+            try:
+                order_ids = [int(pk) for pk in order_ids]
+            except (TypeError, ValueError):
+                raise ValidationError("order_ids must be integers")
+
+            outcomes = Order.bulk_transition(
+                request.user, order_ids, target, reason=request.data.get("reason")
+            )
+            updated = sum(1 for outcome in outcomes.values() if outcome == "updated")
+            logger.info(
+                f"Seller {request.user.id} moved {updated}/{len(outcomes)} orders to {target}"
+            )
+            return Response({
+                "status": target,
+                "updated": updated,
+                "results": [{"id": pk, "outcome": outcome} for pk, outcome in outcomes.items()],
+            })
+
+        except ValidationError as e:
+            logger.warning(f"Validation error in bulk status update: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            logger.error(f"Error in bulk status update: {str(e)}", exc_info=True)
+            return Response(
+                {"error": "Failed to update orders"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=["get"])
     def seller_orders(self, request):
         # ... (rest of seller_orders action remains the same)
@@ -498,6 +892,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["post"])
+    @idempotent
     def confirm(self, request, pk=None):
         # ... (rest of confirm action remains the same)
         try:
@@ -524,6 +919,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=True, methods=["post"])
+    @idempotent
     def cancel(self, request, pk=None):
         # ... (rest of cancel action remains the same)
         try:
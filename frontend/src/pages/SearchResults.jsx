@@ -8,13 +8,13 @@ const SearchResults = () => {
   const [results, setResults] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-  const [currentPage, setCurrentPage] = useState(1);
-  const [totalPages, setTotalPages] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const constructSearchParams = (searchParams) => {
     const params = {
       q: searchParams.get("q") || "",
-      page: searchParams.get("page") || "1",
+      cursor: "",
       page_size: "20",
     };
     if (searchParams.get("category"))
@@ -42,15 +42,14 @@ const SearchResults = () => {
         }
 
         setResults(data.results);
-        setTotalPages(data.total_pages);
-        setCurrentPage(data.current_page);
+        setNextCursor(data.next_cursor);
       } catch (err) {
         console.error("Search error:", err);
         setError(
           err.message || "An unexpected error occurred while fetching results"
         );
         setResults([]);
-        setTotalPages(0);
+        setNextCursor(null);
       } finally {
         setLoading(false);
       }
@@ -59,11 +58,23 @@ const SearchResults = () => {
     fetchResults();
   }, [searchParams]);
 
-  const handlePageChange = (newPage) => {
-    const currentParams = new URLSearchParams(searchParams);
-    currentParams.set("page", newPage.toString());
-    window.history.pushState({}, "", `?${currentParams.toString()}`);
-    setCurrentPage(newPage);
+  // Each extra page is a keyset seek on the server, so depth doesn't matter
+  const handleLoadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const params = { ...constructSearchParams(searchParams), cursor: nextCursor };
+      const data = await apiWrapper.searchProducts(params);
+      setResults((prev) => [...prev, ...data.results]);
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      console.error("Search error:", err);
+      setError(
+        err.message || "An unexpected error occurred while fetching results"
+      );
+    } finally {
+      setLoadingMore(false);
+    }
   };
 
   if (loading) {
@@ -132,26 +143,14 @@ const SearchResults = () => {
         ))}
       </div>
 
-      {totalPages > 1 && (
+      {nextCursor && (
         <div className="pagination">
           <button
-            onClick={() => handlePageChange(Math.max(1, currentPage - 1))}
-            disabled={currentPage === 1}
+            onClick={handleLoadMore}
+            disabled={loadingMore}
             className="pagination-btn"
           >
-            Previous
-          </button>
-          <span className="page-info">
-            Page {currentPage} of {totalPages}
-          </span>
-          <button
-            onClick={() =>
-              handlePageChange(Math.min(totalPages, currentPage + 1))
-            }
-            disabled={currentPage === totalPages}
-            className="pagination-btn"
-          >
-            Next
+            {loadingMore ? "Loading..." : "Load more"}
           </button>
         </div>
       )}